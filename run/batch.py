@@ -0,0 +1,237 @@
+"""
+Headless batch job that precomputes advice for every league of a list of Sleeper users: each user's highest projected and expert
+recommended starting lineups for the current week, and rest of season power rankings for every team in each league. Doesn't
+import Streamlit.
+
+Usage (from the project folder):
+  python run/batch.py USERNAME [USERNAME ...] --output advice.sqlite
+  python run/batch.py --usernames-file users.txt --processes 8 --output advice/   # a directory gets one Parquet file per table
+"""
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from data_functions import *
+from fantasy_pros_scraper import get_weekly_rankings, scrape_fantasy_pros
+
+
+# Leagues handed to a worker process at a time
+CHUNK_SIZE = 4
+
+TABLES = {
+    'lineups': ('username', 'league_id', 'league_name', 'season', 'week', 'kind', 'slot_index', 'slot', 'player_id', 'full_name', 'projected_points', 'ecr_ranking'),
+    'power_rankings': ('league_id', 'league_name', 'season', 'week', 'rank', 'roster_id', 'owner_id', 'wins', 'losses', 'ties', 'points_for', 'week_points', 'season_points'),
+    'errors': ('league_id', 'season', 'week', 'username', 'error'),
+}
+
+# Every table has these columns. A run replaces the rows a previous run wrote for the same league and week
+RUN_KEY = ('league_id', 'season', 'week')
+
+
+def find_leagues(usernames: list, season) -> dict:
+    """
+    Looks up every user and their leagues, with the requests for all users made at the same time
+
+    Returns:
+      league ID -> (league dictionary, list of (username, user_id) in that league)
+    """
+    users = sleeper.fetch_many([f'user/{username}' for username in usernames])
+    found = [(username, user['user_id']) for username, user in zip(usernames, users) if user]
+    for username, user in zip(usernames, users):
+        if not user:
+            print(f"Error: user {username} not found")
+
+    leagues = {}
+    for (username, user_id), user_leagues in zip(found, sleeper.fetch_many([f'user/{user_id}/leagues/nfl/{season}' for _, user_id in found])):
+        for league in user_leagues or []:
+            leagues.setdefault(league['league_id'], (league, []))[1].append((username, user_id))
+    return leagues
+
+
+def warm_shared_data(leagues: list, current_state: dict):
+    """
+    Downloads everything leagues have in common once, before the worker processes start: the player dump, the season's projections
+    and the rankings pages for each scoring format. All of it is stored on disk, where every worker reads it.
+    """
+    season, week = current_state['league_season'], current_state['week']
+    get_player_info()
+    end_week = max(get_end_week(league) or week for league in leagues)
+    # Downloaded now rather than refreshed in the background, so the workers read this week's copies
+    open_projection_store().prefetch('regular', season, range(week, end_week + 1), week)
+
+    positions_by_format = {}
+    for league in leagues:
+        try:
+            format = get_format(league['scoring_settings'].get('rec', 0))
+        except Exception:
+            # Scoring format not supported, the league's worker reports it
+            continue
+        positions_by_format.setdefault(format, set()).update(get_starting_positions_set(league))
+    for format, positions in positions_by_format.items():
+        get_weekly_rankings(positions, format, week)
+        scrape_fantasy_pros(position=None, format=format, ros="yes", week=week)
+
+
+def league_advice(league: dict, league_rosters: list, users: list, current_state: dict, database_file: str) -> dict:
+    """
+    Lineups for each user in a league and the league's power rankings. Player data, projections and rankings are read from the
+    on-disk stores warm_shared_data filled.
+
+    Returns:
+      dictionary of table name -> list of row tuples (see TABLES)
+    """
+    season, week = current_state['league_season'], current_state['week']
+    league_id, league_name = league['league_id'], league.get('name')
+    rows = {table: [] for table in TABLES}
+    if not league_rosters:
+        rows['errors'].append((league_id, season, week, None, 'rosters not available'))
+        return rows
+
+    player_data = get_player_info()
+    projections = get_week_projections('regular', season, week) or {}
+    format = get_format(league['scoring_settings'].get('rec', 0))
+    position_rankings = get_weekly_rankings(get_starting_positions_set(league), format, week)
+
+    for username, user_id in users:
+        user_roster = get_user_roster_info(league_rosters, user_id)
+        if user_roster is None:
+            rows['errors'].append((league_id, season, week, username, 'user has no roster in league'))
+            continue
+        players = get_user_roster_players(player_data, user_roster)
+
+        scored = calculate_projections(add_projections(players, projections), league['scoring_settings'])
+        for slot_index, player in enumerate(optimize_starters_projections(scored, league['roster_positions'])):
+            rows['lineups'].append((username, league_id, league_name, season, week, 'projected', slot_index, player['position'], player.get('player_id'), player.get('full_name'), player.get('projected_points'), None))
+
+        roster_with_rankings = add_weekly_rankings(players, position_rankings, database_file)
+        for slot_index, player in enumerate(optimize_starting_lineup_rankings(roster_with_rankings, league['roster_positions'])):
+            ranking = player.get(f"{player['starting_position'].lower()}_ecr_ranking")
+            rows['lineups'].append((username, league_id, league_name, season, week, 'expert', slot_index, player['starting_position'], player.get('player_id'), player.get('full_name'), None, ranking if ranking != 'unranked' else None))
+
+    for team in get_league_power_rankings(league_rosters, player_data, league, current_state):
+        rows['power_rankings'].append((league_id, league_name, season, week, team['rank'], team['roster_id'], team['owner_id'], team['wins'], team['losses'], team['ties'], round(team['points_for'], 2), team['week_points'], team['season_points']))
+    return rows
+
+
+def process_league(task: tuple) -> dict:
+    """
+    Worker process entry point. A league that fails is reported in the errors table instead of stopping the job.
+    """
+    league, league_rosters, users, current_state, database_file = task
+    try:
+        return league_advice(league, league_rosters, users, current_state, database_file)
+    except Exception as error:
+        print(f"Error: league {league['league_id']}: {error}")
+        return {'lineups': [], 'power_rankings': [], 'errors': [(league['league_id'], current_state['league_season'], current_state['week'], None, repr(error))]}
+
+
+def write_sqlite(path: str, rows: dict, runs: set, generated_at: str):
+    """
+    Replaces the rows for each (league_id, season, week) in runs with this run's rows, all in one transaction
+    """
+    connection = sqlite3.connect(path)
+    try:
+        for table, columns in TABLES.items():
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns + ('generated_at',))})")
+            connection.executemany(f"DELETE FROM {table} WHERE {' AND '.join(f'{column} = ?' for column in RUN_KEY)}", runs)
+            connection.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' for _ in range(len(columns) + 1))})", [row + (generated_at,) for row in rows[table]])
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def write_parquet(directory: str, rows: dict, runs: set, generated_at: str):
+    """
+    Same as write_sqlite for a directory with one Parquet file per table. Each file is written to a temporary file first and
+    then moved into place, so readers never see a half written one.
+    """
+    # Parquet needs pandas with pyarrow, which only this output format uses
+    import pandas as pd
+    os.makedirs(directory, exist_ok=True)
+    for table, columns in TABLES.items():
+        path = os.path.join(directory, f'{table}.parquet')
+        new_rows = pd.DataFrame([row + (generated_at,) for row in rows[table]], columns=list(columns) + ['generated_at'])
+        frames = [new_rows]
+        if os.path.exists(path):
+            existing = pd.read_parquet(path)
+            replaced = pd.MultiIndex.from_frame(existing[list(RUN_KEY)]).isin(list(runs))
+            frames.insert(0, existing[~replaced])
+        table_rows = pd.concat([frame for frame in frames if len(frame)] or [new_rows], ignore_index=True)
+
+        temporary_path = f'{path}.tmp'
+        table_rows.to_parquet(temporary_path, index=False)
+        os.replace(temporary_path, path)
+
+
+def run_batch(usernames: list, output: str, processes: int = None, database_file: str = "fantasy_names.db") -> dict:
+    """
+    Computes advice for every league of every user and writes it to output (a .sqlite/.db file, otherwise a directory of
+    Parquet files)
+
+    Returns:
+      number of rows written to each table
+    """
+    current_state = get_current_state('nfl')
+    if current_state is None:
+        print("Error: couldn't get the current NFL state")
+        return {}
+
+    leagues = find_leagues(usernames, current_state['league_season'])
+    if not leagues:
+        print("Error: no leagues found")
+        return {}
+    warm_shared_data([league for league, _ in leagues.values()], current_state)
+
+    # Rosters are fetched here, all at the same time, so the workers only compute
+    league_rosters = sleeper.fetch_many([f'league/{league_id}/rosters' for league_id in leagues])
+    tasks = [(league, rosters, users, current_state, database_file) for (league, users), rosters in zip(leagues.values(), league_rosters)]
+    rows = {table: [] for table in TABLES}
+    processes = processes or os.cpu_count() or 1
+    if processes > 1 and len(tasks) > 1:
+        # Fresh interpreters, so no worker inherits the parent's open connections
+        with ProcessPoolExecutor(max_workers=min(processes, len(tasks)), mp_context=get_context('spawn')) as executor:
+            results = executor.map(process_league, tasks, chunksize=CHUNK_SIZE)
+            for result in results:
+                for table in TABLES:
+                    rows[table].extend(result[table])
+    else:
+        for task in tasks:
+            result = process_league(task)
+            for table in TABLES:
+                rows[table].extend(result[table])
+
+    # Every league processed is replaced, including ones that only have errors this time
+    runs = {(league_id, current_state['league_season'], current_state['week']) for league_id in leagues}
+    generated_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    if output.endswith(('.sqlite', '.db')):
+        write_sqlite(output, rows, runs, generated_at)
+    else:
+        write_parquet(output, rows, runs, generated_at)
+    return {table: len(table_rows) for table, table_rows in rows.items()}
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('usernames', nargs='*', help='Sleeper usernames')
+    parser.add_argument('--usernames-file', help='file with one username per line')
+    parser.add_argument('--output', default='advice.sqlite', help='.sqlite/.db file, or a directory for Parquet files')
+    parser.add_argument('--processes', type=int, help='worker processes (defaults to the number of CPUs)')
+    parser.add_argument('--names-database', default='fantasy_names.db', help='Sleeper -> FantasyPros names table')
+    args = parser.parse_args(argv)
+
+    usernames = list(args.usernames)
+    if args.usernames_file:
+        with open(args.usernames_file) as usernames_file:
+            usernames.extend(line.strip() for line in usernames_file if line.strip())
+    if not usernames:
+        parser.error('no usernames given')
+
+    counts = run_batch(list(dict.fromkeys(usernames)), args.output, args.processes, args.names_database)
+    print(', '.join(f'{count} {table}' for table, count in counts.items()) or 'Nothing written', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
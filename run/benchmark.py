@@ -0,0 +1,456 @@
+"""
+Offline benchmarks for the data pipeline. Sleeper and FantasyPros responses are replayed from fixtures through a requests transport
+adapter mounted on the shared sessions, so no stage touches the network and results can be compared over time.
+
+Usage (from the project folder):
+  python run/benchmark.py                                  # synthetic leagues of 8, 12, 16, 24 and 32 teams
+  python run/benchmark.py --teams 12 32 --bench 12 --repeats 5 --output benchmark.json
+  python run/benchmark.py --save-fixtures fixtures/        # also write the synthetic fixtures out so they can be replayed later
+  python run/benchmark.py --fixtures fixtures/teams-12     # replay fixtures from a directory
+  python run/benchmark.py --record fixtures/mine --username NAME   # record live responses for a user's first league
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import shutil
+import sqlite3
+import argparse
+import platform
+import statistics
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# Everything the app stores while benchmarking goes to a scratch directory, never the real data folder. This has to be set
+# before the app's modules are imported, since storage.DATA_DIR is read at import time
+BENCHMARK_DATA_DIR = tempfile.mkdtemp(prefix='fantasy-benchmark-')
+os.environ['FANTASY_DATA_DIR'] = BENCHMARK_DATA_DIR
+atexit.register(shutil.rmtree, BENCHMARK_DATA_DIR, True)
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from data_functions import *
+from fantasy_pros_scraper import fantasy_pros, fantasy_pros_link, extract_ecr_players
+from player_index import PlayerIndex, refresh_player_index
+from lineup_optimizer import eligible_positions
+from cache import clear_keyed_caches
+
+
+LEAGUE_SIZES = (8, 12, 16, 24, 32)
+DEFAULT_BENCH = 10
+DEFAULT_REPEATS = 3
+
+# Sleeper's players/nfl dump has about this many players, most of them free agents
+DUMP_SIZE = 11000
+
+STARTERS = ['QB', 'RB', 'RB', 'WR', 'WR', 'TE', 'FLEX', 'K', 'DEF']
+SCORING_SETTINGS = {
+    'pass_yd': 0.04, 'pass_td': 4, 'pass_int': -2, 'rush_yd': 0.1, 'rush_td': 6, 'rec': 1, 'rec_yd': 0.1, 'rec_td': 6,
+    'fum_lost': -2, 'fgm': 3, 'xpm': 1, 'def_td': 6, 'int': 2, 'sack': 1, 'pts_allow_14_20': 1,
+}
+RANKING_POSITIONS = ('QB', 'RB', 'WR', 'TE', 'K', 'DEF', 'FLEX')
+
+
+class FixtureAdapter(BaseAdapter):
+    """
+    Transport adapter that answers every request from recorded responses instead of the network. URLs that weren't recorded
+    get a 404, so a missing fixture shows up the same way a failed request would.
+
+    Arguments:
+      - responses: URL -> response body (bytes)
+    """
+
+    def __init__(self, responses: dict):
+        super().__init__()
+        self.responses = responses
+        self.requests_served = 0
+
+    def send(self, request, **kwargs) -> requests.Response:
+        self.requests_served += 1
+        body = self.responses.get(request.url)
+        response = requests.Response()
+        response.status_code = 200 if body is not None else 404
+        response._content = body if body is not None else b'not in fixtures'
+        response.headers['Content-Type'] = 'application/json' if request.url.startswith(SLEEPER_BASE_URL) else 'text/html'
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        return response
+
+    def close(self):
+        pass
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Transport adapter that makes real requests and keeps the body of every successful response so it can be saved as fixtures
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.responses = {}
+
+    def send(self, request, **kwargs) -> requests.Response:
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            self.responses[request.url] = response.content
+        return response
+
+
+class Fixtures:
+    """
+    Recorded responses plus the manifest saying which league, season and week they are for
+
+    Arguments:
+      - manifest: dictionary with user_id, league_id, season and week
+      - responses: URL -> response body (bytes)
+    """
+
+    def __init__(self, manifest: dict, responses: dict):
+        self.manifest = manifest
+        self.responses = responses
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        files = {}
+        for number, (url, body) in enumerate(sorted(self.responses.items())):
+            files[url] = f'{number:05d}.body'
+            with open(os.path.join(directory, files[url]), 'wb') as body_file:
+                body_file.write(body)
+        with open(os.path.join(directory, 'manifest.json'), 'w') as manifest_file:
+            json.dump({**self.manifest, 'responses': files}, manifest_file, indent=2)
+
+    @classmethod
+    def load(cls, directory: str) -> 'Fixtures':
+        with open(os.path.join(directory, 'manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+        responses = {}
+        for url, file_name in manifest.pop('responses').items():
+            with open(os.path.join(directory, file_name), 'rb') as body_file:
+                responses[url] = body_file.read()
+        return cls(manifest, responses)
+
+
+class mounted:
+    """
+    Mounts a transport adapter on the Sleeper and FantasyPros sessions for the duration of a with block
+    """
+
+    def __init__(self, adapter: BaseAdapter):
+        self.adapter = adapter
+        self.saved = []
+
+    def __enter__(self) -> BaseAdapter:
+        for session in (sleeper.session, fantasy_pros.session):
+            for prefix in ('https://', 'http://'):
+                self.saved.append((session, prefix, session.adapters[prefix]))
+                session.mount(prefix, self.adapter)
+        return self.adapter
+
+    def __exit__(self, *exc_info):
+        for session, prefix, adapter in self.saved:
+            session.mount(prefix, adapter)
+        self.saved = []
+
+
+def sleeper_url(endpoint: str) -> str:
+    return f'{SLEEPER_BASE_URL}{endpoint}'
+
+
+def ecr_page(players: list) -> bytes:
+    """
+    FantasyPros rankings page with the rankings in the same "var ecrData = {...};" script the real pages use
+    """
+    ecr_data = json.dumps({'sport': 'NFL', 'type': 'ranks', 'players': players})
+    return f'<html><head><title>Rankings</title></head><body><script type="text/javascript">\nvar ecrData = {ecr_data};\n</script></body></html>'.encode()
+
+
+def synthetic_fixtures(teams: int, bench: int, season: str = '2024', week: int = 4, seed: int = 0) -> tuple:
+    """
+    Responses for a made-up league with every roster full, plus the matching Sleeper -> FantasyPros names
+
+    Returns:
+      (Fixtures, list of (sleeper_name, fantasy_pros_name))
+    """
+    generator = random.Random(seed)
+    league_id = f'benchmark-{teams}-{bench}'
+    roster_positions = STARTERS + ['BN'] * bench
+    settings = {'playoff_teams': 6, 'playoff_week_start': 15, 'playoff_round_type': 0}
+    end_week = settings['playoff_week_start'] + 2
+
+    # Position mix of a real dump: plenty of receivers and running backs, few kickers
+    position_weights = {'QB': 3, 'RB': 5, 'WR': 7, 'TE': 3, 'K': 1}
+    players = {}
+    for number in range(DUMP_SIZE):
+        player_id = str(1000 + number)
+        position = generator.choices(list(position_weights), weights=list(position_weights.values()))[0]
+        players[player_id] = {
+            'player_id': player_id, 'full_name': f'Player {number}', 'first_name': 'Player', 'last_name': str(number),
+            'fantasy_positions': [position], 'position': position, 'team': f'T{number % 32:02d}', 'stats_id': number,
+            'fantasy_data_id': 50000 + number, 'injury_status': generator.choice([None] * 12 + ['Questionable', 'Out']),
+            'age': generator.randint(21, 36), 'years_exp': generator.randint(0, 14), 'status': 'Active',
+        }
+    for team in range(32):
+        players[f'T{team:02d}'] = {'player_id': f'T{team:02d}', 'full_name': None, 'fantasy_positions': ['DEF'], 'position': 'DEF', 'team': f'T{team:02d}'}
+
+    # Fill each roster with its starters first, then a bench of anyone
+    by_position = {}
+    for player_id, player in players.items():
+        by_position.setdefault(player['fantasy_positions'][0], []).append(player_id)
+    for ids in by_position.values():
+        generator.shuffle(ids)
+    needed = {'QB': 1, 'RB': 2, 'WR': 3, 'TE': 1, 'K': 1, 'DEF': 1}
+    rosters = []
+    for roster_id in range(1, teams + 1):
+        roster = [by_position[position].pop() for position, count in needed.items() for _ in range(count)]
+        for _ in range(bench):
+            position = generator.choices(['QB', 'RB', 'WR', 'TE'], weights=[1, 4, 4, 1])[0]
+            roster.append(by_position[position].pop())
+        rosters.append({
+            'roster_id': roster_id, 'owner_id': f'user-{roster_id}', 'league_id': league_id, 'players': roster,
+            'starters': roster[:len(STARTERS)], 'settings': {'wins': generator.randint(0, week - 1), 'losses': 0, 'ties': 0, 'fpts': generator.randint(250, 450), 'fpts_decimal': 50},
+        })
+
+    # Every rostered player and a few hundred free agents have projections each week
+    rostered = [player_id for roster in rosters for player_id in roster['players']]
+    projected = rostered + generator.sample([player_id for player_id in players if player_id not in set(rostered)], 400)
+
+    def stat_line(position: str) -> dict:
+        if position == 'QB':
+            return {'pass_yd': generator.uniform(150, 320), 'pass_td': generator.uniform(0.5, 2.8), 'pass_int': generator.uniform(0.2, 1.2), 'rush_yd': generator.uniform(0, 40), 'pts_ppr': 0.0, 'gp': 1.0}
+        if position in ('RB', 'WR', 'TE'):
+            return {'rush_yd': generator.uniform(0, 90) if position == 'RB' else 0.0, 'rush_td': generator.uniform(0, 0.8), 'rec': generator.uniform(0.5, 8), 'rec_yd': generator.uniform(5, 95), 'rec_td': generator.uniform(0, 0.7), 'fum_lost': generator.uniform(0, 0.2), 'gp': 1.0}
+        if position == 'K':
+            return {'fgm': generator.uniform(0.8, 2.5), 'xpm': generator.uniform(1, 3.5), 'gp': 1.0}
+        return {'def_td': generator.uniform(0, 0.3), 'int': generator.uniform(0.3, 1.5), 'sack': generator.uniform(1, 4), 'pts_allow_14_20': generator.uniform(0, 1), 'gp': 1.0}
+
+    responses = {
+        sleeper_url('state/nfl'): json.dumps({'season': season, 'league_season': season, 'week': week, 'season_type': 'regular'}).encode(),
+        sleeper_url(f'league/{league_id}'): json.dumps({'league_id': league_id, 'name': f'Benchmark {teams}', 'season': season, 'scoring_settings': SCORING_SETTINGS, 'roster_positions': roster_positions, 'settings': settings, 'total_rosters': teams}).encode(),
+        sleeper_url(f'league/{league_id}/rosters'): json.dumps(rosters).encode(),
+        sleeper_url('players/nfl'): json.dumps(players).encode(),
+    }
+    for projection_week in range(week, end_week + 1):
+        responses[sleeper_url(f'projections/nfl/regular/{season}/{projection_week}')] = json.dumps(
+            {player_id: stat_line(players[player_id]['fantasy_positions'][0]) for player_id in projected}
+        ).encode()
+
+    # Rankings pages. FantasyPros names differ from Sleeper's for some players, which the names table maps
+    fantasy_pros_names = {player_id: players[player_id]['full_name'] + (' Jr.' if number % 7 == 0 else '') for number, player_id in enumerate(rostered) if players[player_id]['full_name']}
+    def ranking_entries(player_ids: list) -> list:
+        return [
+            {'player_id': index, 'player_name': fantasy_pros_names.get(player_id, player_id), 'player_team_id': players[player_id]['team'],
+             'player_position_id': players[player_id]['fantasy_positions'][0], 'rank_ecr': rank, 'rank_min': str(rank), 'rank_max': str(rank + 9),
+             'rank_ave': f'{rank + 0.5:.2f}', 'rank_std': '1.20', 'player_eligibility': players[player_id]['fantasy_positions'][0],
+             'player_image_url': f'https://images.example.com/{index}.png', 'player_bye_week': str(generator.randint(5, 14))}
+            for rank, (index, player_id) in enumerate(((index, player_id) for index, player_id in enumerate(player_ids)), start=1)
+        ]
+    for position in RANKING_POSITIONS:
+        eligible = [player_id for player_id in rostered if players[player_id]['fantasy_positions'][0] in eligible_positions(position)]
+        responses[fantasy_pros_link(position, 'ppr', 'no')] = ecr_page(ranking_entries(generator.sample(eligible, len(eligible))))
+    responses[fantasy_pros_link(None, 'ppr', 'yes')] = ecr_page(ranking_entries(generator.sample(rostered, len(rostered))))
+
+    manifest = {'user_id': 'user-1', 'league_id': league_id, 'season': season, 'week': week, 'format': 'ppr'}
+    names = [(players[player_id]['full_name'], fantasy_pros_name) for player_id, fantasy_pros_name in fantasy_pros_names.items()]
+    return Fixtures(manifest, responses), names
+
+
+def record_fixtures(username: str) -> Fixtures:
+    """
+    Runs the pipeline against the live APIs for a user's first league and keeps every response
+    """
+    with mounted(RecordingAdapter()) as adapter:
+        user_info = sleeper.get_json(f'user/{username}')
+        current_state = sleeper.get_json('state/nfl')
+        league = sleeper.get_json(f"user/{user_info['user_id']}/leagues/nfl/{current_state['league_season']}")[0]
+        sleeper.get_json(f"league/{league['league_id']}")
+        sleeper.get_json(f"league/{league['league_id']}/rosters")
+        sleeper.get('players/nfl', timeout=(3.05, 60))
+        season, week = current_state['league_season'], current_state['week']
+        sleeper.fetch_many([f'projections/nfl/regular/{season}/{projection_week}' for projection_week in range(week, get_end_week(league) + 1)])
+        format = get_format(league['scoring_settings'].get('rec', 0))
+        links = [fantasy_pros_link(position, format, 'no') for position in get_starting_positions_set(league)] + [fantasy_pros_link(None, format, 'yes')]
+        fantasy_pros.fetch_many(links, parse_json=False)
+
+    manifest = {'user_id': user_info['user_id'], 'league_id': league['league_id'], 'season': season, 'week': week, 'format': format}
+    return Fixtures(manifest, adapter.responses)
+
+
+def write_names_database(path: str, names: list):
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("CREATE TABLE matched_names (fantasy_pros_name TEXT, sleeper_name TEXT)")
+        connection.executemany("INSERT INTO matched_names (sleeper_name, fantasy_pros_name) VALUES (?, ?)", names)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def reset_app_state():
+    """
+    Drops everything the app has stored or cached, so the next league's fixtures aren't mixed with the last one's
+    """
+    for cached in (open_player_index, open_projection_store, get_current_state):
+        cached.clear()
+    clear_keyed_caches()
+    for name in ('players.sqlite', 'projections'):
+        path = os.path.join(BENCHMARK_DATA_DIR, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def time_stage(function, repeats: int, items: int, setup=None) -> dict:
+    """
+    Runs a stage several times and summarizes how long it took. setup runs before each repeat and isn't timed.
+    """
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        'repeats': repeats,
+        'min_s': round(min(timings), 6),
+        'median_s': round(statistics.median(timings), 6),
+        'mean_s': round(statistics.fmean(timings), 6),
+        'items': items,
+        'items_per_s': round(items / min(timings), 1) if min(timings) > 0 else None,
+    }
+
+
+def run_benchmarks(fixtures: Fixtures, repeats: int, names_database: str) -> dict:
+    """
+    Replays the fixtures through every stage of the pipeline and times each one
+
+    Returns:
+      dictionary describing the league with a timing summary for each stage
+    """
+    manifest = fixtures.manifest
+    season, week = manifest['season'], int(manifest['week'])
+    ranking_pages = [body for url, body in fixtures.responses.items() if not url.startswith(SLEEPER_BASE_URL)]
+    results = {}
+
+    with mounted(FixtureAdapter(fixtures.responses)) as adapter:
+        league = sleeper.get_json(f"league/{manifest['league_id']}")
+        league_rosters = sleeper.get_json(f"league/{manifest['league_id']}/rosters")
+        end_week = get_end_week(league)
+        format = manifest.get('format') or get_format(league['scoring_settings'].get('rec', 0))
+
+        # Loading the player dump into a fresh index each time, as the first session of the day does
+        index_paths = iter(os.path.join(BENCHMARK_DATA_DIR, f'players-{league["league_id"]}-{repeat}.sqlite') for repeat in range(repeats))
+        def load_player_index():
+            refresh_player_index(PlayerIndex(next(index_paths)), sleeper, timedelta(days=1))
+        results['get_player_info'] = time_stage(load_player_index, repeats, 1)
+
+        player_data = get_player_info()
+        rosters = [get_user_roster_players(player_data, roster) for roster in league_rosters]
+        players = sum(len(roster) for roster in rosters)
+        results['get_user_roster_players'] = time_stage(lambda: [get_user_roster_players(player_data, roster) for roster in league_rosters], repeats, players)
+
+        projections = get_week_projections('regular', season, week)
+        roster_projections = [add_projections(roster, projections) for roster in rosters]
+        results['calculate_projections'] = time_stage(lambda: [calculate_projections(roster, league['scoring_settings']) for roster in roster_projections], repeats, players)
+
+        scored = [calculate_projections(roster, league['scoring_settings']) for roster in roster_projections]
+        results['optimize_starters_projections'] = time_stage(lambda: [optimize_starters_projections(roster, league['roster_positions']) for roster in scored], repeats, len(scored))
+
+        page_bytes = sum(len(body) for body in ranking_pages)
+        results['scrape_parsing'] = time_stage(lambda: [extract_ecr_players(body) for body in ranking_pages], repeats, page_bytes)
+        results['scrape_parsing']['unit'] = 'bytes'
+
+        position_rankings = {position: extract_ecr_players(fixtures.responses.get(fantasy_pros_link(position, format, 'no'), b'')) for position in get_starting_positions_set(league)}
+        results['add_weekly_rankings'] = time_stage(lambda: [add_weekly_rankings(roster, position_rankings, names_database) for roster in rosters], repeats, players)
+
+        ros_rankings = extract_ecr_players(fixtures.responses.get(fantasy_pros_link(None, format, 'yes'), b'')) or []
+        results['add_ros_rankings'] = time_stage(lambda: [add_ros_rankings(roster, ros_rankings, names_database) for roster in rosters], repeats, players)
+
+        # One 1-for-1 trade between each pair of neighbouring rosters, with the season's projections already stored
+        get_season_week_stats('regular', season, range(week, end_week + 1))
+        trades = [(rosters[index], rosters[(index + 1) % len(rosters)]) for index in range(len(rosters)) if rosters[index] and rosters[(index + 1) % len(rosters)]]
+        def total_projection_differences():
+            for team1, team2 in trades:
+                team1_after, team2_after = swap_players(team1, team2, [team1[0]], [team2[0]])
+                calculate_total_projection_differences(team1, team1_after, team2, team2_after, season, week, end_week, league)
+        results['calculate_total_projection_differences'] = time_stage(total_projection_differences, repeats, len(trades))
+
+        current_state = {'league_season': season, 'week': week}
+        def trade_differences():
+            for team1, team2 in trades:
+                calculate_trade_differences(team1, team2, [team1[0]], [team2[0]], league, current_state)
+        results['calculate_trade_differences'] = time_stage(trade_differences, repeats, len(trades), setup=clear_keyed_caches)
+
+        requests_served = adapter.requests_served
+
+    return {
+        'league_id': manifest['league_id'],
+        'teams': len(league_rosters),
+        'roster_slots': len(league['roster_positions']),
+        'rostered_players': players,
+        'weeks': end_week - week + 1,
+        'requests_served': requests_served,
+        'stages': results,
+    }
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--teams', type=int, nargs='+', default=list(LEAGUE_SIZES), help='synthetic league sizes to benchmark')
+    parser.add_argument('--bench', type=int, default=DEFAULT_BENCH, help='bench spots in each synthetic league')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help='times each stage is run')
+    parser.add_argument('--fixtures', nargs='+', help='fixture directories to replay instead of synthetic leagues')
+    parser.add_argument('--save-fixtures', help='directory to write the synthetic fixtures to')
+    parser.add_argument('--record', help='directory to record live fixtures to (needs --username)')
+    parser.add_argument('--username', help='Sleeper username whose first league is recorded')
+    parser.add_argument('--names-database', default='fantasy_names.db', help='names table used with recorded fixtures')
+    parser.add_argument('--output', help='file to write the JSON results to (printed if not given)')
+    args = parser.parse_args(argv)
+
+    if args.record:
+        if not args.username:
+            parser.error('--record needs --username')
+        record_fixtures(args.username).save(args.record)
+        print(f"Recorded fixtures to {args.record}")
+        return
+
+    leagues = []
+    if args.fixtures:
+        for directory in args.fixtures:
+            leagues.append((Fixtures.load(directory), args.names_database))
+    else:
+        for teams in args.teams:
+            fixtures, names = synthetic_fixtures(teams, args.bench)
+            names_database = os.path.join(BENCHMARK_DATA_DIR, f'names-{teams}.db')
+            write_names_database(names_database, names)
+            if args.save_fixtures:
+                fixtures.save(os.path.join(args.save_fixtures, f'teams-{teams}'))
+            leagues.append((fixtures, names_database))
+
+    report = {
+        'generated': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeats': args.repeats,
+        'leagues': [],
+    }
+    for fixtures, names_database in leagues:
+        # Each league starts from empty caches, as a fresh server would
+        reset_app_state()
+        report['leagues'].append(run_benchmarks(fixtures, args.repeats, names_database))
+        print(f"Benchmarked {fixtures.manifest['league_id']}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
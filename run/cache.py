@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Optional
+from metrics import registry
+
+
+# Bump to invalidate everything cached with keyed_cache when the shape of a cached result changes
+CACHE_VERSION = 1
+
+# Every keyed cache in the process, so they can all be cleared at once
+_caches = []
+
+
+class KeyedCache:
+    """
+    Thread-safe LRU store shared by every session in the server process (the same lifetime as a st.cache_resource singleton).
+    Values are returned as is, not copied, so callers must treat them as read-only.
+
+    Arguments:
+      - maxsize: most entries kept before the least recently used one is dropped
+      - ttl: seconds an entry is kept, or None to keep it until it is pushed out
+      - name: what the cache is called in metrics
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None, name: str = 'keyed'):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> tuple:
+        """
+        Returns (found, value)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_counts(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+def _not_none(value, *args, **kwargs) -> bool:
+    return value is not None
+
+
+def keyed_cache(key: Callable[..., tuple], maxsize: int = 128, ttl: Optional[float] = None, cache_if: Callable[..., bool] = _not_none):
+    """
+    Memoizes a function on a small key built from its arguments (league_id, owner_id, week, format, ...) instead of hashing
+    the arguments themselves, which is what makes st.cache_data slow for functions that take whole leagues or rosters.
+
+    Arguments:
+      - key: function taking the same arguments as the decorated function and returning a hashable key
+      - maxsize: most results kept
+      - ttl: seconds a result is kept, or None to keep it until it is pushed out
+      - cache_if: function taking a result followed by the decorated function's arguments and returning whether to keep it.
+                  By default every result but None is kept, so functions return None when a request they depend on failed
+                  and the next call tries again instead of serving the failure for the whole TTL.
+    """
+    def decorator(function: Callable) -> Callable:
+        cache = KeyedCache(maxsize, ttl, name=function.__name__)
+        _caches.append(cache)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            cache_key = (CACHE_VERSION, key(*args, **kwargs))
+            found, value = cache.get(cache_key)
+            if found:
+                return value
+            value = function(*args, **kwargs)
+            if cache_if(value, *args, **kwargs):
+                cache.set(cache_key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def clear_keyed_caches():
+    for cache in _caches:
+        cache.clear()
+
+
+def keyed_cache_metrics() -> list:
+    """
+    Hit and miss counts of every keyed cache, for metrics exports
+    """
+    return [
+        ('cache_requests_total', {'cache': cache.name, 'result': result}, value)
+        for cache in _caches for result, value in (('hit', cache.hits), ('miss', cache.misses))
+    ]
+
+
+def reset_keyed_cache_metrics():
+    for cache in _caches:
+        cache.reset_counts()
+
+
+registry.add_collector(keyed_cache_metrics, reset=reset_keyed_cache_metrics)
@@ -0,0 +1,116 @@
+import copy
+import pickle
+import threading
+import weakref
+from functools import wraps, update_wrapper
+from typing import Callable, Optional
+from cache import keyed_cache
+
+
+def _argument_key(*args, **kwargs) -> bytes:
+    # Arguments like user_info are dictionaries, so they are keyed by their pickled bytes rather than hashed
+    return pickle.dumps((args, sorted(kwargs.items())))
+
+
+class InProcessCacheBackend:
+    """
+    Default cache backend, used by scripts, batch jobs and worker processes. Results are memoized in the process with a keyed
+    cache (see cache.py) on the pickled arguments, whose hits and misses are reported under the function's name. Like every
+    backend, it doesn't keep None results, which is what the fetchers return when a request failed.
+    """
+
+    def cache_data(self, function: Callable, show_spinner: bool = False, ttl: Optional[float] = None, maxsize: int = 128) -> Callable:
+        """
+        Each call gets its own copy of the result, like st.cache_data gives
+        """
+        cached = keyed_cache(key=_argument_key, maxsize=maxsize, ttl=ttl)(function)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            return copy.deepcopy(cached(*args, **kwargs))
+
+        wrapper.clear = cached.cache.clear
+        return wrapper
+
+    def cache_resource(self, function: Callable, show_spinner: bool = False, ttl: Optional[float] = None, maxsize: int = 128) -> Callable:
+        """
+        One shared result per set of arguments, like st.cache_resource
+        """
+        cached = keyed_cache(key=_argument_key, maxsize=maxsize, ttl=ttl)(function)
+        cached.clear = cached.cache.clear
+        return cached
+
+
+_backend = InProcessCacheBackend()
+_cached_functions = weakref.WeakSet()
+
+
+def get_cache_backend():
+    return _backend
+
+
+def set_cache_backend(backend):
+    """
+    Installs the backend every cached function uses from its next call on. Any backend with cache_data and cache_resource
+    methods taking (function, show_spinner, ttl, maxsize) and returning a callable with a clear method works, like
+    streamlit_cache.StreamlitCacheBackend. What the previous backend cached is dropped.
+    """
+    global _backend
+    _backend = backend
+    for cached_function in list(_cached_functions):
+        cached_function.unbind()
+
+
+class CachedFunction:
+    """
+    A function cached by whichever backend is installed when it's first called, so the data functions can be imported before
+    the app picks its backend and without importing Streamlit
+    """
+
+    def __init__(self, function: Callable, kind: str, options: dict):
+        update_wrapper(self, function)
+        self.function = function
+        self.kind = kind
+        self.options = options
+        self._cached = None
+        self._lock = threading.Lock()
+        _cached_functions.add(self)
+
+    def _bind(self) -> Callable:
+        with self._lock:
+            if self._cached is None:
+                self._cached = getattr(_backend, self.kind)(self.function, **self.options)
+            return self._cached
+
+    def unbind(self):
+        with self._lock:
+            self._cached = None
+
+    def __call__(self, *args, **kwargs):
+        cached = self._cached or self._bind()
+        return cached(*args, **kwargs)
+
+    def clear(self):
+        cached = self._cached
+        if cached is not None:
+            cached.clear()
+
+
+def cache_data(show_spinner: bool = False, ttl: Optional[float] = None, maxsize: int = 128):
+    """
+    Decorator caching a function's results with the installed backend's cache_data (a copy for every caller)
+    """
+    def decorator(function: Callable) -> CachedFunction:
+        return CachedFunction(function, 'cache_data', {'show_spinner': show_spinner, 'ttl': ttl, 'maxsize': maxsize})
+
+    return decorator
+
+
+def cache_resource(show_spinner: bool = False, ttl: Optional[float] = None, maxsize: int = 128):
+    """
+    Decorator caching a function's results with the installed backend's cache_resource (one shared object)
+    """
+    def decorator(function: Callable) -> CachedFunction:
+        return CachedFunction(function, 'cache_resource', {'show_spinner': show_spinner, 'ttl': ttl, 'maxsize': maxsize})
+
+    return decorator
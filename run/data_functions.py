@@ -1,35 +1,42 @@
-import requests
-from PIL import Image
 from io import BytesIO
-import json
-from datetime import datetime, timedelta
-from typing import Union
-import sqlite3
-import streamlit as st
-
-
-base_url = 'https://api.sleeper.app/v1/'
-
-
-@st.cache_data(show_spinner = False)
+from datetime import timedelta
+from typing import Optional, Union
+from cache_backend import cache_data, cache_resource
+from sleeper_client import sleeper, SLEEPER_BASE_URL
+from player_index import PlayerIndex, refresh_player_index
+from storage import data_path
+from scoring import WeekStats, build_stat_matrix, score_players, season_score_table
+from lineup_optimizer import optimal_lineup
+from projection_store import SeasonProjectionStore
+from records import Player, Roster
+# Rankings joins and trade math don't fetch anything, so they live in their own modules and are re-exported here
+from rankings_join import add_weekly_rankings, add_ros_rankings, optimize_starting_lineup_rankings
+from trade_math import swap_players, get_total_score, calculate_average_rankings, lineup_total_differences, trade_differences
+from cache import keyed_cache
+from metrics import timed
+from trade_finder import find_trades
+from season_simulator import SeasonSimulator
+from power_rankings import rank_league
+
+
+base_url = SLEEPER_BASE_URL
+
+# Seconds league data (leagues, rosters, league users) is reused before asking Sleeper again
+SLEEPER_TTL = 600
+
+
+@cache_data(show_spinner = False)
+@timed()
 def get_user_info(username_or_user_id: Union[str,int]) -> dict:
     endpoint = f'user/{username_or_user_id}'
 
-    # Construct the full URL
-    full_url = f'{base_url}{endpoint}'
-
-    response = requests.get(full_url)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        user_data = response.json()
-        return user_data
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
-        return None
+    # Make the API request over the shared keep-alive session
+    return sleeper.get_json(endpoint)
     
 
-@st.cache_data(show_spinner = False)
+# Images are returned as shared objects instead of being pickled and copied on every call
+@cache_resource(show_spinner = False)
+@timed()
 def get_avatar_images(user_info: dict):
     if user_info:
         avatar_id = user_info.get('avatar')
@@ -39,44 +46,33 @@ def get_avatar_images(user_info: dict):
             full_size_url = f'https://sleepercdn.com/avatars/{avatar_id}'
             thumbnail_url = f'https://sleepercdn.com/avatars/thumbs/{avatar_id}'
 
-            # Download full-size image
-            full_size_image_response = requests.get(full_size_url)
-            full_size_image = Image.open(BytesIO(full_size_image_response.content))
-
-            # Download thumbnail image
-            thumbnail_image_response = requests.get(thumbnail_url)
-            thumbnail_image = Image.open(BytesIO(thumbnail_image_response.content))
+            # Download both images at the same time
+            full_size_content, thumbnail_content = sleeper.fetch_many([full_size_url, thumbnail_url], parse_json=False)
+            # Pillow is only needed for avatars, so scripts and workers that never show one don't pay for importing it
+            from PIL import Image
+            full_size_image = Image.open(BytesIO(full_size_content)) if full_size_content else None
+            thumbnail_image = Image.open(BytesIO(thumbnail_content)) if thumbnail_content else None
 
             return full_size_image, thumbnail_image
         else:
             print("User has no avatar.")
+            return None, None
     else:
         print("User information not available.")
         return None, None
     
 
 
-@st.cache_data(show_spinner = False)
+@cache_resource(show_spinner = False, ttl = SLEEPER_TTL)
+@timed()
 def get_user_leagues(user_id: Union[str,int], season: Union[str,int]) -> list:
 
     endpoint = f'user/{user_id}/leagues/nfl/{season}'
 
-    # Construct the full URL
-    full_url = f'{base_url}{endpoint}'
+    # Make the API request over the shared keep-alive session
+    return sleeper.get_json(endpoint)
 
-    # Make the API request
-    response = requests.get(full_url)
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        leagues_data = response.json()
-        return leagues_data # is a list of dictionaries
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
-        return None
-
-
-@st.cache_data(show_spinner = False)    
 def get_selected_league_info(user_leagues: list, selected_league_name: Union[str,int]) -> dict:
     """
     Gets information for the specific league that the user selects
@@ -90,38 +86,67 @@ def get_selected_league_info(user_leagues: list, selected_league_name: Union[str
         return None
     
 
-@st.cache_data(show_spinner = False)
+@cache_resource(show_spinner = False, ttl = SLEEPER_TTL)
+@timed()
 def get_league_rosters(league_id: Union[str,int]) -> list:
     endpoint = f'league/{league_id}/rosters'
 
-    # Construct the full URL
-    full_url = f'{base_url}{endpoint}'
+    # Make the API request over the shared keep-alive session
+    return sleeper.get_json(endpoint)
 
-    # Make the API request
-    response = requests.get(full_url)
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        rosters_data = response.json()
-        return rosters_data # Returns a list of dictionaries with roster info
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
-        return None
+@cache_resource(show_spinner = False, ttl = SLEEPER_TTL)
+@timed()
+def get_league_users(league_id: Union[str,int]) -> list:
+    """
+    Gets every user in a league with one API call
+    """
+    endpoint = f'league/{league_id}/users'
 
+    # Make the API request over the shared keep-alive session
+    return sleeper.get_json(endpoint) # Returns a list of dictionaries with user info
 
-@st.cache_data(show_spinner=False)
+
+def get_other_owner_ids(league_rosters: list, user_info: dict) -> list:
+    """
+    Owner IDs of every other roster in the league, in roster order. Rosters without an owner are left out.
+    """
+    return [roster['owner_id'] for roster in league_rosters if roster['owner_id'] and roster['owner_id'] != user_info['user_id']]
+
+
+# Keyed on the league and user rather than hashing every roster in the league. Only kept once every owner's username was
+# found, so a failed users call isn't served to every session until the TTL runs out
+@keyed_cache(key=lambda league_rosters, user_info: (league_rosters[0]['league_id'] if league_rosters else None, user_info['user_id']), ttl=SLEEPER_TTL,
+             cache_if=lambda usernames, league_rosters, user_info: len(usernames) == len(set(get_other_owner_ids(league_rosters, user_info))))
+@timed()
 def get_other_league_usernames(league_rosters: list, user_info: dict) -> dict:
-    league_usernames_dict = {}
-    for roster in league_rosters:
-        if roster['owner_id'] != user_info['user_id']:
-            user_id = roster['owner_id']
-            info = get_user_info(user_id)
-            league_usernames_dict[user_id] = info['username']
+    """
+    Maps the owner ID of every other roster in the league to the owner's username. All owners come from one league users call,
+    and any owner missing from that response is looked up individually, with those lookups made at the same time. Owners whose
+    username couldn't be fetched are left out.
+    """
+    owner_ids = get_other_owner_ids(league_rosters, user_info)
+    if not owner_ids:
+        return {}
+
+    # Every roster in the list belongs to the same league
+    league_users = get_league_users(league_rosters[0]['league_id']) or []
+    usernames = {user['user_id']: user.get('username') or user.get('display_name') for user in league_users}
+
+    # Fall back to the individual user endpoint for anyone the bulk call didn't return
+    missing_ids = [user_id for user_id in owner_ids if not usernames.get(user_id)]
+    if missing_ids:
+        missing_users = sleeper.fetch_many([f'user/{user_id}' for user_id in missing_ids])
+        for user_id, info in zip(missing_ids, missing_users):
+            if info:
+                usernames[user_id] = info['username']
+
+    # Keep the roster order so the dropdown matches the league
+    league_usernames_dict = {user_id: usernames[user_id] for user_id in owner_ids if usernames.get(user_id)}
     return league_usernames_dict
     
 
 
-@st.cache_data(show_spinner = False)
 def get_user_roster_info(league_rosters: list, user_id: Union[str,int]) -> dict:
     """
     Get the user's roster in a selected league
@@ -136,211 +161,160 @@ def get_user_roster_info(league_rosters: list, user_id: Union[str,int]) -> dict:
     
 
 
-@st.cache_data(show_spinner = False)
-def get_player_info() -> dict:
-    """
-    Gets information on current NFL players from the sleeper API. A dictionary with keys being player IDs
-    """
-    # Check for up to date player info
-    try:
-        with open('player_info.json', 'r') as file:
-            player_info = json.load(file)
-            last_updated = datetime.strptime(player_info.get('last_updated'), '%Y-%m-%d')
-            
-            # Only call the API if it hasn't been updated in the last 24 hours
-            if datetime.now() - last_updated < timedelta(days=1):
-                return player_info['data']
-    except FileNotFoundError:
-        pass  # File not found, or first-time retrieval
-
-    # If local file not found or outdated, make the API call
-    endpoint = 'players/nfl'
-
-    # Construct the full URL
-    full_url = f'{base_url}{endpoint}'
-
-    # Make the API request
-    response = requests.get(full_url)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        player_data = response.json()
-        
-        # Save the player info
-        player_info = {'last_updated': datetime.now().strftime('%Y-%m-%d'), 'data': player_data}
-        with open('player_info.json', 'w') as file:
-            json.dump(player_info, file)
-        
-        return player_data
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
+# How long the local player index is trusted before checking Sleeper for changes
+PLAYER_INDEX_MAX_AGE = timedelta(days=1)
+
+
+@cache_resource(show_spinner = False)
+def open_player_index() -> PlayerIndex:
+    """
+    One shared player index per server process. It is a handle to a file rather than the data itself, so it's never hashed or copied
+    """
+    return PlayerIndex(data_path('players.sqlite'))
+
+
+@timed()
+def get_player_info() -> PlayerIndex:
+    """
+    Gets information on current NFL players from the sleeper API. Returns a player index that can be used like a dictionary
+    with keys being player IDs, but is backed by a small local database holding only the fields the application uses.
+    """
+    player_index = open_player_index()
+
+    # Only call the API if the index hasn't been refreshed in the last 24 hours. The download is conditional, locked across
+    # processes, and only changed players are written. An older index is served while it refreshes in the background, and a
+    # failed download isn't tried again for a few minutes
+    refresh_player_index(player_index, sleeper, PLAYER_INDEX_MAX_AGE)
+
+    # An index that has never been filled means the first download failed
+    if player_index.last_refreshed is None:
         return None
-    
+    return player_index
+
 
 
+@timed()
 def get_user_roster_players(all_players: dict, user_roster: dict) -> list:
   """
-  Adds in relevant player information for each player on a roster
+  Adds in relevant player information for each player on a roster. Each player is a compact record (see records.Player) that
+  can be used like a dictionary
   """
-  user_roster_players = [
-      {
-            'full_name': all_players.get(player_id, {}).get('full_name'),
-            'player_id': all_players.get(player_id, {}).get('player_id'),
-            'fantasy_positions': all_players.get(player_id, {}).get('fantasy_positions'),
-            'team': all_players.get(player_id, {}).get('team'),
-            'stats_id': all_players.get(player_id, {}).get('stats_id'),
-            'sportradar_id': all_players.get(player_id, {}).get('fantasy_data_id')
-      }
-      for player_id in user_roster['players']
-    ]
-  return user_roster_players # Is a list of dictionaries with player info
+  player_ids = user_roster['players'] or []
+  # The player index looks up the whole roster with one query
+  found_players = all_players.get_many(player_ids) if isinstance(all_players, PlayerIndex) else all_players
+  return [Player.from_info(found_players.get(player_id) or {}) for player_id in player_ids] # Is a list of player records
 
 
 
 def get_user_starters(all_players: dict, user_roster: dict) -> list:
-  user_starter_players = [
-      {
-            'full_name': all_players.get(player_id, {}).get('full_name'),
-            'player_id': all_players.get(player_id, {}).get('player_id'),
-            'fantasy_positions': all_players.get(player_id, {}).get('fantasy_positions'),
-            'team': all_players.get(player_id, {}).get('team'),
-            'stats_id': all_players.get(player_id, {}).get('stats_id'),
-            'sportradar_id': all_players.get(player_id, {}).get('fantasy_data_id')
-      }
-      for player_id in user_roster['starters']
-    ]
-  return user_starter_players # Is a list of dictionaries with player info
-
-
-@st.cache_data(show_spinner = False)
+  player_ids = user_roster['starters'] or []
+  found_players = all_players.get_many(player_ids) if isinstance(all_players, PlayerIndex) else all_players
+  return [Player.from_info(found_players.get(player_id) or {}) for player_id in player_ids] # Is a list of player records
+
+
+@cache_data(show_spinner = False)
+@timed()
 def get_current_state(sport:str) -> dict:
     """
     Gets information on the current state of the nfl. For example, it gets the season and what week it is.
     """
     endpoint = f'state/{sport}'
 
-    # Construct the full URL
-    full_url = f'{base_url}{endpoint}'
+    # Make the API request over the shared keep-alive session
+    return sleeper.get_json(endpoint)
 
-    # Make the API request
-    response = requests.get(full_url)
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        state_data = response.json()
-        return state_data
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
-        return None
+@cache_resource(show_spinner = False)
+def open_projection_store() -> SeasonProjectionStore:
+    """
+    One shared projection store per server process
+    """
+    return SeasonProjectionStore(sleeper, data_path('projections'))
 
 
-@st.cache_data(show_spinner = False)
-def get_week_projections(season_type: str, season: Union[str, int], week: Union[str, int]) -> dict:
+def get_projection_week() -> int:
     """
-    Gets projected stats for each player in a given week. Projections made by sleeper
+    Current NFL week, used to decide how long each week's projections are trusted
     """
-    
-    projections_base_url = "https://api.sleeper.app/v1/projections/{}".format("nfl")
+    current_state = get_current_state('nfl') or {}
+    return current_state.get('week') or 1
 
-    # Construct the URL and make the API call
-    url = "{}/{}/{}/{}".format(projections_base_url, season_type, season, week)
 
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
-        return None
+@timed()
+def get_week_stats(season_type: str, season: Union[str, int], week: Union[str, int]) -> WeekStats:
+    """
+    Projected stats for every player in a given week as a stat matrix (see scoring.py). Projections made by sleeper
+    """
+    return open_projection_store().get_week_stats(season_type, season, week, get_projection_week())
+
+
+@timed()
+def get_season_week_stats(season_type: str, season: Union[str, int], weeks: list) -> list:
+    """
+    Stat matrices for several weeks. Any weeks that aren't stored yet are downloaded at the same time, and out of date ones are
+    refreshed in the background
+    """
+    return open_projection_store().get_weeks_stats(season_type, season, weeks, get_projection_week())
+
+
+def prefetch_season_projections(season: Union[str, int], current_week: int, end_week: int):
+    """
+    Starts downloading projections for the rest of the season in the background, so trade analysis doesn't wait on them later
+    """
+    open_projection_store().prefetch_in_background('regular', season, range(current_week, end_week + 1), current_week)
+
+
+@timed()
+def get_week_projections(season_type: str, season: Union[str, int], week: Union[str, int]) -> WeekStats:
+    """
+    Gets projected stats for each player in a given week as a stat matrix, which add_projections takes each player's stats
+    from. Projections made by sleeper
+    """
+    return get_week_stats(season_type, season, week)
 
 
 
-def add_projections(user_roster_players: list, projections: dict) -> list:
+@timed()
+def add_projections(user_roster_players: list, projections: Union[WeekStats, dict]) -> Roster:
   """
-  Adds the projected stats to each player in the list
+  Adds the projected stats to each player in the list, leaving out players without projections. The roster's stats are kept in
+  one array with a row for each player (see records.Roster) rather than merged into every player as separate keys.
   """
-  
-  projections_added = []
-  for player in user_roster_players:
-    player_id = player.get('player_id')
-    if player_id in projections:
-      merged_player_info = {**player, **projections[player_id]}
-      projections_added.append(merged_player_info)
-
-  return projections_added
+  # Projections in Sleeper's player ID -> {stat: value} format are turned into a stat matrix first
+  week_stats = projections if isinstance(projections, WeekStats) else build_stat_matrix(projections)
+  return Roster.from_week_stats(user_roster_players, week_stats)
 
 
 
+@timed()
 def calculate_projections(roster_projections: list, scoring_settings: dict) -> list:
   """
-  Uses the projected stats for each player along with the specific scoring settings of the league to calculate projected scores
+  Uses the projected stats for each player along with the specific scoring settings of the league to calculate projected scores.
+  Returns copies of the players, so players that came from a cache aren't changed.
   """
-  for player in roster_projections:
-    player_projection = 0
-    for key, value in player.items():
-        if key in scoring_settings:
-            player_projection += value * scoring_settings[key]
-    # Round player projection to hundredths place
-    player_projection = round(player_projection, 2)
-    # Add the calculated projection to the player dictionary
-    player['projected_points'] = player_projection
+  # Score the whole roster with one matrix-vector product
+  scores = score_players(roster_projections, scoring_settings)
 
-  return roster_projections
+  scored_players = []
+  for player, player_projection in zip(roster_projections, scores):
+    # Round player projection to hundredths place and add it to a copy of the player
+    scored_player = player.copy()
+    scored_player['projected_points'] = round(float(player_projection), 2)
+    scored_players.append(scored_player)
 
+  if isinstance(roster_projections, Roster):
+    return roster_projections.with_players(scored_players)
+  return scored_players
 
 
 
-@st.cache_data(show_spinner = False)
+@timed()
 def optimize_starters_projections(player_list: list, positions_list: list) -> list:
     """
-    Uses calculated projected scores to generate the optimal starting lineup
+    Uses calculated projected scores to generate the optimal starting lineup. Solved exactly, so FLEX/SUPER_FLEX slots listed
+    before dedicated slots and players with several fantasy positions are handled correctly.
     """
-    
-    starting_lineup = []
-
-    for position in positions_list:
-        if position == 'BN':
-            break  # Stop when bench position is encountered
-
-        # Deal with flex
-        if position == 'FLEX':
-            flex_candidates = [player for player in player_list if any(pos in player['fantasy_positions'] for pos in ['RB', 'WR', 'TE']) and player not in starting_lineup]
-            if flex_candidates:
-                max_flex_candidate = max(flex_candidates, key=lambda x: x['projected_points'])
-                max_flex_candidate['position'] = 'FLEX'
-                starting_lineup.append(max_flex_candidate)
-                continue  # Move to the next position
-            else:
-                # Add empty slot for FLEX if no candidates
-                starting_lineup.append({'position': 'FLEX', 'full_name': 'EMPTY', 'projected_points': 0})
-                continue  # Move to the next position
-
-        # Deal with superflex
-        if position == 'SUPER_FLEX':
-            superflex_candidates = [player for player in player_list if any(pos in player['fantasy_positions'] for pos in ['QB', 'RB', 'WR', 'TE']) and player not in starting_lineup]
-            if superflex_candidates:
-                max_superflex_candidate = max(superflex_candidates, key=lambda x: x['projected_points'])
-                max_superflex_candidate['position'] = 'SUPER_FLEX'
-                starting_lineup.append(max_superflex_candidate)
-                continue  # Move to the next position
-            else:
-                # Add empty slot for SUPER_FLEX if no candidates
-                starting_lineup.append({'position': 'SUPER_FLEX', 'full_name': 'EMPTY', 'projected_points': 0})
-                continue  # Move to the next position
-
-        # Filter players by the current position
-        players_for_position = [player for player in player_list if position in player['fantasy_positions'] and player not in starting_lineup]
-
-        if players_for_position:
-            # Find the player with the maximum projected points for the current position
-            max_projected_player = max(players_for_position, key=lambda x: x['projected_points'])
-            max_projected_player['position'] = position
-
-            # Add the player to the starting lineup
-            starting_lineup.append(max_projected_player)
-        else:
-            # Add empty slot if no candidates for the current position
-            starting_lineup.append({'position': position, 'full_name': 'EMPTY', 'projected_points': 0})
-
+    starting_lineup, total = optimal_lineup(player_list, positions_list)
     return starting_lineup
 
 
@@ -365,185 +339,6 @@ def get_starting_positions_set(selected_league: dict) -> set:
   return starting_positions
 
 
-# Match weekly FantasyPros rankings to the roster using the database
-@st.cache_data(show_spinner = False)
-def add_weekly_rankings(player_list: list, position_rankings: dict, database_file: str) -> list:
-    """
-    Database with names in sleeper and their fantasypros counterpart in order to add fantasy pros rankings to a list of players
-    """
-    
-    # Connect to the database
-    connection = sqlite3.connect(database_file)
-    cursor = connection.cursor()
-
-    # Create a new list to store the updated player information
-    updated_player_list = []
-
-    # Iterate through each player in the player list
-    for player_info in player_list:
-        # Make a copy of the player dictionary
-        updated_player_info = player_info.copy()
-
-        player_name = updated_player_info.get('full_name') or updated_player_info.get('player_id', '')
-
-        # Get the fantasy pros name
-        query = "SELECT fantasy_pros_name FROM matched_names WHERE sleeper_name = ?"
-        cursor.execute(query, (player_name,))
-        result = cursor.fetchone()
-
-        if result is not None:
-            fantasy_pros_name = result[0]
-
-            # Find the corresponding position for the player
-            positions = updated_player_info.get('fantasy_positions', [])
-
-            for position in positions:
-                # Get the rankings for the player's position
-                position_ranking = position_rankings.get(position, [])
-
-                # Find the player's ranking in the position rankings
-                player_ranking = next(
-                    (player.get('rank_ecr', 'unranked') for player in position_ranking if (player['player_name'] == fantasy_pros_name or player['player_team_id'] == fantasy_pros_name)),
-                    'unranked'
-                )
-
-                # Add the ranking to the player's copied dictionary
-                key = f'{position.lower()}_ecr_ranking'
-                updated_player_info[key] = player_ranking
-
-            # Add FLEX and SUPER_FLEX rankings for every player
-            flex_ranking = next(
-                (player.get('rank_ecr', 'unranked') for player in position_rankings.get('FLEX', []) if player['player_name'] == fantasy_pros_name),
-                'unranked'
-            )
-            updated_player_info['flex_ecr_ranking'] = flex_ranking
-
-            super_flex_ranking = next(
-                (player.get('rank_ecr', 'unranked') for player in position_rankings.get('SUPER_FLEX', []) if player['player_name'] == fantasy_pros_name),
-                'unranked'
-            )
-            updated_player_info['super_flex_ecr_ranking'] = super_flex_ranking
-
-        else:
-            # If no match found in the database, set rank_ecr to "unranked" for each position
-            for position in positions:
-                key = f'{position.lower()}_ecr_ranking'
-                updated_player_info[key] = 'unranked'
-
-            # Set FLEX and SUPER_FLEX rankings to "unranked" if positions are not found
-            updated_player_info['flex_ecr_ranking'] = 'unranked'
-            updated_player_info['super_flex_ecr_ranking'] = 'unranked'
-
-        # Add the updated player information to the new list
-        updated_player_list.append(updated_player_info)
-
-    # Close the database connection
-    connection.close()
-
-    return updated_player_list
-
-
-
-@st.cache_data(show_spinner = False)
-def add_ros_rankings(player_list: list, ros_rankings: dict, database_file: str) -> list:
-    """
-    Rest of season rankings are contained in one overall list rather than individual ones by position, so needs to be handled differently
-    """
-    
-    # Connect to the database
-    connection = sqlite3.connect(database_file)
-    cursor = connection.cursor()
-
-    # Create a new list to store the updated player information
-    updated_player_list = []
-
-    # Iterate through each player in the player list
-    for player_info in player_list:
-        # Make a copy of the player dictionary
-        updated_player_info = player_info.copy()
-
-        player_name = updated_player_info.get('full_name') or updated_player_info.get('player_id', '')
-
-        # Get the fantasy pros name using a parameterized query
-        query = "SELECT fantasy_pros_name FROM matched_names WHERE sleeper_name = ?"
-        cursor.execute(query, (player_name,))
-        result = cursor.fetchone()
-
-        if result is not None:
-            fantasy_pros_name = result[0]
-            # Find the player's ranking in the position rankings
-            # Special case if player is team defense
-            if updated_player_info['fantasy_positions'][0] == 'DEF':
-                player_ranking = next(
-                    (player.get('rank_ecr', 'unranked') for player in ros_rankings if (player['player_position_id'] == "DST" and player['player_team_id'] == fantasy_pros_name)),
-                    'unranked'
-                )
-            else:
-                player_ranking = next(
-                    (player.get('rank_ecr', 'unranked') for player in ros_rankings if (player['player_name'] == fantasy_pros_name or player['player_team_id'] == fantasy_pros_name)),
-                    'unranked'
-                )
-            updated_player_info['ros_ecr_ranking'] = player_ranking
-        else:
-            updated_player_info['ros_ecr_ranking'] = 'unranked'
-        # Add updated player info with ros rankings to list
-        updated_player_list.append(updated_player_info)
-    
-    # Close the database connection
-    connection.close()
-
-    return updated_player_list
-        
-
-
-
-# Use weekly rankings to generate expert recommended starting lineup
-@st.cache_data(show_spinner = False)
-def optimize_starting_lineup_rankings(roster_with_rankings: list, positions: list) -> list:
-    # Create a copy of the roster
-    temp_rost = roster_with_rankings.copy()
-
-    # Create a starting lineup
-    starting_lineup = []
-
-    # Iterate through the list of positions until the bench position
-    for position in positions:
-        if position == "BN":
-            break
-
-        # Determine the key for the ranking based on the position
-        key = f'{position.lower()}_ecr_ranking'
-
-        # If position is FLEX or SUPER_FLEX, select the player with the best flex/superflex ranking among all remaining players
-        if position == 'FLEX':
-            # For FLEX, eligible positions are WR, RB, and TE
-            eligible_players = [player for player in temp_rost if any(pos in player['fantasy_positions'] for pos in ['WR', 'RB', 'TE'])]
-        elif position == 'SUPER_FLEX':
-            # For SUPER_FLEX, eligible positions are QB, WR, RB, and TE
-            eligible_players = [player for player in temp_rost if any(pos in player['fantasy_positions'] for pos in ['QB', 'WR', 'RB', 'TE'])]
-        else:
-            # For other positions, filter players based on the current position
-            eligible_players = [player for player in temp_rost if position in player['fantasy_positions']]
-
-        if not eligible_players or all(player.get(key, 'unranked') == 'unranked' for player in eligible_players):
-            # If no eligible players or all players are unranked, add an empty slot/placeholder to the starting lineup
-            starting_lineup.append({'position': position, 'starting_position': position, 'is_starting': False, 'full_name': 'EMPTY'})
-        else:
-            # For other positions, select the player with the best ranking
-            best_player = min(eligible_players, key=lambda x: x.get(key, float('inf')) if x.get(key, 'unranked') != 'unranked' else float('inf'))
-
-            # Add the selected player to the starting lineup
-            best_player['starting_position'] = position
-            best_player['is_starting'] = True
-            starting_lineup.append(best_player)
-
-            # Remove the selected player from the list of eligible players
-            temp_rost.remove(best_player)
-
-    return starting_lineup
-
-
-@st.cache_data(show_spinner = False)
 def get_end_week(league_info: dict) -> int:
     """
     League end week not in league info, so have to find it based on when the playoffs start, how many teams make the playoffs, and 
@@ -563,7 +358,7 @@ def get_end_week(league_info: dict) -> int:
     elif league_info['settings']['playoff_round_type'] == 1:
         playoff_weeks += 1 
     elif league_info['settings']['playoff_round_type'] == 2:
-        playoff_weeks *= 1
+        playoff_weeks *= 2
     else:
         print("Playoff format not recognized")
         return
@@ -571,100 +366,187 @@ def get_end_week(league_info: dict) -> int:
     return end_week
     
 
-def swap_players(team1: list, team2: list, players_to_swap_from_team1: list, players_to_swap_from_team2: list) -> list:
+@timed()
+def calculate_total_projection_differences(team1_before: list, team1_after: list, team2_before: list, team2_after: list, current_season: int, current_week: int, end_week: int, selected_league: dict):
     """
-    Used in trade analysis. Need to take the two teams and the players selected to be included in the trade and swap them from one team to the other
+    Used in trade analysis. Calculates the optimal starting lineup based on projections for both teams before and after the trade for each week
+    for the rest of the season. Then calculates the total difference in total projected score for both teams before and after the trade.
     """
     
-    # Remove players from team1 and add them to team2
-    team1_copy = [player.copy() for player in team1]
-    team2_copy = [player.copy() for player in team2]
+    teams = [team1_before, team1_after, team2_before, team2_after]
+    weeks = range(current_week, end_week + 1)
 
-    for player_to_swap in players_to_swap_from_team1:
-        matching_players = [p for p in team1_copy if p['full_name'] == player_to_swap['full_name']]
-        if matching_players:
-            team1_copy.remove(matching_players[0])
-            team2_copy.append(matching_players[0])
+    # Get projections for each week as stat matrices. Weeks that weren't prefetched are downloaded at the same time
+    weeks_stats = [week_stats or build_stat_matrix({}) for week_stats in get_season_week_stats('regular', current_season, weeks)]
 
-    # Remove players from team2 and add them to team1
-    for player_to_swap in players_to_swap_from_team2:
-        matching_players = [p for p in team2_copy if p['full_name'] == player_to_swap['full_name']]
-        if matching_players:
-            team2_copy.remove(matching_players[0])
-            team1_copy.append(matching_players[0])
+    return lineup_total_differences(teams, weeks_stats, selected_league['scoring_settings'], selected_league['roster_positions'])
 
-    return team1_copy, team2_copy
 
 
+# Keyed on the league and week rather than hashing the league's settings
+@keyed_cache(key=lambda selected_league, current_state: (selected_league['league_id'], current_state['league_season'], current_state['week']), maxsize=16, ttl=SLEEPER_TTL)
+@timed()
+def get_season_score_table(selected_league: dict, current_state: dict) -> dict:
+    """
+    Projected points for every player in every week from the current week to the end of the league's season, scored with the
+    league's settings. Player ID -> array with one value per week (NaN for weeks without a projection).
+    """
+    weeks = range(current_state['week'], get_end_week(selected_league) + 1)
+    weeks_stats = [week_stats or build_stat_matrix({}) for week_stats in get_season_week_stats('regular', current_state['league_season'], weeks)]
+    return season_score_table(weeks_stats, selected_league['scoring_settings'])
+
 
-def get_total_score(starting_lineup: list) -> float:
+
+@timed()
+def calculate_trade_differences(team1: list, team2: list, players_from_team1: list, players_from_team2: list, selected_league: dict, current_state: dict) -> tuple:
     """
-    Just gets the total projected score for a starting lineup
+    Used in trade analysis. Change in each team's optimal projected points for the rest of the season if the trade went through.
+    Only the lineup slots the traded players can fill are re-solved for each week, see roster_state.RosterState.
     """
-    total_score = 0
-    for player in starting_lineup:
-        total_score += player['projected_points']
-    return round(total_score, 2)
+    score_table = get_season_score_table(selected_league, current_state)
+    num_weeks = get_end_week(selected_league) - current_state['week'] + 1
 
+    return trade_differences(team1, team2, players_from_team1, players_from_team2, score_table, selected_league['roster_positions'], num_weeks)
 
 
-def calculate_total_projection_differences(team1_before: list, team1_after: list, team2_before: list, team2_after: list, current_season: int, current_week: int, end_week: int, selected_league: dict):
+
+
+
+# Keyed on the league and week, so every session looking at a league shares one batch instead of rebuilding each roster on every rerun
+@keyed_cache(key=lambda league_rosters, player_data, selected_league, current_state: (selected_league['league_id'], current_state['league_season'], current_state['week']), maxsize=16, ttl=SLEEPER_TTL)
+@timed()
+def get_league_power_rankings(league_rosters: list, player_data: dict, selected_league: dict, current_state: dict) -> list:
     """
-    Used in trade analysis. Calculates the optimal starting lineup based on projections for both teams before and after the trade for each week
-    for the rest of the season. Then calculates the total difference in total projected score for both teams before and after the trade.
+    Builds every roster in the league and solves all of their optimal lineups for the current week and the rest of the season
+    in one batch, see power_rankings.rank_league
+
+    Returns:
+      list of dictionaries with rank, roster_id, owner_id, players, week_points, season_points, wins, losses, ties and
+      points_for, best team first
     """
-    
-    team1_before_total = 0
-    team1_after_total = 0
-    team2_before_total = 0
-    team2_after_total = 0
-    for week in range(current_week, end_week + 1):
-        # Get projections for the week
-        week_projections = get_week_projections('regular', current_season, week)
-        # Add projections to each team
-        team1_before_projections = add_projections(team1_before, week_projections)
-        team1_after_projections = add_projections(team1_after, week_projections)
-        team2_before_projections = add_projections(team2_before, week_projections)
-        team2_after_projections = add_projections(team2_after, week_projections)
-        # Get projected scores for each team
-        team1_before_scores = calculate_projections(team1_before_projections, selected_league['scoring_settings'])
-        team1_after_scores = calculate_projections(team1_after_projections, selected_league['scoring_settings'])
-        team2_before_scores = calculate_projections(team2_before_projections, selected_league['scoring_settings'])
-        team2_after_scores = calculate_projections(team2_after_projections, selected_league['scoring_settings'])
-        # Optimize starters for each team
-        team1_before_optimized = optimize_starters_projections(team1_before_scores, selected_league['roster_positions'])
-        team1_after_optimized = optimize_starters_projections(team1_after_scores, selected_league['roster_positions'])
-        team2_before_optimized = optimize_starters_projections(team2_before_scores, selected_league['roster_positions'])
-        team2_after_optimized = optimize_starters_projections(team2_after_scores, selected_league['roster_positions'])
-        # Sum up the total score for each team
-        team1_before_score = get_total_score(team1_before_optimized)
-        team1_after_score = get_total_score(team1_after_optimized)
-        team2_before_score = get_total_score(team2_before_optimized)
-        team2_after_score = get_total_score(team2_after_optimized)
-        # Add total scores to running totals
-        team1_before_total += team1_before_score
-        team1_after_total += team1_after_score
-        team2_before_total += team2_before_score
-        team2_after_total += team2_after_score
-    # Calculate the differences between after and before rosters
-    team1_difference = team1_after_total - team1_before_total
-    team2_difference = team2_after_total - team2_before_total
-    return round(team1_difference, 2), round(team2_difference, 2)
-
-
-
-def calculate_average_rankings(players_with_ros_rankings: list) -> float:
-    """
-    Calculates average ROS fantasy pros ranking for all players in a list. Used in trade analysis.
+    rosters = {roster['roster_id']: get_user_roster_players(player_data, roster) for roster in league_rosters}
+    standings = {
+        roster['roster_id']: {
+            'owner_id': roster['owner_id'],
+            'wins': roster['settings'].get('wins', 0),
+            'losses': roster['settings'].get('losses', 0),
+            'ties': roster['settings'].get('ties', 0),
+            'points_for': roster['settings'].get('fpts', 0) + roster['settings'].get('fpts_decimal', 0) / 100,
+        }
+        for roster in league_rosters
+    }
+    num_weeks = max(get_end_week(selected_league) - current_state['week'] + 1, 0)
+    return rank_league(rosters, standings, get_season_score_table(selected_league, current_state), selected_league['roster_positions'], num_weeks)
+
+
+
+def get_owner_roster_players(league_rosters: list, player_data: dict, selected_league: dict, current_state: dict) -> dict:
     """
-    
-    if not players_with_ros_rankings:
-        return 420
-    
-    # Replace "unranked" with 420 in the list
-    modified_rankings = [420 if player["ros_ecr_ranking"] == "unranked" else player["ros_ecr_ranking"] for player in players_with_ros_rankings]
+    Owner ID -> list of player dictionaries on their roster, taken from the league's power rankings batch. Rosters without an
+    owner are left out.
+    """
+    teams = get_league_power_rankings(league_rosters, player_data, selected_league, current_state)
+    return {team['owner_id']: team['players'] for team in teams if team['owner_id']}
+
+
+
+# Keyed on the league, user and week rather than hashing every roster in the league
+@keyed_cache(key=lambda league_rosters, user_info, player_data, selected_league, current_state: (selected_league['league_id'], user_info['user_id'], current_state['league_season'], current_state['week']), maxsize=64, ttl=SLEEPER_TTL)
+@timed()
+def find_league_trades(league_rosters: list, user_info: dict, player_data: dict, selected_league: dict, current_state: dict) -> list:
+    """
+    Searches every other roster in the league for the 1-for-1, 2-for-1, 1-for-2 and 2-for-2 trades that most improve the user's
+    optimal projected points for the rest of the season without costing the other team any. See trade_finder.TradeFinder.
+
+    Returns:
+      list of dictionaries with owner_id, give and receive (lists of player dictionaries), user_gain and partner_gain, best first
+    """
+    owner_rosters = get_owner_roster_players(league_rosters, player_data, selected_league, current_state)
+    if user_info['user_id'] not in owner_rosters:
+        return []
+
+    # Rosters without an owner can't trade
+    other_rosters = {owner_id: players for owner_id, players in owner_rosters.items() if owner_id != user_info['user_id']}
+    user_roster_players = owner_rosters[user_info['user_id']]
+
+    weeks = range(current_state['week'], get_end_week(selected_league) + 1)
+    weeks_stats = [week_stats or build_stat_matrix({}) for week_stats in get_season_week_stats('regular', current_state['league_season'], weeks)]
+    return find_trades(user_roster_players, other_rosters, weeks_stats, selected_league['scoring_settings'], selected_league['roster_positions'])
+
+
+
+
+# Keyed on the league and weeks. Past matchups never change, and future ones only when the commissioner edits the schedule
+@keyed_cache(key=lambda league_id, weeks: (league_id, tuple(weeks)), maxsize=32, ttl=SLEEPER_TTL)
+@timed()
+def get_league_schedule(league_id: Union[str,int], weeks: list) -> list:
+    """
+    Gets the matchups for several weeks of a league, with every week requested at the same time
+
+    Returns:
+      list of (week, roster_id, roster_id) for each matchup, or None if any week couldn't be fetched (not cached, so the
+      next call tries again rather than simulating a season with games missing)
+    """
+    weeks = list(weeks)
+    week_matchups = sleeper.fetch_many([f'league/{league_id}/matchups/{week}' for week in weeks])
+    failed_weeks = [week for week, matchups in zip(weeks, week_matchups) if matchups is None]
+    if failed_weeks:
+        print(f"Error: couldn't get league {league_id} matchups for weeks {failed_weeks}")
+        return None
+
+    schedule = []
+    for week, matchups in zip(weeks, week_matchups):
+        # Both teams in a matchup share a matchup_id. Teams without one have no game that week
+        teams = {}
+        for matchup in matchups:
+            if matchup.get('matchup_id') is not None:
+                teams.setdefault(matchup['matchup_id'], []).append(matchup['roster_id'])
+        schedule.extend((week, pair[0], pair[1]) for pair in teams.values() if len(pair) == 2)
+    return schedule
+
+
+
+# Keyed on the league and week rather than hashing every roster in the league
+@keyed_cache(key=lambda league_rosters, player_data, selected_league, current_state: (selected_league['league_id'], current_state['league_season'], current_state['week']), maxsize=16, ttl=SLEEPER_TTL)
+@timed()
+def get_season_simulator(league_rosters: list, player_data: dict, selected_league: dict, current_state: dict) -> Optional[SeasonSimulator]:
+    """
+    Sets up a Monte Carlo simulation of the rest of the league's season (remaining schedule, standings so far, every roster's
+    projections and injury statuses), see season_simulator.SeasonSimulator. None (and not cached) if the schedule couldn't
+    be fetched.
+    """
+    settings = selected_league['settings']
+    current_week = current_state['week']
+    weeks = list(range(current_week, get_end_week(selected_league) + 1))
+
+    teams = get_league_power_rankings(league_rosters, player_data, selected_league, current_state)
+    rosters = {team['roster_id']: team['players'] for team in teams}
+    standings = {team['roster_id']: (team['wins'], team['ties'], team['points_for']) for team in teams}
+    schedule = get_league_schedule(selected_league['league_id'], range(current_week, settings['playoff_week_start']))
+    if schedule is None:
+        return None
+
+    return SeasonSimulator(
+        rosters, standings, schedule, get_season_score_table(selected_league, current_state), weeks, selected_league['roster_positions'],
+        settings['playoff_teams'], settings['playoff_week_start'], settings.get('playoff_round_type', 0),
+    )
+
+
 
-    # Calculate the average
-    average_ranking = sum(modified_rankings) / len(modified_rankings)
+@timed()
+def calculate_trade_odds(league_rosters: list, player_data: dict, user_id: Union[str,int], trade_user_id: Union[str,int], user_selected_players: list, trade_selected_players: list, selected_league: dict, current_state: dict) -> dict:
+    """
+    Used in trade analysis. Playoff and championship odds for both teams before and after the trade, from simulating the rest of the season
+
+    Returns:
+      dictionary with 'user' and 'trade' entries, each {'before': odds, 'after': odds}, or None if the odds can't be worked
+      out (a roster or the league's schedule couldn't be found)
+    """
+    simulator = get_season_simulator(league_rosters, player_data, selected_league, current_state)
+    user_roster = get_user_roster_info(league_rosters, user_id)
+    trade_roster = get_user_roster_info(league_rosters, trade_user_id)
+    if simulator is None or user_roster is None or trade_roster is None:
+        return None
 
-    return round(average_ranking, 2)
+    odds = simulator.trade_odds(user_roster['roster_id'], trade_roster['roster_id'], user_selected_players, trade_selected_players)
+    return {'user': odds[user_roster['roster_id']], 'trade': odds[trade_roster['roster_id']]}
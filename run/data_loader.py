@@ -0,0 +1,103 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterable, Optional
+
+
+class DataLoader:
+    """
+    Runs a graph of data fetches on a thread pool. Each fetch starts as soon as the fetches it depends on have finished, so
+    independent branches (the NFL state, the player dump, the user's avatar and leagues) load at the same time and the total wait
+    is the longest chain of dependent calls instead of the sum of all of them.
+
+    Arguments:
+      - max_workers: most fetches running at once
+      - initializer: called in each worker thread before it runs anything (for example to attach the Streamlit script context)
+    """
+
+    def __init__(self, max_workers: int = 6, initializer: Optional[Callable] = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, initializer=initializer, thread_name_prefix='data-loader')
+        self.futures = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'DataLoader':
+        return self
+
+    def __exit__(self, *exc_info):
+        # Fetches still running finish in the background and fill the shared caches for the next rerun
+        self.executor.shutdown(wait=False)
+
+    def add(self, name: str, function: Callable, *args, needs: Iterable[str] = ()) -> Future:
+        """
+        Schedules function(*args, *results of needs) to run once every fetch it needs has finished. If one of those fails, this
+        fetch fails with the same error without running.
+
+        Arguments:
+          - name: name the result is looked up by
+          - function: the fetch to run
+          - args: arguments passed before the results of needs
+          - needs: names of fetches (already added) whose results are passed to function, in order
+        """
+        dependencies = [self.futures[need] for need in needs]
+        future = Future()
+        self.futures[name] = future
+        remaining = [len(dependencies)]
+
+        def submit():
+            try:
+                values = [dependency.result() for dependency in dependencies]
+            except Exception as error:
+                future.set_exception(error)
+                return
+            try:
+                self.executor.submit(function, *args, *values).add_done_callback(lambda done: _copy_future(done, future))
+            except RuntimeError as error:
+                # The page finished without waiting for this fetch and the pool has been shut down
+                future.set_exception(error)
+
+        def dependency_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                submit()
+
+        if not dependencies:
+            submit()
+        for dependency in dependencies:
+            dependency.add_done_callback(dependency_done)
+        return future
+
+    def set(self, name: str, value) -> Future:
+        """
+        Adds a result that is already known (kept from an earlier run) so fetches that need it can still name it
+        """
+        future = Future()
+        future.set_result(value)
+        self.futures[name] = future
+        return future
+
+    def done(self, name: str) -> bool:
+        return self.futures[name].done()
+
+    def result(self, name: str):
+        """
+        Waits for a fetch to finish and returns its result
+        """
+        return self.futures[name].result()
+
+    def as_completed(self, names: Iterable[str]):
+        """
+        Yields (name, result) for each of the fetches as it finishes, so the page can draw each piece as soon as it arrives
+        """
+        pending = {self.futures[name]: name for name in names}
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield pending.pop(future), future.result()
+
+
+def _copy_future(source: Future, target: Future):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
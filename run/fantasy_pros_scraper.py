@@ -1,24 +1,49 @@
-from bs4 import BeautifulSoup
-import requests
 import re
 import json
-import streamlit as st
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Optional
+from sleeper_client import PooledClient, sleeper
+from rankings_cache import RankingsCache, rankings_key, WEEKLY_TTL
+from rankings_index import RankingsIndex
+from storage import data_path
+from metrics import timed
+
+# orjson is several times faster than json for the rankings payload, but is optional
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+
+base_url = "https://www.fantasypros.com/nfl/rankings/"
+
+# Shared keep-alive session for every FantasyPros page. Only one retry, since the pages are scraped under a deadline
+fantasy_pros = PooledClient(retries=1, timeout=(3.05, 5))
+
+ECR_MARKER = b"var ecrData = "
+
+# End of the ecrData assignment. A semicolon can only appear inside a JSON string, and JSON strings can't contain a raw
+# newline, so "};" followed by a newline (or the end of the script tag) can only be the end of the statement
+ECR_END = re.compile(rb"\};[ \t]*(?:\r?\n|</script>)")
+
+# Most time the weekly rankings for all of a league's positions are allowed to take, in seconds
+RANKINGS_DEADLINE = 10
+
+# Every page the background warmer keeps scraped
+WARM_FORMATS = ('standard', 'half-ppr', 'ppr')
+WARM_POSITIONS = ('QB', 'RB', 'WR', 'TE', 'K', 'DEF', 'FLEX', 'SUPER_FLEX')
+
 
 # Format can be "standard", "half-point-ppr", or "ppr"
 # Position can be "rb", "qb", "wr", "te", "k", "flex", or "superflex"
-@st.cache_data(show_spinner = False)
-def scrape_fantasy_pros(position: str, format: str, ros: str) -> list:
-    """ 
-    Arguments:
-      - position: string indicating which position to get the rankings for
-      - format: either standard, half-ppr, or ppr so the right rankings are scraped
-      - ros: either yes or no to indicate whether to grab weekly rankings or rest of season rankings. For rest of season rankings, position
-             doesn't matter as FantasyPros does overall rankings, so it grabs those instead of rankings for each position.
-    Returns:
-      expert consensus rankings in the form of a list of dictionaries with player info
+def fantasy_pros_link(position: str, format: str, ros: str) -> str:
+    """
+    Link to the FantasyPros rankings page for a position/format. See scrape_fantasy_pros for the arguments.
     """
-    base_url = "https://www.fantasypros.com/nfl/rankings/"
-
     if ros == "yes":
         # If ROS is yes
         ros_suffix = "ros-"
@@ -39,39 +64,187 @@ def scrape_fantasy_pros(position: str, format: str, ros: str) -> list:
           else: 
             link = f"{base_url}{format_suffix}{position.lower()}.php"
 
-    results = requests.get(link, timeout=5)
-    soup = BeautifulSoup(results.text, "html.parser")
+    return link
+
+
+@timed()
+def fetch_rankings(link: str, timeout=None) -> Optional[list]:
+    """
+    Downloads a FantasyPros rankings page and pulls the expert consensus rankings out of it. Returns None if the page couldn't
+    be downloaded or didn't contain rankings. Safe to call from worker threads (no streamlit calls).
+    """
+    kwargs = {'timeout': timeout} if timeout is not None else {}
+    results = fantasy_pros.get(link, **kwargs)
+    if results is None or results.status_code != 200:
+        return None
+
+    return extract_ecr_players(results.content)
+
+
+@timed()
+def extract_ecr_players(content: bytes) -> Optional[list]:
+    """
+    Pulls the players list out of the "var ecrData = {...};" assignment in a FantasyPros page without parsing the HTML.
+    Finds the assignment directly in the response bytes and decodes only that JSON.
+    """
+    start = content.find(ECR_MARKER)
+    if start == -1:
+        return None
+    start += len(ECR_MARKER)
+
+    end = ECR_END.search(content, start)
+    if end:
+        try:
+            return _loads(content[start:end.start() + 1])["players"]
+        except (ValueError, KeyError):
+            pass
+
+    # Unusual page layout, so let the JSON decoder find where the object ends on its own
+    try:
+        data, _ = json.JSONDecoder().raw_decode(content[start:].decode("utf-8", errors="replace"))
+        return data["players"]
+    except (ValueError, KeyError):
+        return None
+
+
+def scrape_key(key: tuple, timeout=None) -> Optional[list]:
+    """
+    Scrapes the page for a rankings cache key (see rankings_cache.rankings_key)
+    """
+    format, position, kind, week = key
+    # Format-independent pages are stored under format "any"
+    format = "standard" if format == "any" else format
+    ros = "yes" if kind == "ros" else "no"
+    return fetch_rankings(fantasy_pros_link(position=position, format=format, ros=ros), timeout=timeout)
+
+
+@lru_cache(maxsize=1)
+def get_rankings_cache() -> RankingsCache:
+    """
+    Shared on-disk rankings cache, created on first use
+    """
+    return RankingsCache(data_path('rankings'), fetch=scrape_key)
+
+
+@timed()
+def scrape_fantasy_pros(position: str, format: str, ros: str, week: int = None) -> Optional[RankingsIndex]:
+    """ 
+    Arguments:
+      - position: string indicating which position to get the rankings for
+      - format: either standard, half-ppr, or ppr so the right rankings are scraped
+      - ros: either yes or no to indicate whether to grab weekly rankings or rest of season rankings. For rest of season rankings, position
+             doesn't matter as FantasyPros does overall rankings, so it grabs those instead of rankings for each position.
+      - week: NFL week the rankings are for. Part of the cache key so last week's rankings aren't served after the week changes
+    Returns:
+      expert consensus rankings (the list of dictionaries with player info) indexed for the ranking joins, see
+      rankings_index.RankingsIndex. Served from the shared rankings cache when possible, and None if the page couldn't be scraped.
+    """
+    return get_rankings_cache().get(rankings_key(position, format, ros, week))
 
-    scripts = soup.find_all("script")
-    for script in scripts:
-        if script.string:
-            ecr = re.search("var ecrData = {.*};", script.string)
-            if ecr:
-                temp = ecr.group(0).replace("var ecrData = ", "").replace(";", "")
-                data = json.loads(temp)
-                return data["players"]
-            
 
 
-@st.cache_data(show_spinner = False)
 # Get the weekly rankings for each position in a set
-def get_weekly_rankings(position_set: set, format: str) -> dict:
+@timed()
+def get_weekly_rankings(position_set: set, format: str, week: int = None, deadline: float = RANKINGS_DEADLINE) -> dict:
     """ Takes the set of starting positions for the specific league and gets the fantasy pros ranking for each of those positions.
         (Fantasypros doesn't have overall rankings for each week, so we have to get the individual position rankings for each week.)
+        Positions in the shared rankings cache are served from it. The rest are scraped at the same time over one shared
+        session, with the whole thing capped at one deadline.
     Arguments:
       - position_set: the set of positions in a starting lineup (based on league settings)
       - format: either standard, half-ppr, or ppr so the right rankings are scraped
+      - week: NFL week the rankings are for
+      - deadline: most seconds to wait for the pages that have to be scraped
+    Returns:
+      position_rankings: dictionary containing the weekly rankings for each position, indexed like scrape_fantasy_pros returns
+                         them. Positions whose page failed or didn't finish before the deadline are None.
+    """
+    rankings_cache = get_rankings_cache()
+    keys = {position: rankings_key(position, format, "no", week) for position in position_set}
+
+    # Anything stored (even if a little stale) is used right away
+    position_rankings = {position: rankings_cache.lookup(key)[0] for position, key in keys.items()}
+    missing_positions = [position for position, rankings in position_rankings.items() if rankings is None]
+    if not missing_positions:
+        return position_rankings
+
+    deadline_at = time.monotonic() + deadline
+
+    def scrape_before_deadline(position: str) -> Optional[RankingsIndex]:
+        # Each request only gets whatever is left of the shared deadline
+        remaining = max(deadline_at - time.monotonic(), 0.1)
+        return rankings_cache.refresh(keys[position], timeout=(min(3.05, remaining), remaining))
+
+    # Scrape Fantasy Pros rankings for every missing position at the same time
+    futures = {fantasy_pros.executor.submit(scrape_before_deadline, position): position for position in missing_positions}
+    done, not_done = wait(futures, timeout=deadline)
+
+    # Store the rankings in the dictionary, keeping whatever finished
+    for future in done:
+        try:
+            position_rankings[futures[future]] = future.result()
+        except Exception as error:
+            print(f"Error scraping {futures[future]} rankings: {error}")
+    for future in not_done:
+        future.cancel()
+        print(f"{futures[future]} rankings didn't finish before the deadline")
+
+    return position_rankings
+
+
+@timed()
+def warm_rankings_cache(week: int) -> int:
+    """
+    Scrapes every standard/half-ppr/ppr x position page (plus rest of season rankings) that isn't fresh in the rankings cache,
+    so user sessions find them already there.
+
     Returns:
-      position_rankings: dictionary containing the weekly rankings for each position
+      number of pages scraped
     """
-    position_rankings = {}
+    rankings_cache = get_rankings_cache()
+    keys = {rankings_key(position, format, "no", week) for format in WARM_FORMATS for position in WARM_POSITIONS}
+    keys |= {rankings_key(None, format, "yes", week) for format in WARM_FORMATS}
+    stale_keys = [key for key in keys if not rankings_cache.lookup(key, revalidate=False)[1]]
+
+    # A separate small pool, so warming never holds up the threads user requests scrape on
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix='rankings-warmer') as executor:
+        results = list(executor.map(rankings_cache.refresh, stale_keys))
+    return sum(rankings is not None for rankings in results)
+
+
+_warmer_started = False
+_warmer_lock = threading.Lock()
+
+
+def start_rankings_warmer(interval: float = WEEKLY_TTL / 2) -> bool:
+    """
+    Starts a background thread that re-warms the rankings cache every interval seconds. Only one warmer runs per process.
+
+    Returns:
+      True if this call started the warmer
+    """
+    global _warmer_started
+    with _warmer_lock:
+        if _warmer_started:
+            return False
+        _warmer_started = True
+
+    def run():
+        while True:
+            current_state = sleeper.get_json('state/nfl')
+            if current_state:
+                try:
+                    warm_rankings_cache(current_state['week'])
+                except Exception as error:
+                    print(f"Error warming rankings cache: {error}")
+            time.sleep(interval)
 
-    # Loop through each position in the set
-    for position in position_set:
-        # Scrape Fantasy Pros rankings for the current position
-        rankings = scrape_fantasy_pros(position=position, format=format, ros="no")
+    threading.Thread(target=run, daemon=True, name='rankings-warmer').start()
+    return True
 
-        # Store the rankings in the dictionary
-        position_rankings[position] = rankings
 
-    return position_rankings
\ No newline at end of file
+if __name__ == "__main__":
+    # Warm the cache once, e.g. from a cron job before game days
+    current_state = sleeper.get_json('state/nfl')
+    if current_state:
+        print(f"Scraped {warm_rankings_cache(current_state['week'])} rankings pages")
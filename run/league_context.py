@@ -0,0 +1,104 @@
+import time
+from typing import Optional
+from data_functions import (SLEEPER_TTL, get_format, get_starting_positions_set, optimize_starters_projections, add_weekly_rankings,
+                            optimize_starting_lineup_rankings, add_ros_rankings)
+from fantasy_pros_scraper import get_weekly_rankings, scrape_fantasy_pros
+from rankings_index import RankingsIndex
+
+
+# Fields of a LeagueContext that only depend on the user, so picking another league can reuse them
+USER_FIELDS = ('user_info', 'current_state', 'user_leagues', 'thumbnail_image', 'player_data', 'projections')
+
+
+class LeagueContext:
+    """
+    Everything the pages show for one user's league in one week, built once and kept in st.session_state so reruns (widget
+    clicks, page switches) reuse it instead of building and scoring the roster again. It is read-only: when the username,
+    league or week changes, or it gets older than SLEEPER_TTL, a new one is built.
+
+    Lineups and rankings are worked out the first time a page asks for them and kept for the rest of the context's life.
+
+    Arguments:
+      - username: the Sleeper username entered
+      - user_info, current_state, user_leagues, thumbnail_image, player_data, projections: what was loaded for the user
+      - selected_league: the league picked
+      - league_rosters: every roster in the league
+      - user_roster_players: the user's players
+      - roster_with_projected_scores: the user's players with this week's projected points
+    """
+
+    def __init__(self, username: str, user_info: dict, current_state: dict, user_leagues: list, thumbnail_image, player_data: dict,
+                 projections, selected_league: dict, league_rosters: list, user_roster_players: list, roster_with_projected_scores: list):
+        fields = {
+            'username': username,
+            'user_info': user_info,
+            'current_state': current_state,
+            'user_leagues': tuple(user_leagues),
+            'thumbnail_image': thumbnail_image,
+            'player_data': player_data,
+            'projections': projections,
+            'selected_league': selected_league,
+            'league_rosters': tuple(league_rosters),
+            'user_roster_players': tuple(user_roster_players),
+            'roster_with_projected_scores': tuple(roster_with_projected_scores),
+            'format': get_format(selected_league['scoring_settings']['rec']),
+            'starting_positions': frozenset(get_starting_positions_set(selected_league)),
+            'key': (username, selected_league['league_id'], current_state['week']),
+            'created': time.monotonic(),
+            '_derived': {},
+        }
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("LeagueContext is read-only, build a new one instead")
+
+    def expired(self, ttl: float = SLEEPER_TTL) -> bool:
+        return time.monotonic() - self.created >= ttl
+
+    def user_fields(self) -> dict:
+        return {name: getattr(self, name) for name in USER_FIELDS}
+
+    def _derive(self, name: str, build, complete=bool):
+        """
+        Builds a value the first time it is asked for. Values that came back incomplete (a rankings page that failed or timed out)
+        aren't kept, so the next rerun tries again.
+        """
+        if name not in self._derived:
+            value = build()
+            if not complete(value):
+                return value
+            self._derived[name] = value
+        return self._derived[name]
+
+    def projected_lineup(self) -> tuple:
+        """
+        Highest projected starting lineup for this week
+        """
+        return self._derive('projected_lineup', lambda: tuple(optimize_starters_projections(list(self.roster_with_projected_scores), self.selected_league['roster_positions'])), complete=lambda value: True)
+
+    def expert_lineup(self) -> tuple:
+        """
+        Starting lineup recommended by this week's FantasyPros expert consensus rankings
+        """
+        def build():
+            position_rankings = get_weekly_rankings(self.starting_positions, self.format, self.current_state['week'])
+            roster_with_weekly_rankings = add_weekly_rankings(list(self.user_roster_players), position_rankings, "fantasy_names.db")
+            lineup = tuple(optimize_starting_lineup_rankings(roster_with_weekly_rankings, self.selected_league['roster_positions']))
+            return lineup, all(rankings is not None for rankings in position_rankings.values())
+
+        lineup, _ = self._derive('expert_lineup', build, complete=lambda value: value[1])
+        return lineup
+
+    def ros_rankings(self) -> Optional[RankingsIndex]:
+        """
+        Rest of season FantasyPros expert consensus rankings for the league's format, indexed for add_ros_rankings
+        """
+        return self._derive('ros_rankings', lambda: scrape_fantasy_pros(position=None, format=self.format, ros="yes", week=self.current_state['week']))
+
+    def roster_ros_rankings(self) -> tuple:
+        """
+        The user's players with their rest of season rankings
+        """
+        ros_rankings = self.ros_rankings()
+        return self._derive('roster_ros_rankings', lambda: tuple(add_ros_rankings(list(self.user_roster_players), ros_rankings or [], "fantasy_names.db")), complete=lambda value: bool(ros_rankings))
@@ -0,0 +1,346 @@
+import numpy as np
+from functools import lru_cache
+from itertools import product
+from math import prod
+
+
+# Positions that can fill each flex-style slot. Any other slot is filled only by its own position
+SLOT_ELIGIBILITY = {
+    'FLEX': frozenset({'RB', 'WR', 'TE'}),
+    'SUPER_FLEX': frozenset({'QB', 'RB', 'WR', 'TE'}),
+    'REC_FLEX': frozenset({'WR', 'TE'}),
+    'WRRB_FLEX': frozenset({'WR', 'RB'}),
+    'IDP_FLEX': frozenset({'DL', 'LB', 'DB'}),
+}
+
+# Added to every real player/slot pairing in the assignment problem so the solver always fills as many slots as it can,
+# even with players projected for negative points (an empty slot scores 0)
+FILL_BONUS = 1e6
+
+# Cost of a pairing that isn't allowed. Always worse than leaving the slot empty
+FORBIDDEN = 1e9
+
+# Most position combinations (from multi-position players) tried for one roster in batch_lineup_totals before falling back
+# to solving each week on its own
+MAX_POSITION_COMBINATIONS = 16
+
+
+def eligible_positions(slot: str) -> frozenset:
+    return SLOT_ELIGIBILITY.get(slot, frozenset({slot}))
+
+
+def starting_slots(roster_positions: list) -> tuple:
+    """
+    Starting lineup slots from a league's roster_positions. Everything from the first bench slot on is ignored.
+    """
+    slots = []
+    for position in roster_positions:
+        if position == 'BN':
+            break
+        slots.append(position)
+    return tuple(slots)
+
+
+class SlotPlan:
+    """
+    Precomputed layout of a league's starting slots, shared by every roster in the league.
+
+    Attributes:
+      - slots: the starting slots in lineup order
+      - groups: (eligible positions, slot indices) for each distinct slot type, narrowest slot types first
+      - positions: every position that can fill at least one slot
+      - laminar: True if any two slot types either share no positions or one's positions contain the other's. For those
+                 leagues, filling the narrowest slots first with the best remaining player is exact for single-position players.
+      - components: (positions, slot indices) for each set of slots linked by sharing positions (with a FLEX slot, the RB,
+                    WR, TE and FLEX slots are one component and K is another). Each component's slots are filled
+                    independently of the rest, except by players whose positions span two components.
+    """
+
+    def __init__(self, slots: tuple):
+        self.slots = slots
+
+        slot_types = {}
+        for index, slot in enumerate(slots):
+            slot_types.setdefault(eligible_positions(slot), []).append(index)
+        self.groups = sorted(slot_types.items(), key=lambda group: (len(group[0]), group[1][0]))
+
+        self.positions = frozenset().union(*slot_types) if slot_types else frozenset()
+        position_sets = list(slot_types)
+        self.laminar = all(
+            not (first & second) or first <= second or second <= first
+            for i, first in enumerate(position_sets) for second in position_sets[i + 1:]
+        )
+
+        components = []
+        for group_positions, slot_indices in self.groups:
+            linked = [component for component in components if component[0] & group_positions]
+            for component in linked:
+                components.remove(component)
+            positions = frozenset(group_positions).union(*(component[0] for component in linked))
+            indices = tuple(sorted(set(slot_indices).union(*(component[1] for component in linked))))
+            components.append((positions, indices))
+        self.components = components
+
+
+@lru_cache(maxsize=256)
+def slot_plan(slots: tuple) -> SlotPlan:
+    return SlotPlan(slots)
+
+
+def _greedy_assignment(plan: SlotPlan, scores: list, positions: list) -> list:
+    """
+    Fills the narrowest slot types first, each with the best players still available. Exact when the plan is laminar and
+    every player has a single relevant position.
+    """
+    assignment = [None] * len(plan.slots)
+    order = sorted(range(len(scores)), key=lambda player: -scores[player])
+    used = set()
+
+    for group_positions, slot_indices in plan.groups:
+        open_slots = iter(slot_indices)
+        slot = next(open_slots, None)
+        for player in order:
+            if slot is None:
+                break
+            if player not in used and positions[player] and positions[player][0] in group_positions:
+                assignment[slot] = player
+                used.add(player)
+                slot = next(open_slots, None)
+
+    return assignment
+
+
+def _prune_candidates(plan: SlotPlan, scores: list, eligible_slots: list) -> list:
+    """
+    Players who can fill exactly the same slots are interchangeable, so only the best len(slots) of each such group can be
+    in an optimal lineup. Returns the indices of the players worth considering.
+    """
+    groups = {}
+    for player, slots in enumerate(eligible_slots):
+        if slots:
+            groups.setdefault(slots, []).append(player)
+
+    candidates = []
+    for slots, players in groups.items():
+        players.sort(key=lambda player: -scores[player])
+        candidates.extend(players[:len(slots)])
+    return candidates
+
+
+def _hungarian(cost: list) -> list:
+    """
+    Minimum cost assignment for an n x m cost matrix with n <= m (shortest augmenting path version of the Hungarian
+    algorithm, O(n^2 m)). Returns the column assigned to each row.
+    """
+    n, m = len(cost), len(cost[0])
+    infinity = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    match = [0] * (m + 1)
+    way = [0] * (m + 1)
+
+    for row in range(1, n + 1):
+        match[0] = row
+        column0 = 0
+        min_value = [infinity] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[column0] = True
+            row0 = match[column0]
+            delta = infinity
+            column1 = 0
+            cost_row = cost[row0 - 1]
+            for column in range(1, m + 1):
+                if not used[column]:
+                    current = cost_row[column - 1] - u[row0] - v[column]
+                    if current < min_value[column]:
+                        min_value[column] = current
+                        way[column] = column0
+                    if min_value[column] < delta:
+                        delta = min_value[column]
+                        column1 = column
+            for column in range(m + 1):
+                if used[column]:
+                    u[match[column]] += delta
+                    v[column] -= delta
+                else:
+                    min_value[column] -= delta
+            column0 = column1
+            if match[column0] == 0:
+                break
+        while True:
+            column1 = way[column0]
+            match[column0] = match[column1]
+            column0 = column1
+            if column0 == 0:
+                break
+
+    assignment = [None] * n
+    for column in range(1, m + 1):
+        if match[column]:
+            assignment[match[column] - 1] = column - 1
+    return assignment
+
+
+def _exact_assignment(plan: SlotPlan, scores: list, positions: list) -> list:
+    """
+    Solves the lineup as a max-weight bipartite matching between slots and players. Works for any mix of slots and
+    multi-position players.
+    """
+    slots = plan.slots
+    if not slots:
+        return []
+    eligible_slots = [
+        frozenset(index for index, slot in enumerate(slots) if any(position in eligible_positions(slot) for position in player_positions))
+        for player_positions in positions
+    ]
+    candidates = _prune_candidates(plan, scores, eligible_slots)
+
+    # One column per candidate plus one "empty" column per slot, so every slot can always be assigned
+    cost = [
+        [-(FILL_BONUS + scores[player]) if index in eligible_slots[player] else FORBIDDEN for player in candidates] + [0.0] * len(slots)
+        for index in range(len(slots))
+    ]
+    columns = _hungarian(cost)
+    return [candidates[column] if column < len(candidates) else None for column in columns]
+
+
+def solve_lineup(scores: list, positions: list, slots: tuple) -> tuple:
+    """
+    Finds the starting lineup with the highest total score.
+
+    Arguments:
+      - scores: projected points for each player
+      - positions: fantasy positions for each player (same order as scores)
+      - slots: starting lineup slots, as returned by starting_slots
+    Returns:
+      assignment: the index of the player in each slot, or None for a slot nobody can fill
+      total: total score of the lineup
+    """
+    plan = slot_plan(tuple(slots))
+
+    # Positions that can't fill any slot don't matter
+    relevant_positions = [[position for position in (player_positions or []) if position in plan.positions] for player_positions in positions]
+
+    if plan.laminar and all(len(player_positions) <= 1 for player_positions in relevant_positions):
+        assignment = _greedy_assignment(plan, scores, relevant_positions)
+    else:
+        assignment = _exact_assignment(plan, scores, relevant_positions)
+
+    total = sum(scores[player] for player in assignment if player is not None)
+    return assignment, total
+
+
+def optimal_lineup(player_list: list, roster_positions: list, score_key: str = 'projected_points') -> tuple:
+    """
+    Optimal starting lineup for a roster of player dictionaries (or records.Player records).
+
+    Returns:
+      lineup: a copy of the player in each starting slot with 'position' set to the slot, or an EMPTY placeholder
+      total: total score of the lineup
+    """
+    slots = starting_slots(roster_positions)
+    scores = [player.get(score_key) or 0 for player in player_list]
+    positions = [player.get('fantasy_positions') or [] for player in player_list]
+    assignment, total = solve_lineup(scores, positions, slots)
+
+    lineup = [
+        _in_slot(player_list[player], slot) if player is not None else {'position': slot, 'full_name': 'EMPTY', score_key: 0}
+        for slot, player in zip(slots, assignment)
+    ]
+    return lineup, total
+
+
+def _in_slot(player, slot: str):
+    # A copy, so the roster's own players don't get a position
+    starter = player.copy()
+    starter['position'] = slot
+    return starter
+
+
+
+def _laminar_totals(plan: SlotPlan, scores: np.ndarray, position_codes: np.ndarray, plan_positions: list) -> np.ndarray:
+    """
+    Optimal lineup totals for a block of rosters whose players each have at most one relevant position, in one vectorized
+    pass. Same narrowest-slots-first fill as _greedy_assignment: players are sorted best first once, then each slot type
+    takes the first players in that order who are eligible and not already starting.
+
+    Arguments:
+      - scores: (rosters, weeks, players) array with -inf for players who aren't available
+      - position_codes: (rosters, players) index into plan_positions for each player, -1 for none
+    """
+    order = np.argsort(-scores, axis=-1, kind='stable')
+    sorted_scores = np.take_along_axis(scores, order, axis=-1)
+    sorted_codes = np.take_along_axis(np.broadcast_to(position_codes[:, None, :], scores.shape), order, axis=-1)
+    open_players = np.isfinite(sorted_scores)
+    totals = np.zeros(scores.shape[:2])
+
+    for group_positions, slot_indices in plan.groups:
+        # Lookup table from position code to eligibility, with the last entry for code -1
+        eligible = np.array([position in group_positions for position in plan_positions] + [False])
+        candidates = eligible[sorted_codes] & open_players
+        starters = candidates & (np.cumsum(candidates, axis=-1, dtype=np.int16) <= len(slot_indices))
+
+        # Slots nobody can fill score 0
+        totals += np.where(starters, sorted_scores, 0).sum(axis=-1)
+        open_players &= ~starters
+
+    return totals
+
+
+def batch_lineup_totals(scores: np.ndarray, positions: list, roster_positions: list) -> np.ndarray:
+    """
+    Optimal starting lineup totals for many rosters over many weeks at once.
+
+    Arguments:
+      - scores: (rosters, weeks, players) array of projected points. Use NaN for players with no projection that week and
+                to pad shorter rosters.
+      - positions: fantasy positions for each player of each roster, positions[roster][player]
+      - roster_positions: the league's roster_positions
+    Returns:
+      (rosters, weeks) array of lineup totals
+    """
+    scores = np.asarray(scores, dtype=float)
+    plan = slot_plan(starting_slots(roster_positions))
+    plan_positions = sorted(plan.positions)
+    codes = {position: code for code, position in enumerate(plan_positions)}
+    num_rosters, num_weeks, num_players = scores.shape
+    totals = np.zeros((num_rosters, num_weeks))
+
+    # Every player in an optimal lineup plays one of their positions, so a roster with multi-position players is solved
+    # exactly by trying each way of giving them a single position and keeping the best total. Each of those is a row for
+    # the vectorized fill. Rosters with too many combinations (or leagues it isn't exact for) are solved one week at a time.
+    fast_rows = []
+    fast_codes = []
+    for roster, roster_player_positions in enumerate(positions):
+        relevant_positions = [[position for position in (player_positions or []) if position in plan.positions] for player_positions in roster_player_positions]
+        multi_position_players = [player for player, player_positions in enumerate(relevant_positions) if len(player_positions) > 1]
+        combinations = prod(len(relevant_positions[player]) for player in multi_position_players)
+
+        if plan.laminar and combinations <= MAX_POSITION_COMBINATIONS:
+            roster_codes = np.full(num_players, -1)
+            for player, player_positions in enumerate(relevant_positions):
+                if len(player_positions) == 1:
+                    roster_codes[player] = codes[player_positions[0]]
+            for combination in product(*(relevant_positions[player] for player in multi_position_players)):
+                row_codes = roster_codes.copy()
+                row_codes[multi_position_players] = [codes[position] for position in combination]
+                fast_rows.append(roster)
+                fast_codes.append(row_codes)
+        else:
+            for week in range(num_weeks):
+                available = [player for player in range(len(roster_player_positions)) if not np.isnan(scores[roster, week, player])]
+                totals[roster, week] = solve_lineup([scores[roster, week, player] for player in available], [relevant_positions[player] for player in available], plan.slots)[1]
+
+    if fast_rows and plan.groups:
+        fast_rows = np.array(fast_rows)
+        # FILL_BONUS makes the best combination the one filling the most slots, then scoring the most, like solve_lineup
+        block = np.where(np.isnan(scores[fast_rows]), -np.inf, scores[fast_rows] + FILL_BONUS)
+        row_totals = _laminar_totals(plan, block, np.array(fast_codes), plan_positions)
+
+        best = np.full((num_rosters, num_weeks), -np.inf)
+        np.maximum.at(best, fast_rows, row_totals)
+        solved = np.unique(fast_rows)
+        totals[solved] = best[solved] - np.round(best[solved] / FILL_BONUS) * FILL_BONUS
+
+    return totals
@@ -0,0 +1,203 @@
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Optional
+
+
+# Upper bounds (seconds) of the latency histogram buckets, from a dictionary lookup up to a slow page download
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_HELP = {
+    'stage_seconds': 'Time spent in each fetcher, scraper, join and optimizer',
+    'stage_errors_total': 'Calls to each stage that raised an exception',
+    'http_request_seconds': 'Time for each HTTP request, including retries',
+    'http_requests_total': 'HTTP requests by host and status code (0 if no response was received)',
+    'http_retries_total': 'Retries made while answering HTTP requests',
+    'http_response_bytes_total': 'Bytes of HTTP response bodies received',
+    'cache_requests_total': 'Cache lookups by cache and result',
+}
+
+
+class Histogram:
+    """
+    Counts of observations falling under each bucket's upper bound, plus their sum and count
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Upper bound of the bucket holding the q-th quantile (inf if it is past the last bucket)
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), self.counts):
+            running += bucket_count
+            if running >= target:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of the process's counters and latency histograms, each identified by a metric name and a set of labels.
+    Shared by every session in the server process. Collectors are called at export time for numbers other modules already
+    keep (like the keyed caches' hit and miss counts).
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+        self.resetters = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def count(self, name: str, amount: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def add_collector(self, collector: Callable[[], list], reset: Optional[Callable[[], None]] = None):
+        """
+        Adds a function returning (name, labels, value) counters to include in every export, and optionally a function that
+        zeroes whatever it counts, called by reset
+        """
+        self.collectors.append(collector)
+        if reset is not None:
+            self.resetters.append(reset)
+
+    def _collected_counters(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                key = self._key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+        return counters
+
+    def snapshot(self) -> dict:
+        """
+        Every metric as plain data, for the debug page and JSON export
+        """
+        counters = self._collected_counters()
+        with self._lock:
+            histograms = {key: (list(histogram.counts), histogram.sum, histogram.count, histogram.quantile(0.5), histogram.quantile(0.95)) for key, histogram in self.histograms.items()}
+        return {
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(counters.items())],
+            'histograms': [
+                {'name': name, 'labels': dict(labels), 'count': count, 'sum': round(total, 6), 'p50': p50, 'p95': p95,
+                 'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], counts))}
+                for (name, labels), (counts, total, count, p50, p95) in sorted(histograms.items())
+            ],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format
+        """
+        def label_text(labels: dict, **extra) -> str:
+            labels = {**labels, **extra}
+            if not labels:
+                return ''
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+            return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+        snapshot = self.snapshot()
+        lines = []
+        described = set()
+        def describe(name: str, kind: str):
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {METRIC_HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for counter in snapshot['counters']:
+            describe(counter['name'], 'counter')
+            lines.append(f"{counter['name']}{label_text(counter['labels'])} {counter['value']}")
+        for histogram in snapshot['histograms']:
+            name = histogram['name']
+            describe(name, 'histogram')
+            running = 0
+            for bound, bucket_count in histogram['buckets'].items():
+                running += bucket_count
+                lines.append(f"{name}_bucket{label_text(histogram['labels'], le=bound)} {running}")
+            lines.append(f"{name}_sum{label_text(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{label_text(histogram['labels'])} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+        # Numbers kept outside the registry (like the keyed caches' hit and miss counts) start over too
+        for reset in self.resetters:
+            reset()
+
+
+# The process's registry, used by everything below
+registry = MetricsRegistry()
+
+
+def count(name: str, amount: float = 1, **labels):
+    registry.count(name, amount, **labels)
+
+
+@contextmanager
+def timer(stage: str):
+    """
+    Records how long the with block takes under stage_seconds, and counts it under stage_errors_total if it raises
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registry.count('stage_errors_total', stage=stage)
+        raise
+    finally:
+        registry.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+
+def timed(stage: Optional[str] = None):
+    """
+    Decorator recording every call's latency under stage_seconds. The stage defaults to the function's name.
+    """
+    def decorator(function: Callable) -> Callable:
+        name = stage or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
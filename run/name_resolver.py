@@ -0,0 +1,83 @@
+import os
+import time
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Optional
+from metrics import timer
+
+
+# Seconds between checks of whether the database file changed
+CHECK_INTERVAL = 5
+
+
+class NameResolver:
+    """
+    Matches Sleeper players to their FantasyPros names using the matched_names table. The whole table is loaded into memory
+    the first time it's needed (and again only if the database file changes, checked at most every CHECK_INTERVAL seconds),
+    so resolving a roster doesn't touch the database. The table only has names, not Sleeper player IDs, so players are matched
+    by full name (defenses by their player ID, which is the team abbreviation).
+
+    Arguments:
+      - database_file: path to the SQLite database with the matched_names table
+    """
+
+    def __init__(self, database_file: str):
+        self.database_file = database_file
+        self._connection = None
+        self._names = None
+        self._loaded_mtime = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Shared read-only connection, opened on first use
+        """
+        if self._connection is None:
+            uri = f'file:{os.path.abspath(self.database_file)}?mode=ro'
+            self._connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return self._connection
+
+    def _load(self):
+        now = time.monotonic()
+        if self._names is not None and now - self._checked_at < CHECK_INTERVAL:
+            return
+        modified = os.path.getmtime(self.database_file)
+        if self._names is not None and modified == self._loaded_mtime:
+            self._checked_at = now
+            return
+
+        with self._lock:
+            if self._names is None or modified != self._loaded_mtime:
+                with timer('name_resolver.load'):
+                    rows = self.connection.execute("SELECT sleeper_name, fantasy_pros_name FROM matched_names").fetchall()
+                names = {}
+                for sleeper_name, fantasy_pros_name in rows:
+                    names.setdefault(sleeper_name, fantasy_pros_name)
+                self._names = names
+                self._loaded_mtime = modified
+            self._checked_at = now
+
+    def resolve(self, player: dict) -> Optional[str]:
+        """
+        FantasyPros name for a player dictionary, or None if the player isn't in the table
+        """
+        return self.resolve_many([player])[0]
+
+    def resolve_many(self, players: list) -> list:
+        """
+        FantasyPros name (or None) for each player in a list, with the database file checked once for the whole list
+        """
+        self._load()
+        names = self._names
+        return [names.get(player.get('full_name') or player.get('player_id', '')) for player in players]
+
+
+@lru_cache(maxsize=8)
+def get_name_resolver(database_file: str) -> NameResolver:
+    """
+    One shared resolver per database file
+    """
+    return NameResolver(database_file)
@@ -0,0 +1,299 @@
+import sqlite3
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from storage import file_lock
+from metrics import timed
+
+
+# Only the fields the application actually reads from Sleeper's players/nfl dump
+PLAYER_FIELDS = ('player_id', 'full_name', 'fantasy_positions', 'team', 'stats_id', 'fantasy_data_id', 'injury_status')
+
+# Fields stored as JSON text because they are lists. The other columns are untyped so ints like stats_id come back as ints
+JSON_FIELDS = {'fantasy_positions'}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS players (
+    player_id TEXT PRIMARY KEY,
+    {', '.join(PLAYER_FIELDS[1:])},
+    record_hash TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Let SQLite serve reads straight from a memory map of the file instead of copying pages into its own cache
+MMAP_SIZE = 64 * 1024 * 1024
+
+
+def compact_record(player: dict) -> tuple:
+    """
+    Pulls the fields in PLAYER_FIELDS out of one entry in the players/nfl dump
+    """
+    return tuple(json.dumps(player.get(field)) if field in JSON_FIELDS else player.get(field) for field in PLAYER_FIELDS)
+
+
+def record_hash(record: tuple) -> str:
+    """
+    Short fingerprint of a compact record, used to tell which players changed between downloads
+    """
+    return hashlib.blake2b(json.dumps(record).encode(), digest_size=8).hexdigest()
+
+
+class PlayerIndex:
+    """
+    Read-only view of NFL players keyed by player_id, backed by a small SQLite file. Supports the parts of the dictionary
+    interface the rest of the application uses (get, in, len), so it can be passed anywhere the raw player dump used to go.
+    The connection is opened on first use and reads go through a memory map, so nothing is loaded up front.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = None
+        self._lock = threading.RLock()
+        self._last_refreshed = None
+        self._last_attempt = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            with self._lock:
+                if self._connection is None:
+                    connection = sqlite3.connect(self.path, check_same_thread=False)
+                    # WAL lets other processes keep reading the last committed version while a refresh is being written
+                    connection.execute('PRAGMA journal_mode = WAL')
+                    connection.executescript(SCHEMA)
+                    connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+                    self._connection = connection
+        return self._connection
+
+    def _row_to_player(self, row: tuple) -> dict:
+        player = dict(zip(PLAYER_FIELDS, row))
+        for field in JSON_FIELDS:
+            if player[field] is not None:
+                player[field] = json.loads(player[field])
+        return player
+
+    def get(self, player_id: str, default=None) -> Optional[dict]:
+        with self._lock:
+            row = self.connection.execute(f"SELECT {', '.join(PLAYER_FIELDS)} FROM players WHERE player_id = ?", (player_id,)).fetchone()
+        return self._row_to_player(row) if row else default
+
+    @timed('player_index.get_many')
+    def get_many(self, player_ids: Iterable[str]) -> dict:
+        """
+        Looks up several players with one query. Returns a dictionary keyed by player_id (players not found are left out)
+        """
+        player_ids = list(player_ids)
+        if not player_ids:
+            return {}
+        placeholders = ', '.join('?' for _ in player_ids)
+        with self._lock:
+            rows = self.connection.execute(f"SELECT {', '.join(PLAYER_FIELDS)} FROM players WHERE player_id IN ({placeholders})", player_ids).fetchall()
+        return {row[0]: self._row_to_player(row) for row in rows}
+
+    def __contains__(self, player_id) -> bool:
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM players WHERE player_id = ?", (player_id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def last_refreshed(self) -> Optional[datetime]:
+        if self._last_refreshed is None:
+            value = self.get_meta('last_refreshed')
+            self._last_refreshed = datetime.fromisoformat(value) if value else None
+        return self._last_refreshed
+
+    def is_stale(self, max_age: timedelta) -> bool:
+        return self.last_refreshed is None or datetime.now() - self.last_refreshed >= max_age
+
+    @property
+    def last_attempt(self) -> Optional[datetime]:
+        """
+        When a download last failed (see mark_attempt), or None
+        """
+        if self._last_attempt is None:
+            value = self.get_meta('last_attempt')
+            self._last_attempt = datetime.fromisoformat(value) if value else None
+        return self._last_attempt
+
+    def attempted_within(self, retry_after: timedelta) -> bool:
+        """
+        Whether a download failed less than retry_after ago (and nothing has been refreshed since)
+        """
+        last_attempt = self.last_attempt
+        if last_attempt is None or (self.last_refreshed is not None and self.last_refreshed > last_attempt):
+            return False
+        return datetime.now() - last_attempt < retry_after
+
+    @timed('player_index.apply_players')
+    def apply_players(self, player_data: dict, meta: dict = None) -> tuple:
+        """
+        Brings the index in line with a fresh players/nfl dump. Only players whose stored fields changed are rewritten, and
+        players no longer in the dump are removed. Everything (including any meta values passed in) happens in one transaction,
+        so readers never see a half update.
+
+        Returns:
+          number of players inserted or updated, number of players removed
+        """
+        with self._lock:
+            connection = self.connection
+            existing_hashes = dict(connection.execute("SELECT player_id, record_hash FROM players"))
+
+            changed_rows = []
+            for player_id, player in player_data.items():
+                record = compact_record({**player, 'player_id': player.get('player_id') or player_id})
+                new_hash = record_hash(record)
+                if existing_hashes.pop(record[0], None) != new_hash:
+                    changed_rows.append((*record, new_hash))
+
+            # Anything left over wasn't in the new dump
+            removed_ids = [(player_id,) for player_id in existing_hashes]
+
+            with connection:
+                connection.executemany(f"INSERT OR REPLACE INTO players ({', '.join(PLAYER_FIELDS)}, record_hash) VALUES ({', '.join('?' for _ in range(len(PLAYER_FIELDS) + 1))})", changed_rows)
+                connection.executemany("DELETE FROM players WHERE player_id = ?", removed_ids)
+                for key, value in (meta or {}).items():
+                    self._set_meta(connection, key, value)
+                self._set_meta(connection, 'last_refreshed', datetime.now().isoformat())
+
+            self._last_refreshed = None
+            return len(changed_rows), len(removed_ids)
+
+    def mark_refreshed(self, meta: dict = None):
+        """
+        Records a refresh that found nothing new, so the staleness clock restarts without touching any player rows
+        """
+        with self._lock:
+            with self.connection:
+                for key, value in (meta or {}).items():
+                    self._set_meta(self.connection, key, value)
+                self._set_meta(self.connection, 'last_refreshed', datetime.now().isoformat())
+            self._last_refreshed = None
+
+    def mark_attempt(self):
+        """
+        Records a download that failed, so every process sharing the index waits before trying again (see refresh_player_index)
+        """
+        now = datetime.now()
+        with self._lock:
+            with self.connection:
+                self._set_meta(self.connection, 'last_attempt', now.isoformat())
+            self._last_attempt = now
+
+    def reload(self):
+        """
+        Forgets the cached refresh and attempt times so the next check reads what other processes may have written
+        """
+        self._last_refreshed = None
+        self._last_attempt = None
+
+    @staticmethod
+    def _set_meta(connection: sqlite3.Connection, key: str, value: str):
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+# Keeps sessions in the same process from queueing up on the file lock one after another
+_refresh_lock = threading.Lock()
+
+# How long to wait after a failed download before trying again, so a Sleeper outage doesn't make every call wait on it
+REFRESH_RETRY_AFTER = timedelta(minutes=5)
+
+
+def refresh_player_index(player_index: PlayerIndex, client, max_age: timedelta, retry_after: timedelta = REFRESH_RETRY_AFTER) -> bool:
+    """
+    Refreshes the player index from Sleeper's players/nfl endpoint if it is older than max_age.
+
+    Only one refresh runs at a time across every process sharing the index file. Anyone who waited on the lock re-checks the
+    index afterwards and skips the download if another process already refreshed it. The request is conditional on the stored
+    ETag/Last-Modified headers, and a response whose body hashes the same as the last one is not parsed at all.
+
+    An index that has been filled before keeps being served while it is refreshed on a background thread, so only the very
+    first download is waited on. A failed download isn't tried again for retry_after.
+
+    Arguments:
+      - player_index: the index to refresh
+      - client: PooledClient pointed at the Sleeper API
+      - max_age: how old the index can be before it is refreshed
+      - retry_after: how long to wait after a failed download before trying again
+    Returns:
+      True if any player records were written (always False when the refresh runs in the background)
+    """
+    if not player_index.is_stale(max_age) or player_index.attempted_within(retry_after):
+        return False
+
+    if player_index.last_refreshed is not None:
+        # Only one background refresh per process. Everyone else keeps using the index as it is
+        if _refresh_lock.acquire(blocking=False):
+            def run():
+                try:
+                    _refresh(player_index, client, max_age, retry_after)
+                except Exception as error:
+                    print(f"Error refreshing player index: {error}")
+                    player_index.mark_attempt()
+                finally:
+                    _refresh_lock.release()
+
+            threading.Thread(target=run, daemon=True, name='player-index-refresh').start()
+        return False
+
+    with _refresh_lock:
+        return _refresh(player_index, client, max_age, retry_after)
+
+
+def _refresh(player_index: PlayerIndex, client, max_age: timedelta, retry_after: timedelta) -> bool:
+    with file_lock(f'{player_index.path}.lock'):
+        # Another process may have refreshed the index (or failed to) while we waited for the lock
+        player_index.reload()
+        if not player_index.is_stale(max_age) or player_index.attempted_within(retry_after):
+            return False
+
+        headers = {}
+        etag = player_index.get_meta('etag')
+        last_modified = player_index.get_meta('last_modified')
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        # The full player dump is several megabytes, so allow a longer read timeout
+        response = client.get('players/nfl', headers=headers, timeout=(3.05, 60))
+        if response is None:
+            player_index.mark_attempt()
+            return False
+
+        # Nothing changed on Sleeper's side
+        if response.status_code == 304:
+            player_index.mark_refreshed()
+            return False
+
+        if response.status_code != 200:
+            print(f"Error: {response.status_code}, {response.text}")
+            player_index.mark_attempt()
+            return False
+
+        meta = {
+            'etag': response.headers.get('ETag', ''),
+            'last_modified': response.headers.get('Last-Modified', ''),
+            'content_hash': hashlib.blake2b(response.content, digest_size=16).hexdigest(),
+        }
+
+        # Same bytes as last time, so there is nothing to apply
+        if meta['content_hash'] == player_index.get_meta('content_hash'):
+            player_index.mark_refreshed(meta)
+            return False
+
+        changed, removed = player_index.apply_players(response.json(), meta)
+        return bool(changed or removed)
@@ -0,0 +1,60 @@
+import numpy as np
+from lineup_optimizer import batch_lineup_totals
+
+
+def roster_score_array(rosters: list, score_table: dict, num_weeks: int) -> np.ndarray:
+    """
+    Projections of every player on every roster in one array, ready for batch_lineup_totals
+
+    Arguments:
+      - rosters: list of rosters, each a list of player dictionaries
+      - score_table: player ID -> (weeks,) array of projected points, NaN for weeks with no projection
+      - num_weeks: number of weeks in each score_table row
+    Returns:
+      (rosters, weeks, players) array, NaN for players with no projection and for padding shorter rosters
+    """
+    most_players = max((len(players) for players in rosters), default=0)
+    scores = np.full((len(rosters), num_weeks, max(most_players, 1)), np.nan)
+    for roster, players in enumerate(rosters):
+        for column, player in enumerate(players):
+            row = score_table.get(player.get('player_id'))
+            if row is not None:
+                scores[roster, :, column] = row
+    return scores
+
+
+def rank_league(rosters: dict, standings: dict, score_table: dict, roster_positions: list, num_weeks: int) -> list:
+    """
+    Power rankings for every roster in a league. Every roster's optimal lineup is solved for every remaining week in one batch,
+    and teams are ranked by their projected points for the rest of the season.
+
+    Arguments:
+      - rosters: roster ID -> list of player dictionaries
+      - standings: roster ID -> dictionary with wins, losses, ties and points_for so far
+      - score_table: player ID -> (weeks,) array of projected points, the first week being the current one
+      - roster_positions: the league's roster_positions
+      - num_weeks: number of weeks in each score_table row
+    Returns:
+      list of dictionaries with rank, roster_id, players, week_points (current week), season_points (rest of season) and the
+      roster's standings, best team first
+    """
+    roster_ids = list(rosters)
+    players = [rosters[roster_id] for roster_id in roster_ids]
+    scores = roster_score_array(players, score_table, num_weeks)
+    positions = [[player.get('fantasy_positions') or [] for player in roster_players] for roster_players in players]
+    totals = batch_lineup_totals(scores, positions, roster_positions) if roster_ids else np.zeros((0, num_weeks))
+
+    teams = [
+        {
+            'roster_id': roster_id,
+            'players': players[index],
+            'week_points': round(float(totals[index, 0]), 2) if num_weeks else 0.0,
+            'season_points': round(float(totals[index].sum()), 2),
+            **standings.get(roster_id, {}),
+        }
+        for index, roster_id in enumerate(roster_ids)
+    ]
+    teams.sort(key=lambda team: (team['season_points'], team['week_points']), reverse=True)
+    for rank, team in enumerate(teams, start=1):
+        team['rank'] = rank
+    return teams
@@ -0,0 +1,188 @@
+import os
+import time
+import threading
+import numpy as np
+from io import BytesIO
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Union
+from scoring import WeekStats, build_stat_matrix
+from storage import atomic_write, file_lock
+
+
+def projection_ttl(week: int, current_week: int) -> timedelta:
+    """
+    How long a week's projections are trusted before being downloaded again. This week's projections move with injury news,
+    next week's a little, and projections further out barely change. Past weeks never change.
+    """
+    weeks_out = int(week) - int(current_week)
+    if weeks_out < 0:
+        return timedelta(days=30)
+    elif weeks_out == 0:
+        return timedelta(hours=1)
+    elif weeks_out == 1:
+        return timedelta(hours=6)
+    else:
+        return timedelta(days=1)
+
+
+# Seconds before a week whose download failed is tried again, so an outage doesn't make every call wait on Sleeper
+RETRY_AFTER = 5 * 60
+
+
+class SeasonProjectionStore:
+    """
+    Weekly Sleeper projections stored on disk as compressed stat matrices keyed by (season_type, season, week), with the
+    weeks that have been used kept in memory. Each week is refreshed on its own TTL (see projection_ttl), and any weeks that
+    need downloading are fetched at the same time. Weeks past their TTL are still returned while a fresh copy is downloaded in
+    the background (stale-while-revalidate), and a week whose download failed isn't tried again for RETRY_AFTER seconds.
+
+    Arguments:
+      - client: PooledClient pointed at the Sleeper API
+      - directory: folder the week files are written to
+    """
+
+    def __init__(self, client, directory: str):
+        self.client = client
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._weeks = {}
+        self._failed = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def path(self, season_type: str, season: Union[str, int], week: Union[str, int]) -> str:
+        return os.path.join(self.directory, f'{season_type}_{season}_{int(week):02d}.npz')
+
+    def _read(self, key: tuple) -> Optional[tuple]:
+        """
+        Returns (WeekStats, fetched_at) for a week, from memory if the file hasn't changed since it was last read
+        """
+        path = self.path(*key)
+        try:
+            modified = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+
+        cached = self._weeks.get(key)
+        if cached and cached[2] == modified:
+            return cached[0], cached[1]
+
+        with np.load(path) as week_file:
+            week_stats = WeekStats(week_file['player_ids'].tolist(), week_file['categories'].tolist(), week_file['matrix'])
+            fetched_at = datetime.fromisoformat(str(week_file['fetched_at']))
+
+        with self._lock:
+            self._weeks[key] = (week_stats, fetched_at, modified)
+        return week_stats, fetched_at
+
+    def _write(self, key: tuple, projections: dict):
+        week_stats = build_stat_matrix(projections)
+        buffer = BytesIO()
+        np.savez_compressed(
+            buffer,
+            player_ids=np.array(week_stats.player_ids, dtype=str),
+            categories=np.array(week_stats.categories, dtype=str),
+            matrix=week_stats.matrix.reshape(len(week_stats.player_ids), len(week_stats.categories)),
+            fetched_at=np.array(datetime.now().isoformat()),
+        )
+        atomic_write(self.path(*key), buffer.getvalue())
+
+    def _is_fresh(self, key: tuple, current_week: int) -> bool:
+        stored = self._read(key)
+        return stored is not None and datetime.now() - stored[1] < projection_ttl(key[2], current_week)
+
+    def _needs_download(self, key: tuple, current_week: int) -> bool:
+        failed_at = self._failed.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < RETRY_AFTER:
+            return False
+        return not self._is_fresh(key, current_week)
+
+    def _download(self, keys: list, current_week: int) -> int:
+        """
+        Downloads the weeks that still need it once the lock is held, all at the same time. Only one process refreshes the
+        store at a time, and anyone who waited on the lock skips weeks another process already refreshed.
+        """
+        with file_lock(os.path.join(self.directory, 'projections.lock')):
+            stale_keys = [key for key in keys if self._needs_download(key, current_week)]
+            results = self.client.fetch_many([f'projections/nfl/{season_type}/{season}/{week}' for season_type, season, week in stale_keys])
+
+            downloaded = 0
+            for key, projections in zip(stale_keys, results):
+                # A failed download keeps serving whatever was stored before, and isn't retried until RETRY_AFTER has passed
+                if projections is None:
+                    with self._lock:
+                        self._failed[key] = time.monotonic()
+                    continue
+                self._write(key, projections)
+                with self._lock:
+                    self._failed.pop(key, None)
+                downloaded += 1
+            return downloaded
+
+    def prefetch(self, season_type: str, season: Union[str, int], weeks: Iterable[int], current_week: int) -> int:
+        """
+        Downloads every week that is missing or past its TTL, all at the same time
+
+        Returns:
+          number of weeks downloaded
+        """
+        keys = [(season_type, season, int(week)) for week in weeks]
+        if not any(self._needs_download(key, current_week) for key in keys):
+            return 0
+        return self._download(keys, current_week)
+
+    def refresh_in_background(self, keys: list, current_week: int):
+        """
+        Downloads stale weeks on a background thread. A week already being refreshed in this process isn't started again.
+        """
+        with self._lock:
+            keys = [key for key in keys if key not in self._refreshing]
+            self._refreshing.update(keys)
+        if not keys:
+            return
+
+        def run():
+            try:
+                self._download(keys, current_week)
+            except Exception as error:
+                print(f"Error refreshing projections: {error}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(keys)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_week_stats(self, season_type: str, season: Union[str, int], week: Union[str, int], current_week: int) -> Optional[WeekStats]:
+        """
+        Projections for one week as a WeekStats matrix, downloading them first if they have never been stored
+        """
+        return self.get_weeks_stats(season_type, season, [week], current_week)[0]
+
+    def get_weeks_stats(self, season_type: str, season: Union[str, int], weeks: Iterable[int], current_week: int) -> list:
+        """
+        Projections for several weeks. Weeks that have never been stored are downloaded at the same time and waited on, and
+        weeks past their TTL are returned as stored while they refresh in the background. None for a week that couldn't be
+        downloaded and was never stored.
+        """
+        keys = [(season_type, season, int(week)) for week in weeks]
+        missing_keys = [key for key in keys if self._read(key) is None and self._needs_download(key, current_week)]
+        if missing_keys:
+            self._download(missing_keys, current_week)
+
+        stale_keys = [key for key in keys if self._needs_download(key, current_week)]
+        if stale_keys:
+            self.refresh_in_background(stale_keys, current_week)
+
+        weeks_stats = []
+        for key in keys:
+            stored = self._read(key)
+            weeks_stats.append(stored[0] if stored else None)
+        return weeks_stats
+
+    def prefetch_in_background(self, season_type: str, season: Union[str, int], weeks: Iterable[int], current_week: int) -> threading.Thread:
+        """
+        Starts prefetch on its own thread so a page can keep rendering while the rest of the season downloads
+        """
+        thread = threading.Thread(target=self.prefetch, args=(season_type, season, list(weeks), current_week), daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,156 @@
+import os
+import gzip
+import json
+import threading
+import time
+from typing import Callable, Optional
+from storage import atomic_write, file_lock
+from metrics import registry
+from rankings_index import RankingsIndex
+
+
+# Only the fields the ranking joiners read are stored
+COMPACT_FIELDS = ('player_name', 'player_team_id', 'player_position_id', 'rank_ecr')
+
+# FantasyPros updates weekly rankings several times a week as news comes in, and rest of season rankings about once a week
+WEEKLY_TTL = 6 * 3600
+ROS_TTL = 24 * 3600
+
+# Past its TTL an entry is still served (while a fresh copy is scraped in the background) until it is this old
+MAX_STALE = 7 * 24 * 3600
+
+# Pages that don't change between formats
+FORMAT_INDEPENDENT_POSITIONS = {'QB', 'K', 'DEF'}
+
+
+def rankings_key(position: Optional[str], format: str, ros: str, week) -> tuple:
+    """
+    Cache key for one rankings page: (format, position, ros, week). Pages that are the same for every format share a key.
+    """
+    if ros == "yes":
+        return (format, 'OVERALL', 'ros', str(week))
+    position = position.upper()
+    return ('any' if position in FORMAT_INDEPENDENT_POSITIONS else format, position, 'weekly', str(week))
+
+
+def compact_rankings(rankings: list) -> list:
+    return [{field: player.get(field) for field in COMPACT_FIELDS if field in player} for player in rankings]
+
+
+class RankingsCache:
+    """
+    FantasyPros rankings shared by every streamlit process through gzipped JSON files on disk, with the entries in use kept in
+    memory already indexed (see rankings_index.RankingsIndex), so the joins don't rebuild the index on every rerun. Entries past their TTL are still returned while a fresh copy is scraped in the background (stale-while-revalidate),
+    so users only wait on FantasyPros for pages that have never been scraped.
+
+    Arguments:
+      - directory: folder the cache files are written to
+      - fetch: function taking a cache key (and optionally a timeout) and returning the rankings list, or None if the scrape failed
+    """
+
+    def __init__(self, directory: str, fetch: Callable[[tuple], Optional[list]]):
+        self.directory = directory
+        self.fetch = fetch
+        os.makedirs(directory, exist_ok=True)
+        self._memory = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def path(self, key: tuple) -> str:
+        return os.path.join(self.directory, f"{'_'.join(key)}.json.gz")
+
+    @staticmethod
+    def ttl(key: tuple) -> int:
+        return ROS_TTL if key[2] == 'ros' else WEEKLY_TTL
+
+    def _read(self, key: tuple) -> Optional[tuple]:
+        """
+        Returns (rankings index, scraped_at) for a key, from memory if the file hasn't changed since it was last read
+        """
+        path = self.path(key)
+        try:
+            modified = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+
+        cached = self._memory.get(key)
+        if cached and cached[2] == modified:
+            return cached[0], cached[1]
+
+        with gzip.open(path, 'rt') as cache_file:
+            entry = json.load(cache_file)
+        # Indexed once per load rather than by every join that uses the rankings
+        index = RankingsIndex(entry['players'])
+        with self._lock:
+            self._memory[key] = (index, entry['scraped_at'], modified)
+        return index, entry['scraped_at']
+
+    def put(self, key: tuple, rankings: list):
+        entry = {'scraped_at': time.time(), 'players': compact_rankings(rankings)}
+        atomic_write(self.path(key), gzip.compress(json.dumps(entry, separators=(',', ':')).encode()))
+
+    def lookup(self, key: tuple, revalidate: bool = True) -> tuple:
+        """
+        Returns (rankings index, fresh) for a key without scraping. The index is None if nothing usable is stored. A stale entry
+        starts a background refresh unless revalidate is False.
+        """
+        stored = self._read(key)
+        if stored is None:
+            result, found = 'miss', (None, False)
+        else:
+            rankings, scraped_at = stored
+            age = time.time() - scraped_at
+            if age < self.ttl(key):
+                result, found = 'hit', (rankings, True)
+            elif age < MAX_STALE:
+                if revalidate:
+                    self.refresh_in_background(key)
+                result, found = 'stale', (rankings, False)
+            else:
+                result, found = 'miss', (None, False)
+
+        # Only lookups made to serve a page are counted, not the re-check made while refreshing
+        if revalidate:
+            registry.count('cache_requests_total', cache='rankings', result=result)
+        return found
+
+    def refresh(self, key: tuple, **fetch_kwargs) -> Optional[RankingsIndex]:
+        """
+        Scrapes a page and stores it. Only one process scrapes a given page at a time, and anyone who waited on the lock uses
+        what the other process stored instead of scraping again. Keyword arguments are passed on to fetch.
+        """
+        with file_lock(f'{self.path(key)}.lock'):
+            stored_rankings, fresh = self.lookup(key, revalidate=False)
+            if fresh:
+                return stored_rankings
+
+            rankings = self.fetch(key, **fetch_kwargs)
+            if rankings is None:
+                # Keep serving the stale copy (if there is one) when the scrape fails
+                return stored_rankings
+            self.put(key, rankings)
+            return self._read(key)[0]
+
+    def refresh_in_background(self, key: tuple):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.refresh(key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, key: tuple) -> Optional[RankingsIndex]:
+        """
+        Indexed rankings for a key: the stored copy if there is a usable one, otherwise scraped now
+        """
+        rankings, _ = self.lookup(key)
+        if rankings is not None:
+            return rankings
+        return self.refresh(key)
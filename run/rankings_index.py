@@ -0,0 +1,71 @@
+from typing import Union
+
+
+class RankingsIndex:
+    """
+    FantasyPros expert consensus rankings (the ecrData players list) indexed for constant time lookups, so joining rankings
+    onto a roster costs O(roster) instead of scanning the whole list for every player.
+
+    Lookups return the same ranking a front-to-back scan of the list would find first.
+
+    Attributes:
+      - rankings: the original list of ranked players
+      - by_name: player_name -> (list position, player)
+      - by_team_id: player_team_id -> (list position, player)
+      - by_position_team: (player_position_id, player_team_id) -> (list position, player)
+    """
+
+    def __init__(self, rankings: list):
+        self.rankings = rankings or []
+        self.by_name = {}
+        self.by_team_id = {}
+        self.by_position_team = {}
+
+        for list_position, player in enumerate(self.rankings):
+            entry = (list_position, player)
+            # Keep the first occurrence of each key, like a scan would
+            self.by_name.setdefault(player.get('player_name'), entry)
+            self.by_team_id.setdefault(player.get('player_team_id'), entry)
+            self.by_position_team.setdefault((player.get('player_position_id'), player.get('player_team_id')), entry)
+
+    def __len__(self) -> int:
+        return len(self.rankings)
+
+    def rank_by_name(self, fantasy_pros_name: str):
+        """
+        Ranking of the player whose name matches, or 'unranked'
+        """
+        entry = self.by_name.get(fantasy_pros_name)
+        return entry[1].get('rank_ecr', 'unranked') if entry else 'unranked'
+
+    def rank_by_name_or_team(self, fantasy_pros_name: str):
+        """
+        Ranking of the first player whose name or team ID matches (team IDs are how defenses are matched), or 'unranked'
+        """
+        matches = [entry for entry in (self.by_name.get(fantasy_pros_name), self.by_team_id.get(fantasy_pros_name)) if entry]
+        if not matches:
+            return 'unranked'
+        return min(matches, key=lambda entry: entry[0])[1].get('rank_ecr', 'unranked')
+
+    def rank_by_position_team(self, position_id: str, team_id: str):
+        """
+        Ranking of the first player at a position on a team (used for team defenses in the overall rankings), or 'unranked'
+        """
+        entry = self.by_position_team.get((position_id, team_id))
+        return entry[1].get('rank_ecr', 'unranked') if entry else 'unranked'
+
+
+def index_rankings(rankings: Union[list, RankingsIndex]) -> RankingsIndex:
+    """
+    Builds an index for a rankings list. An index that was already built is returned as is.
+    """
+    if isinstance(rankings, RankingsIndex):
+        return rankings
+    return RankingsIndex(rankings)
+
+
+def index_position_rankings(position_rankings: dict) -> dict:
+    """
+    Indexes every list in the dictionary returned by get_weekly_rankings (position -> rankings)
+    """
+    return {position: index_rankings(rankings) for position, rankings in position_rankings.items()}
@@ -0,0 +1,151 @@
+from typing import Union
+from rankings_index import RankingsIndex, index_rankings, index_position_rankings
+from name_resolver import get_name_resolver
+from metrics import timed
+
+
+# Match weekly FantasyPros rankings to the roster using the database
+@timed()
+def add_weekly_rankings(player_list: list, position_rankings: dict, database_file: str) -> list:
+    """
+    Database with names in sleeper and their fantasypros counterpart in order to add fantasy pros rankings to a list of players.
+    position_rankings is what get_weekly_rankings returns (position -> RankingsIndex), rankings lists work too.
+    """
+    
+    # Rankings from the scraper come already indexed, a plain list is indexed here so every player is a dictionary lookup
+    position_indexes = index_position_rankings(position_rankings)
+    empty_index = RankingsIndex([])
+
+    # Sleeper -> FantasyPros names come from an in-memory copy of the database table
+    name_resolver = get_name_resolver(database_file)
+
+    # Create a new list to store the updated player information
+    updated_player_list = []
+
+    # Get every player's fantasy pros name in one pass
+    fantasy_pros_names = name_resolver.resolve_many(player_list)
+
+    # Iterate through each player in the player list
+    for player_info, fantasy_pros_name in zip(player_list, fantasy_pros_names):
+        # Make a copy of the player dictionary
+        updated_player_info = player_info.copy()
+
+        # Find the corresponding position for the player
+        positions = updated_player_info.get('fantasy_positions') or []
+
+        if fantasy_pros_name is not None:
+
+            for position in positions:
+                # Find the player's ranking in the position rankings
+                player_ranking = position_indexes.get(position, empty_index).rank_by_name_or_team(fantasy_pros_name)
+
+                # Add the ranking to the player's copied dictionary
+                key = f'{position.lower()}_ecr_ranking'
+                updated_player_info[key] = player_ranking
+
+            # Add FLEX and SUPER_FLEX rankings for every player
+            updated_player_info['flex_ecr_ranking'] = position_indexes.get('FLEX', empty_index).rank_by_name(fantasy_pros_name)
+            updated_player_info['super_flex_ecr_ranking'] = position_indexes.get('SUPER_FLEX', empty_index).rank_by_name(fantasy_pros_name)
+
+        else:
+            # If no match found in the database, set rank_ecr to "unranked" for each position
+            for position in positions:
+                key = f'{position.lower()}_ecr_ranking'
+                updated_player_info[key] = 'unranked'
+
+            # Set FLEX and SUPER_FLEX rankings to "unranked" if positions are not found
+            updated_player_info['flex_ecr_ranking'] = 'unranked'
+            updated_player_info['super_flex_ecr_ranking'] = 'unranked'
+
+        # Add the updated player information to the new list
+        updated_player_list.append(updated_player_info)
+
+    return updated_player_list
+
+
+
+@timed()
+def add_ros_rankings(player_list: list, ros_rankings: Union[list, RankingsIndex], database_file: str) -> list:
+    """
+    Rest of season rankings are contained in one overall list rather than individual ones by position, so needs to be handled differently
+    """
+    
+    # Rankings from the scraper come already indexed, a plain list is indexed here so every player is a dictionary lookup
+    ros_index = index_rankings(ros_rankings)
+
+    # Sleeper -> FantasyPros names come from an in-memory copy of the database table
+    name_resolver = get_name_resolver(database_file)
+
+    # Create a new list to store the updated player information
+    updated_player_list = []
+
+    # Get every player's fantasy pros name in one pass
+    fantasy_pros_names = name_resolver.resolve_many(player_list)
+
+    # Iterate through each player in the player list
+    for player_info, fantasy_pros_name in zip(player_list, fantasy_pros_names):
+        # Make a copy of the player dictionary
+        updated_player_info = player_info.copy()
+
+        if fantasy_pros_name is not None:
+            # Find the player's ranking in the position rankings
+            # Special case if player is team defense
+            if updated_player_info['fantasy_positions'][0] == 'DEF':
+                player_ranking = ros_index.rank_by_position_team("DST", fantasy_pros_name)
+            else:
+                player_ranking = ros_index.rank_by_name_or_team(fantasy_pros_name)
+            updated_player_info['ros_ecr_ranking'] = player_ranking
+        else:
+            updated_player_info['ros_ecr_ranking'] = 'unranked'
+        # Add updated player info with ros rankings to list
+        updated_player_list.append(updated_player_info)
+    
+    return updated_player_list
+        
+
+
+
+# Use weekly rankings to generate expert recommended starting lineup
+@timed()
+def optimize_starting_lineup_rankings(roster_with_rankings: list, positions: list) -> list:
+    # Create a copy of the roster
+    temp_rost = roster_with_rankings.copy()
+
+    # Create a starting lineup
+    starting_lineup = []
+
+    # Iterate through the list of positions until the bench position
+    for position in positions:
+        if position == "BN":
+            break
+
+        # Determine the key for the ranking based on the position
+        key = f'{position.lower()}_ecr_ranking'
+
+        # If position is FLEX or SUPER_FLEX, select the player with the best flex/superflex ranking among all remaining players
+        if position == 'FLEX':
+            # For FLEX, eligible positions are WR, RB, and TE
+            eligible_players = [player for player in temp_rost if any(pos in player['fantasy_positions'] for pos in ['WR', 'RB', 'TE'])]
+        elif position == 'SUPER_FLEX':
+            # For SUPER_FLEX, eligible positions are QB, WR, RB, and TE
+            eligible_players = [player for player in temp_rost if any(pos in player['fantasy_positions'] for pos in ['QB', 'WR', 'RB', 'TE'])]
+        else:
+            # For other positions, filter players based on the current position
+            eligible_players = [player for player in temp_rost if position in player['fantasy_positions']]
+
+        if not eligible_players or all(player.get(key, 'unranked') == 'unranked' for player in eligible_players):
+            # If no eligible players or all players are unranked, add an empty slot/placeholder to the starting lineup
+            starting_lineup.append({'position': position, 'starting_position': position, 'is_starting': False, 'full_name': 'EMPTY'})
+        else:
+            # For other positions, select the player with the best ranking
+            best_player = min(eligible_players, key=lambda x: x.get(key, float('inf')) if x.get(key, 'unranked') != 'unranked' else float('inf'))
+
+            # Add the selected player to the starting lineup
+            best_player['starting_position'] = position
+            best_player['is_starting'] = True
+            starting_lineup.append(best_player)
+
+            # Remove the selected player from the list of eligible players
+            temp_rost.remove(best_player)
+
+    return starting_lineup
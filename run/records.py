@@ -0,0 +1,220 @@
+import numpy as np
+from collections.abc import MutableMapping, Sequence
+
+
+# Player information every record has, in the order player dictionaries used to list it
+INFO_FIELDS = ('full_name', 'player_id', 'fantasy_positions', 'team', 'stats_id', 'sportradar_id', 'injury_status')
+
+# Set along the way by scoring and the lineup optimizers
+LINEUP_FIELDS = ('projected_points', 'position', 'starting_position', 'is_starting')
+
+FIELDS = frozenset(INFO_FIELDS + LINEUP_FIELDS)
+
+# Value of a field that hasn't been set, so it reads as missing like a key that isn't in a dictionary
+_UNSET = object()
+
+
+class Player(MutableMapping):
+    """
+    Compact record for one player. It can be used like the player dictionaries the rest of the app passes around
+    (player['full_name'], player.get('projected_points'), 'ros_ecr_ranking' in player), but the fields are slots and the
+    projected stats are a row of a numeric array looked up through a stat category table, rather than every stat copied into
+    each player as its own key.
+
+    Attributes:
+      - full_name, player_id, fantasy_positions, team, stats_id, sportradar_id, injury_status: player information
+      - projected_points, position, starting_position, is_starting: set by scoring and the lineup optimizers
+      - stats: projected stats, one value per stat category (a view of the week's stat matrix, so never modified), or None.
+               Categories the player isn't projected for are 0 and read as missing keys.
+      - columns: stat category -> index into stats (the WeekStats columns table), or None
+      - extra: any other keys, like the *_ecr_ranking keys the rankings joins add, or None until one is set
+    """
+
+    __slots__ = INFO_FIELDS + LINEUP_FIELDS + ('stats', 'columns', 'extra')
+
+    def __init__(self, full_name=None, player_id=None, fantasy_positions=None, team=None, stats_id=None, sportradar_id=None, injury_status=None):
+        self.full_name = full_name
+        self.player_id = player_id
+        self.fantasy_positions = fantasy_positions
+        self.team = team
+        self.stats_id = stats_id
+        self.sportradar_id = sportradar_id
+        self.injury_status = injury_status
+        self.projected_points = self.position = self.starting_position = self.is_starting = _UNSET
+        self.stats = self.columns = self.extra = None
+
+    @classmethod
+    def from_info(cls, info: dict) -> 'Player':
+        """
+        Record for a player from the player index (or an entry in Sleeper's players/nfl dump)
+        """
+        return cls(info.get('full_name'), info.get('player_id'), info.get('fantasy_positions'), info.get('team'), info.get('stats_id'),
+                   info.get('fantasy_data_id'), info.get('injury_status'))
+
+    def copy(self) -> 'Player':
+        """
+        Copy of the record. The stats are shared, only the added keys are copied.
+        """
+        player = Player.__new__(Player)
+        (player.full_name, player.player_id, player.fantasy_positions, player.team, player.stats_id, player.sportradar_id, player.injury_status,
+         player.projected_points, player.position, player.starting_position, player.is_starting, player.stats, player.columns, player.extra) = (
+            self.full_name, self.player_id, self.fantasy_positions, self.team, self.stats_id, self.sportradar_id, self.injury_status,
+            self.projected_points, self.position, self.starting_position, self.is_starting, self.stats, self.columns, self.extra)
+        if self.extra is not None:
+            player.extra = dict(self.extra)
+        return player
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            value = getattr(self, key)
+            if value is _UNSET:
+                raise KeyError(key)
+            return value
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        column = self.columns.get(key) if self.columns is not None else None
+        # A stat the player isn't projected for (0 in the matrix) is missing, like in Sleeper's projections
+        if column is None or not self.stats[column]:
+            raise KeyError(key)
+        return float(self.stats[column])
+
+    def get(self, key, default=None):
+        # Fields are read straight from their slots, this is called for every player in every stage
+        if key in FIELDS:
+            value = getattr(self, key)
+            return default if value is _UNSET else value
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key) -> bool:
+        if key in FIELDS:
+            return getattr(self, key) is not _UNSET
+        if self.extra is not None and key in self.extra:
+            return True
+        column = self.columns.get(key) if self.columns is not None else None
+        return column is not None and bool(self.stats[column])
+
+    def __setitem__(self, key, value):
+        if key in FIELDS:
+            setattr(self, key, value)
+        else:
+            # Stats are shared, so setting one only changes this record
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in FIELDS and getattr(self, key) is not _UNSET:
+            setattr(self, key, _UNSET)
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for field in INFO_FIELDS + LINEUP_FIELDS:
+            if getattr(self, field) is not _UNSET:
+                yield field
+        if self.extra is not None:
+            yield from self.extra
+        if self.stats is not None:
+            # Only stats the player is projected for, like Sleeper's projections list them
+            categories = list(self.columns)
+            for column in np.flatnonzero(self.stats):
+                if self.extra is None or categories[column] not in self.extra:
+                    yield categories[column]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    # Records are compared and hashed by identity, so list.remove and set membership don't compare every key
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return f"Player({self.full_name or self.player_id!r}, {self.fantasy_positions})"
+
+    def __getstate__(self):
+        # Unset fields are left out, since the marker wouldn't be the same object after unpickling
+        return {field: getattr(self, field) for field in _SLOTS if getattr(self, field) is not _UNSET}
+
+    def __setstate__(self, state: dict):
+        self.__init__()
+        for field, value in state.items():
+            setattr(self, field, value)
+
+
+_SLOTS = Player.__slots__
+
+
+class Roster(Sequence):
+    """
+    A roster's players with projected stats, backed by the week's stat matrix: each player's stats are a view of its row in
+    the matrix, so nothing is copied, and the whole roster is scored with one matrix-vector product (see scoring.score_players).
+    It can be used like the list of players the rest of the app passes around, but isn't changed in place.
+
+    Attributes:
+      - players: tuple of Player records
+      - week_stats: the scoring.WeekStats the stats come from
+      - rows: row of week_stats.matrix for each player
+    """
+
+    __slots__ = ('players', 'week_stats', 'rows')
+
+    def __init__(self, players, week_stats, rows: np.ndarray):
+        self.players = tuple(players)
+        self.week_stats = week_stats
+        self.rows = rows
+
+    @classmethod
+    def from_week_stats(cls, players: list, week_stats) -> 'Roster':
+        """
+        Copies of the players that have a projection in a WeekStats matrix, each holding its row of projected stats. Players
+        without a projection are left out.
+        """
+        projected = [(player, week_stats.rows.get(player.get('player_id'))) for player in players]
+        projected = [(player, row) for player, row in projected if row is not None]
+        rows = np.array([row for _, row in projected], dtype=np.intp)
+
+        records = []
+        for player, row in projected:
+            record = player.copy() if isinstance(player, Player) else Player.from_info({**player, 'fantasy_data_id': player.get('sportradar_id')})
+            record.stats = week_stats.matrix[row]
+            record.columns = week_stats.columns
+            records.append(record)
+        return cls(records, week_stats, rows)
+
+    @property
+    def categories(self) -> list:
+        return self.week_stats.categories
+
+    @property
+    def stats(self) -> np.ndarray:
+        """
+        (players, stat categories) array of the roster's projected stats
+        """
+        return self.week_stats.matrix[self.rows].reshape(len(self.rows), len(self.week_stats.categories))
+
+    def with_players(self, players: list) -> 'Roster':
+        """
+        Same roster and stats with the players replaced by updated copies (in the same order)
+        """
+        return Roster(players, self.week_stats, self.rows)
+
+    def __getitem__(self, index):
+        return self.players[index]
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def __reduce__(self):
+        # Pickled with only the roster's rows of the week's matrix rather than the whole week
+        week_stats = self.week_stats
+        roster_stats = type(week_stats)([week_stats.player_ids[row] for row in self.rows], week_stats.categories, self.stats)
+        return (Roster, (self.players, roster_stats, np.arange(len(self.rows), dtype=np.intp)))
+
+    def __repr__(self) -> str:
+        return f"Roster({list(self.players)!r})"
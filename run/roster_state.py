@@ -0,0 +1,159 @@
+import numpy as np
+from collections.abc import Mapping
+from lineup_optimizer import slot_plan, starting_slots, batch_lineup_totals
+
+
+class RosterState:
+    """
+    A roster indexed by player ID that keeps the total of its optimal lineup for every remaining week up to date as players
+    are traded in and out. A swap only re-solves the lineup slots the moved players can fill (trading a kicker re-solves
+    the K slot, trading a running back re-solves the RB, WR, TE and FLEX slots), and is undone in O(k) by restoring the
+    saved totals, so trying trades one after another doesn't rebuild or rescore the roster.
+
+    Arguments:
+      - players: list of player dictionaries
+      - score_table: player ID -> (weeks,) array of projected points, NaN for weeks with no projection. Players missing from
+                     the table are treated as having no projections.
+      - roster_positions: the league's roster_positions
+      - num_weeks: number of weeks in each score_table row
+    """
+
+    def __init__(self, players: list, score_table: dict, roster_positions: list, num_weeks: int):
+        self.plan = slot_plan(starting_slots(roster_positions))
+        self.score_table = score_table
+        self.num_weeks = num_weeks
+        self.players = {}
+
+        # Lineup components (see SlotPlan.components), the players who can fill each, and each one's optimal total by week
+        self._component_of = {position: positions for positions, _ in self.plan.components for position in positions}
+        self._slots = {positions: tuple(self.plan.slots[index] for index in slot_indices) for positions, slot_indices in self.plan.components}
+        self._members = {positions: set() for positions in self._slots}
+        self._totals = {positions: np.zeros(num_weeks) for positions in self._slots}
+        self._history = []
+
+        for player in players:
+            self._insert(player)
+        for component in self._slots:
+            self._solve(component)
+
+    def __contains__(self, player_id) -> bool:
+        return player_id in self.players
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def _components(self, player: dict) -> set:
+        return {self._component_of[position] for position in (player.get('fantasy_positions') or []) if position in self._component_of}
+
+    def _merge(self, components: set) -> frozenset:
+        """
+        Joins components linked by a player who can play in both into one that is solved as a whole
+        """
+        merged = frozenset().union(*components)
+        self._slots[merged] = tuple(slot for component in components for slot in self._slots.pop(component))
+        self._members[merged] = set().union(*(self._members.pop(component) for component in components))
+        self._totals[merged] = sum(self._totals.pop(component) for component in components)
+        for position in merged:
+            self._component_of[position] = merged
+        return merged
+
+    def _insert(self, player: dict) -> set:
+        """
+        Adds a player without re-solving anything. Returns the components that need re-solving
+        """
+        player_id = player.get('player_id')
+        self.players[player_id] = player
+        components = self._components(player)
+        if len(components) > 1:
+            components = {self._merge(components)}
+        for component in components:
+            self._members[component].add(player_id)
+        return components
+
+    def _remove(self, player_id) -> set:
+        """
+        Removes a player without re-solving anything. Returns the components that need re-solving
+        """
+        player = self.players.pop(player_id)
+        components = self._components(player)
+        for component in components:
+            self._members[component].discard(player_id)
+        return components
+
+    def _solve(self, component: frozenset):
+        members = list(self._members[component])
+        scores = np.full((1, self.num_weeks, len(members)), np.nan)
+        for column, player_id in enumerate(members):
+            row = self.score_table.get(player_id)
+            if row is not None:
+                scores[0, :, column] = row
+        positions = [[self.players[player_id].get('fantasy_positions') or [] for player_id in members]]
+        self._totals[component] = batch_lineup_totals(scores, positions, list(self._slots[component]))[0]
+
+    def apply(self, remove: list, add: list):
+        """
+        Trades players away and brings players in, re-solving only the components they play in. Can be undone with undo.
+
+        Arguments:
+          - remove: player IDs (or player dictionaries) to take off the roster
+          - add: player dictionaries to put on the roster
+        """
+        remove_ids = [player.get('player_id') if isinstance(player, Mapping) else player for player in remove]
+        layout = (dict(self._component_of), dict(self._slots), dict(self._members))
+        saved_totals = dict(self._totals)
+
+        affected = set()
+        removed = []
+        for player_id in remove_ids:
+            if player_id in self.players:
+                removed.append(self.players[player_id])
+                affected |= self._remove(player_id)
+        added = []
+        for player in add:
+            if player.get('player_id') not in self.players:
+                added.append(player.get('player_id'))
+                affected |= self._insert(player)
+
+        # A merge replaces components, so only the ones that still exist are re-solved
+        affected = {self._component_of[next(iter(component))] for component in affected}
+        for component in affected:
+            self._solve(component)
+        self._history.append((removed, added, layout, saved_totals))
+
+    def undo(self):
+        """
+        Reverts the last apply
+        """
+        removed, added, layout, saved_totals = self._history.pop()
+        # Go back to the components as they were before any merge the trade caused, then reverse the moves
+        self._component_of, self._slots, self._members = layout
+        for player_id in added:
+            self._remove(player_id)
+        for player in removed:
+            self._insert(player)
+        self._totals = saved_totals
+
+    def weekly_totals(self) -> np.ndarray:
+        """
+        Optimal lineup total in each week
+        """
+        return sum(self._totals.values(), np.zeros(self.num_weeks))
+
+    def total(self) -> float:
+        """
+        Optimal lineup totals summed over every week
+        """
+        return float(self.weekly_totals().sum())
+
+    def player_list(self) -> list:
+        return list(self.players.values())
+
+    def swap_total(self, remove: list, add: list) -> float:
+        """
+        Total the roster would have after a trade, leaving the roster as it was
+        """
+        self.apply(remove, add)
+        try:
+            return self.total()
+        finally:
+            self.undo()
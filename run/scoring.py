@@ -0,0 +1,142 @@
+import numpy as np
+from numbers import Number
+from records import Roster
+
+
+class WeekStats:
+    """
+    Projected stats for every player in one week, held as a players x stat categories matrix so a league's scoring settings
+    can be applied to all of them with a single matrix-vector product.
+
+    Attributes:
+      - player_ids: player ID for each row of the matrix
+      - rows: dictionary from player ID to row number
+      - categories: stat category for each column of the matrix
+      - columns: dictionary from stat category to column number
+      - matrix: float array of shape (len(player_ids), len(categories)), with 0 for stats a player has no projection for
+    """
+
+    def __init__(self, player_ids: list, categories: list, matrix: np.ndarray):
+        self.player_ids = list(player_ids)
+        self.rows = {player_id: row for row, player_id in enumerate(self.player_ids)}
+        self.categories = list(categories)
+        self.columns = {category: column for column, category in enumerate(self.categories)}
+        self.matrix = matrix
+
+    def __contains__(self, player_id) -> bool:
+        return player_id in self.rows
+
+    def __len__(self) -> int:
+        return len(self.player_ids)
+
+
+def build_stat_matrix(projections: dict) -> WeekStats:
+    """
+    Turns one week of Sleeper projections (player ID -> {stat: value}) into a WeekStats matrix. Only numeric stats are kept.
+    This should be done once per week and shared by every league that needs that week.
+    """
+    if not projections:
+        return WeekStats([], [], np.zeros((0, 0)))
+
+    player_ids = list(projections)
+
+    # Every numeric stat that shows up for any player becomes a column
+    columns = {}
+    for stats in projections.values():
+        for category, value in stats.items():
+            if category not in columns and isinstance(value, Number):
+                columns[category] = len(columns)
+
+    matrix = np.zeros((len(player_ids), len(columns)))
+    for row, player_id in enumerate(player_ids):
+        for category, value in projections[player_id].items():
+            column = columns.get(category)
+            if column is not None and isinstance(value, Number):
+                matrix[row, column] = value
+
+    return WeekStats(player_ids, list(columns), matrix)
+
+
+def build_scoring_vector(scoring_settings: dict, categories: list) -> np.ndarray:
+    """
+    Lines a league's scoring settings up with the stat categories of a WeekStats matrix. Categories the league doesn't score
+    get a weight of 0.
+    """
+    return np.array([scoring_settings.get(category, 0) for category in categories], dtype=float)
+
+
+def score_week(week_stats: WeekStats, scoring_settings: dict) -> np.ndarray:
+    """
+    Projected points for every player in a week, in the same order as week_stats.player_ids
+    """
+    if not len(week_stats):
+        return np.zeros(0)
+    return week_stats.matrix @ build_scoring_vector(scoring_settings, week_stats.categories)
+
+
+def week_score_table(week_stats: WeekStats, scoring_settings: dict) -> dict:
+    """
+    Projected points for every player in a week as a dictionary of player ID -> points rounded to the hundredths place,
+    so a roster (or the whole league) can be scored with lookups
+    """
+    scores = score_week(week_stats, scoring_settings)
+    return {player_id: round(float(score), 2) for player_id, score in zip(week_stats.player_ids, scores)}
+
+
+def score_players(players: list, scoring_settings: dict) -> np.ndarray:
+    """
+    Projected points for a records.Roster, or a list of player dictionaries that already have their projected stats merged in.
+    Only the categories the league scores are read from each player dictionary, rather than every key.
+    """
+    if isinstance(players, Roster):
+        # The roster's stats are already one array, lined up with its stat categories
+        return players.stats @ build_scoring_vector(scoring_settings, players.categories)
+
+    categories = [category for category, weight in scoring_settings.items() if weight]
+    stats = np.array([[player.get(category) or 0 for category in categories] for player in players], dtype=float).reshape(len(players), len(categories))
+    return stats @ build_scoring_vector(scoring_settings, categories)
+
+
+def roster_score_tensor(rosters: list, weeks: list, scoring_settings: dict) -> np.ndarray:
+    """
+    Projected points for every player on every roster in every week, ready for lineup_optimizer.batch_lineup_totals.
+
+    Arguments:
+      - rosters: list of rosters, each a list of player IDs
+      - weeks: list of WeekStats, one per week
+      - scoring_settings: league scoring settings
+    Returns:
+      (rosters, weeks, players) array rounded to the hundredths place. NaN marks players with no projection that week and pads
+      shorter rosters.
+    """
+    num_players = max((len(roster) for roster in rosters), default=0)
+    tensor = np.full((len(rosters), len(weeks), num_players), np.nan)
+
+    for week, week_stats in enumerate(weeks):
+        week_scores = np.round(score_week(week_stats, scoring_settings), 2)
+        for roster, player_ids in enumerate(rosters):
+            rows = [week_stats.rows.get(player_id, -1) for player_id in player_ids]
+            found = [player for player, row in enumerate(rows) if row >= 0]
+            tensor[roster, week, found] = week_scores[[rows[player] for player in found]]
+
+    return tensor
+
+
+def season_score_table(weeks: list, scoring_settings: dict) -> dict:
+    """
+    Projected points by week for every player with a projection in any of the weeks, for roster_state.RosterState.
+
+    Arguments:
+      - weeks: list of WeekStats, one per week
+      - scoring_settings: league scoring settings
+    Returns:
+      dictionary of player ID -> (weeks,) array rounded to the hundredths place, NaN for weeks with no projection
+    """
+    player_ids = list(dict.fromkeys(player_id for week_stats in weeks for player_id in week_stats.player_ids))
+    rows = {player_id: row for row, player_id in enumerate(player_ids)}
+    table = np.full((len(player_ids), len(weeks)), np.nan)
+
+    for week, week_stats in enumerate(weeks):
+        table[[rows[player_id] for player_id in week_stats.player_ids], week] = np.round(score_week(week_stats, scoring_settings), 2)
+
+    return {player_id: table[row] for player_id, row in rows.items()}
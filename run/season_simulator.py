@@ -0,0 +1,266 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from lineup_optimizer import solve_lineup, starting_slots
+
+
+# Spread of a player's weekly score as a fraction of their projection, by position
+POSITION_CV = {'QB': 0.35, 'RB': 0.5, 'WR': 0.55, 'TE': 0.6, 'K': 0.4, 'DEF': 0.6}
+DEFAULT_CV = 0.5
+
+# Smallest spread used for anybody with a projection, so low projections still vary
+MIN_SD = 1.5
+
+# Chance a player plays this week given their injury status. Statuses only apply to the current week, since later weeks'
+# projections already account for longer injuries.
+INJURY_AVAILABILITY = {'Questionable': 0.85, 'Doubtful': 0.25, 'Out': 0.0, 'IR': 0.0, 'PUP': 0.0, 'Sus': 0.0, 'NA': 0.0}
+
+DEFAULT_SIMULATIONS = 5000
+
+# Seasons simulated per block of arrays, which keeps memory flat for large runs
+SIMULATION_BLOCK = 1000
+
+
+def playoff_bracket(playoff_teams: int) -> list:
+    """
+    Seeds in bracket order for a fixed single elimination bracket, where slot 2i plays slot 2i+1 and winners stay in order.
+    The bracket is padded to a power of two with seeds above playoff_teams, which stand for byes.
+    """
+    order = [1]
+    while len(order) < playoff_teams:
+        size = len(order) * 2
+        order = [seed for top in order for seed in (top, size + 1 - top)]
+    return order
+
+
+def playoff_round_weeks(playoff_week_start: int, playoff_teams: int, playoff_round_type: int) -> list:
+    """
+    Weeks each playoff round is played over. playoff_round_type is Sleeper's setting: 0 is one week per round, 1 is one week
+    per round except a two week championship, and 2 is two weeks per round.
+    """
+    num_rounds = max(len(playoff_bracket(playoff_teams)).bit_length() - 1, 0)
+    rounds = []
+    week = playoff_week_start
+    for round_number in range(num_rounds):
+        length = 2 if playoff_round_type == 2 or (playoff_round_type == 1 and round_number == num_rounds - 1) else 1
+        rounds.append(list(range(week, week + length)))
+        week += length
+    return rounds
+
+
+def _simulate_block(arrays: dict, simulations: int, seed) -> dict:
+    """
+    Plays out the rest of the season `simulations` times. Kept at module level so process pool workers can run it.
+
+    Returns:
+      counts per team of playoff appearances and championships, and the total wins over every simulation
+    """
+    rng = np.random.default_rng(seed)
+    means, sds, first_week_availability = arrays['means'], arrays['sds'], arrays['first_week_availability']
+    num_teams, num_weeks, _ = means.shape
+
+    # A team's score is a sum of independent normal player scores, so it is drawn as one normal with their combined mean
+    # and variance. Only this week's starters can miss the game (injuries), so that week's sum depends on who plays.
+    noise = rng.standard_normal((simulations, num_teams, num_weeks), dtype=np.float32)
+    team_scores = means.sum(axis=-1) + np.sqrt((sds ** 2).sum(axis=-1)) * noise
+    if num_weeks:
+        plays = rng.random((simulations,) + first_week_availability.shape, dtype=np.float32) < first_week_availability
+        first_week_means = (plays * means[:, 0]).sum(axis=-1)
+        first_week_sds = np.sqrt((plays * sds[:, 0] ** 2).sum(axis=-1))
+        team_scores[:, :, 0] = first_week_means + first_week_sds * noise[:, :, 0]
+
+    wins = np.repeat(arrays['wins'][None, :], simulations, axis=0)
+    points_for = np.repeat(arrays['points_for'][None, :], simulations, axis=0)
+    for week, home, away in arrays['schedule']:
+        home_scores = team_scores[:, home, week]
+        away_scores = team_scores[:, away, week]
+        wins[:, home] += (home_scores > away_scores) + 0.5 * (home_scores == away_scores)
+        wins[:, away] += (away_scores > home_scores) + 0.5 * (home_scores == away_scores)
+        points_for[:, home] += home_scores
+        points_for[:, away] += away_scores
+
+    # Seed by wins, then points for
+    seeds = np.argsort(-(wins * 1e6 + points_for), axis=1, kind='stable')
+    playoff_teams = min(arrays['playoff_teams'], num_teams)
+    made_playoffs = np.zeros(num_teams)
+    np.add.at(made_playoffs, seeds[:, :playoff_teams].ravel(), 1)
+
+    # Teams in bracket order, -1 for a bye
+    bracket = np.array([seed - 1 if seed <= playoff_teams else -1 for seed in playoff_bracket(playoff_teams)])
+    alive = np.where(bracket >= 0, seeds[:, np.maximum(bracket, 0)], -1)
+    rows = np.arange(simulations)[:, None]
+    for round_weeks in arrays['playoff_rounds']:
+        if alive.shape[1] == 1:
+            break
+        round_scores = team_scores[:, :, round_weeks].sum(axis=-1) if round_weeks else np.zeros((simulations, num_teams), dtype=np.float32)
+        first, second = alive[:, 0::2], alive[:, 1::2]
+        first_scores = np.where(first >= 0, round_scores[rows, np.maximum(first, 0)], -np.inf)
+        second_scores = np.where(second >= 0, round_scores[rows, np.maximum(second, 0)], -np.inf)
+        alive = np.where(first_scores >= second_scores, first, second)
+
+    championships = np.zeros(num_teams)
+    if alive.shape[1] == 1:
+        np.add.at(championships, alive[:, 0][alive[:, 0] >= 0], 1)
+
+    return {'made_playoffs': made_playoffs, 'championships': championships, 'wins': wins.sum(axis=0)}
+
+
+class SeasonSimulator:
+    """
+    Monte Carlo simulation of the rest of a league's season. Each team starts its optimal lineup by projected points in every
+    week, each player's score is drawn around their Sleeper projection with a position-specific spread, and the remaining
+    schedule and a fixed playoff bracket are played out thousands of times to get each team's playoff and championship odds.
+
+    Players score nothing in weeks they have no projection (byes), and injured players only play this week with the chance
+    given by INJURY_AVAILABILITY. Every run with the same seed draws the same random numbers for each team, so comparing
+    odds before and after a trade isn't swamped by simulation noise.
+
+    Arguments:
+      - rosters: roster ID -> list of player dictionaries (with injury_status from the player index)
+      - standings: roster ID -> (wins, ties, points for) so far
+      - schedule: list of (week, roster ID, roster ID) for the remaining regular season matchups
+      - score_table: player ID -> projected points for each week in weeks, NaN for no projection
+      - weeks: the week number of each score_table column, starting with the current week
+      - roster_positions: the league's roster_positions
+      - playoff_teams, playoff_week_start, playoff_round_type: the league's playoff settings
+    """
+
+    def __init__(self, rosters: dict, standings: dict, schedule: list, score_table: dict, weeks: list, roster_positions: list, playoff_teams: int, playoff_week_start: int, playoff_round_type: int = 0):
+        self.roster_ids = list(rosters)
+        self.rosters = {roster_id: list(players) for roster_id, players in rosters.items()}
+        self.slots = starting_slots(roster_positions)
+        self.weeks = list(weeks)
+        self.playoff_teams = playoff_teams
+
+        # Every rostered player gets a column, so traded players keep their projections
+        self.player_ids = list(dict.fromkeys(player.get('player_id') for players in self.rosters.values() for player in players))
+        self.columns = {player_id: column for column, player_id in enumerate(self.player_ids)}
+        self.players = {player.get('player_id'): player for players in self.rosters.values() for player in players}
+
+        means = np.full((len(self.weeks), len(self.player_ids)), np.nan)
+        for column, player_id in enumerate(self.player_ids):
+            row = score_table.get(player_id)
+            if row is not None:
+                means[:, column] = row
+        self.availability = np.where(np.isnan(means), 0.0, 1.0)
+        if len(self.weeks):
+            self.availability[0] *= [INJURY_AVAILABILITY.get(self.players[player_id].get('injury_status'), 1.0) for player_id in self.player_ids]
+        self.means = np.nan_to_num(means, nan=0.0)
+
+        cv = np.array([POSITION_CV.get((self.players[player_id].get('fantasy_positions') or [None])[0], DEFAULT_CV) for player_id in self.player_ids])
+        self.sds = np.where(self.means > 0, np.maximum(self.means * cv, MIN_SD), 0.0)
+
+        self.lineups = {roster_id: self.lineup_columns(players) for roster_id, players in self.rosters.items()}
+
+        team_index = {roster_id: team for team, roster_id in enumerate(self.roster_ids)}
+        week_index = {week: index for index, week in enumerate(self.weeks)}
+        self.standings = np.array([standings.get(roster_id, (0, 0, 0.0)) for roster_id in self.roster_ids], dtype=float).reshape(len(self.roster_ids), 3)
+        self.schedule = [
+            (week_index[week], team_index[home], team_index[away])
+            for week, home, away in schedule
+            if week in week_index and home in team_index and away in team_index
+        ]
+        self.playoff_rounds = [
+            [week_index[week] for week in round_weeks if week in week_index]
+            for round_weeks in playoff_round_weeks(playoff_week_start, playoff_teams, playoff_round_type)
+        ]
+
+    def lineup_columns(self, players: list) -> np.ndarray:
+        """
+        Columns of the players each week's optimal lineup (by expected points) starts, padded with the zero column
+
+        Returns:
+          (weeks, slots) array
+        """
+        padding = len(self.player_ids)
+        columns = [self.columns[player.get('player_id')] for player in players]
+        positions = [player.get('fantasy_positions') or [] for player in players]
+        expected = self.means * self.availability
+
+        lineups = np.full((len(self.weeks), len(self.slots)), padding)
+        for week in range(len(self.weeks)):
+            playing = [index for index, column in enumerate(columns) if self.availability[week, column] > 0]
+            assignment, _ = solve_lineup([expected[week, columns[index]] for index in playing], [positions[index] for index in playing], self.slots)
+            lineups[week] = [columns[playing[player]] if player is not None else padding for player in assignment]
+        return lineups
+
+    def with_trade(self, roster_a, roster_b, players_from_a: list, players_from_b: list) -> 'SeasonSimulator':
+        """
+        Copy of the simulator with players traded between two rosters. Only those two teams' lineups are re-solved.
+        """
+        trade = object.__new__(SeasonSimulator)
+        trade.__dict__.update(self.__dict__)
+        ids_from_a = {player.get('player_id') for player in players_from_a}
+        ids_from_b = {player.get('player_id') for player in players_from_b}
+
+        trade.rosters = dict(self.rosters)
+        trade.rosters[roster_a] = [player for player in self.rosters[roster_a] if player.get('player_id') not in ids_from_a] + [player for player in self.rosters[roster_b] if player.get('player_id') in ids_from_b]
+        trade.rosters[roster_b] = [player for player in self.rosters[roster_b] if player.get('player_id') not in ids_from_b] + [player for player in self.rosters[roster_a] if player.get('player_id') in ids_from_a]
+        trade.lineups = dict(self.lineups)
+        trade.lineups[roster_a] = trade.lineup_columns(trade.rosters[roster_a])
+        trade.lineups[roster_b] = trade.lineup_columns(trade.rosters[roster_b])
+        return trade
+
+    def _arrays(self) -> dict:
+        """
+        Projection mean and spread of every starter in every team's lineup each week, which is all the simulation needs
+        """
+        lineups = np.array([self.lineups[roster_id] for roster_id in self.roster_ids], dtype=int).reshape(len(self.roster_ids), len(self.weeks), len(self.slots))
+        week_index = np.arange(len(self.weeks))[None, :, None]
+        # The last column is lineup padding (an empty slot)
+        means = np.concatenate([self.means, np.zeros((len(self.weeks), 1))], axis=1)[week_index, lineups]
+        sds = np.concatenate([self.sds, np.zeros((len(self.weeks), 1))], axis=1)[week_index, lineups]
+        availability = np.concatenate([self.availability, np.zeros((len(self.weeks), 1))], axis=1)[week_index, lineups]
+        return {
+            'means': means.astype(np.float32),
+            'sds': sds.astype(np.float32),
+            'first_week_availability': (availability[:, 0] if len(self.weeks) else np.zeros((len(self.roster_ids), len(self.slots)))).astype(np.float32),
+            'wins': self.standings[:, 0] + 0.5 * self.standings[:, 1],
+            'points_for': self.standings[:, 2],
+            'schedule': self.schedule,
+            'playoff_teams': self.playoff_teams,
+            'playoff_rounds': self.playoff_rounds,
+        }
+
+    def run(self, simulations: int = DEFAULT_SIMULATIONS, seed: int = 0, processes: int = None) -> dict:
+        """
+        Simulates the rest of the season.
+
+        Arguments:
+          - simulations: number of seasons to play out
+          - seed: random seed. Runs with the same seed and number of simulations draw the same random numbers
+          - processes: worker processes to split the seasons across, or None to run in this process
+        Returns:
+          roster ID -> {'playoff_odds', 'championship_odds', 'expected_wins'}
+        """
+        arrays = self._arrays()
+        sizes = [min(SIMULATION_BLOCK, simulations - start) for start in range(0, simulations, SIMULATION_BLOCK)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+        if processes and processes > 1 and len(sizes) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(_simulate_block, [arrays] * len(sizes), sizes, seeds))
+        else:
+            results = [_simulate_block(arrays, size, block_seed) for size, block_seed in zip(sizes, seeds)]
+
+        made_playoffs = sum(result['made_playoffs'] for result in results)
+        championships = sum(result['championships'] for result in results)
+        wins = sum(result['wins'] for result in results)
+        return {
+            roster_id: {
+                'playoff_odds': round(float(made_playoffs[team]) / max(simulations, 1), 4),
+                'championship_odds': round(float(championships[team]) / max(simulations, 1), 4),
+                'expected_wins': round(float(wins[team]) / max(simulations, 1), 2),
+            }
+            for team, roster_id in enumerate(self.roster_ids)
+        }
+
+    def trade_odds(self, roster_a, roster_b, players_from_a: list, players_from_b: list, simulations: int = DEFAULT_SIMULATIONS, seed: int = 0, processes: int = None) -> dict:
+        """
+        Odds for both teams before and after a trade, simulated with the same random numbers
+
+        Returns:
+          roster ID -> {'before': odds, 'after': odds} for the two teams in the trade
+        """
+        before = self.run(simulations, seed, processes)
+        after = self.with_trade(roster_a, roster_b, players_from_a, players_from_b).run(simulations, seed, processes)
+        return {roster_id: {'before': before[roster_id], 'after': after[roster_id]} for roster_id in (roster_a, roster_b)}
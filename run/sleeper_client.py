@@ -0,0 +1,152 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Union
+import threading
+import time
+from urllib.parse import urlsplit
+from metrics import registry
+
+
+SLEEPER_BASE_URL = 'https://api.sleeper.app/v1/'
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Status codes that are worth retrying (rate limiting and transient server errors)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class PooledClient:
+    """
+    Wrapper around a requests.Session so every call reuses keep-alive connections instead of paying a new TLS
+    handshake. Every request gets a timeout and a bounded number of retries with exponential backoff.
+
+    Arguments:
+      - base_url: prefix for relative endpoints (absolute URLs are passed through unchanged)
+      - pool_size: number of connections kept alive per host
+      - retries: maximum number of retries for connection errors and retryable status codes
+      - backoff_factor: sleep between retries is backoff_factor * 2 ** (retry - 1) seconds
+      - timeout: default (connect, read) timeout used when a call doesn't pass its own
+      - max_workers: number of threads used by fetch_many
+    """
+
+    def __init__(self, base_url: str = '', pool_size: int = 16, retries: int = 3, backoff_factor: float = 0.3,
+                 timeout: Union[float, tuple] = DEFAULT_TIMEOUT, max_workers: int = 8):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.session = self._build_session()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _build_session(self) -> requests.Session:
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Created on first use so importing the module doesn't start any threads
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pooled-client')
+        return self._executor
+
+    def url(self, endpoint: str) -> str:
+        if endpoint.startswith(('http://', 'https://')):
+            return endpoint
+        return f'{self.base_url}{endpoint}'
+
+    def get(self, endpoint: str, **kwargs) -> Optional[requests.Response]:
+        """
+        GET an endpoint (relative to base_url) or an absolute URL. Returns None if the request couldn't be made at all.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.url(endpoint)
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.RequestException as error:
+            print(f"Error: {error}")
+            registry.count('http_requests_total', host=host, status='0')
+            return None
+        finally:
+            registry.observe('http_request_seconds', time.perf_counter() - start, host=host)
+
+        # urllib3 keeps the retries it made to answer the request on the raw response
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            registry.count('http_retries_total', len(retries.history), host=host)
+        registry.count('http_requests_total', host=host, status=str(response.status_code))
+        registry.count('http_response_bytes_total', len(response.content), host=host)
+        return response
+
+    def get_json(self, endpoint: str, **kwargs):
+        """
+        GET an endpoint and decode the JSON body. Returns None (after printing the error) if the request wasn't successful.
+        """
+        response = self.get(endpoint, **kwargs)
+        if response is None:
+            return None
+
+        # Check if the request was successful
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Error: {response.status_code}, {response.text}")
+            return None
+
+    def get_content(self, endpoint: str, **kwargs) -> Optional[bytes]:
+        """
+        GET an endpoint and return the raw body, or None if the request wasn't successful.
+        """
+        response = self.get(endpoint, **kwargs)
+        if response is None:
+            return None
+
+        if response.status_code == 200:
+            return response.content
+        else:
+            print(f"Error: {response.status_code}, {response.text}")
+            return None
+
+    def fetch_many(self, endpoints: Iterable[str], parse_json: bool = True, **kwargs) -> list:
+        """
+        Issues independent GET requests concurrently over the shared session.
+
+        Arguments:
+          - endpoints: endpoints or absolute URLs to fetch
+          - parse_json: decode each body as JSON if True, otherwise return the raw bytes
+        Returns:
+          list of results in the same order as endpoints, with None for any request that failed
+        """
+        endpoints = list(endpoints)
+        fetch = self.get_json if parse_json else self.get_content
+
+        # Not worth the thread hop for a single request
+        if len(endpoints) <= 1:
+            return [fetch(endpoint, **kwargs) for endpoint in endpoints]
+
+        return list(self.executor.map(lambda endpoint: fetch(endpoint, **kwargs), endpoints))
+
+
+# Shared client used by every Sleeper fetcher
+sleeper = PooledClient(base_url=SLEEPER_BASE_URL)
@@ -0,0 +1,62 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+# Directory for locally stored data (player index, cached projections and rankings). Defaults to data/ in the project folder
+# so files don't end up in whatever directory streamlit was launched from.
+DATA_DIR = os.environ.get('FANTASY_DATA_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+
+
+def data_path(*parts: str) -> str:
+    """
+    Builds a path inside DATA_DIR, creating the parent directory if it doesn't exist yet
+    """
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Holds an exclusive lock on a lock file for the duration of the with block. Used to make sure only one process (or one
+    streamlit session) refreshes a shared data file at a time. Blocks until the lock is free.
+    """
+    with open(path, 'a+') as lock_file:
+        if os.name == 'nt':
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write(path: str, data: bytes):
+    """
+    Writes a file so readers see either the old contents or the new contents, never a partial file. The data goes to a
+    temporary file in the same directory, which then replaces the target in one step.
+    """
+    directory = os.path.dirname(path) or '.'
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,67 @@
+import threading
+import streamlit as st
+from functools import wraps
+from typing import Callable, Optional
+from cache_backend import get_cache_backend, set_cache_backend
+from metrics import registry
+
+
+class _NotCached(Exception):
+    """
+    Raised from inside a Streamlit cached call to keep a None result out of the cache
+    """
+
+
+def _counted(streamlit_cache: Callable, function: Callable, show_spinner: bool, ttl: Optional[float]) -> Callable:
+    """
+    Caches a function with st.cache_data or st.cache_resource, counting hits and misses in cache_requests_total under the
+    function's name, like the in-process backend's keyed caches report them. Streamlit doesn't say whether a call was served
+    from its cache, so a call that ran the function is a miss. None results aren't cached.
+    """
+    ran = threading.local()
+
+    @wraps(function)
+    def compute(*args, **kwargs):
+        ran.value = True
+        value = function(*args, **kwargs)
+        if value is None:
+            # Streamlit doesn't cache a call that raised, so a failed request is tried again next time like with keyed_cache
+            raise _NotCached()
+        return value
+
+    cached = streamlit_cache(compute, show_spinner = show_spinner, ttl = ttl)
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        # Streamlit runs the function in the calling thread, so a thread-local flag tells this call's miss from another session's
+        ran.value = False
+        try:
+            value = cached(*args, **kwargs)
+        except _NotCached:
+            value = None
+        registry.count('cache_requests_total', cache=function.__name__, result='miss' if ran.value else 'hit')
+        return value
+
+    wrapper.clear = cached.clear
+    return wrapper
+
+
+class StreamlitCacheBackend:
+    """
+    Cache backend for the app. Uses st.cache_data and st.cache_resource, so cached results are shared by every session and
+    cleared with Streamlit's own cache controls. Streamlit decides how many entries to keep, so maxsize isn't used.
+    """
+
+    def cache_data(self, function: Callable, show_spinner: bool = False, ttl: Optional[float] = None, maxsize: int = 128) -> Callable:
+        return _counted(st.cache_data, function, show_spinner, ttl)
+
+    def cache_resource(self, function: Callable, show_spinner: bool = False, ttl: Optional[float] = None, maxsize: int = 128) -> Callable:
+        return _counted(st.cache_resource, function, show_spinner, ttl)
+
+
+def use_streamlit_cache():
+    """
+    Installs the Streamlit backend. The app script runs again on every rerun, so it's only installed the first time.
+    """
+    if not isinstance(get_cache_backend(), StreamlitCacheBackend):
+        set_cache_backend(StreamlitCacheBackend())
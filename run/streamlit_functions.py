@@ -1,6 +1,8 @@
 import streamlit as st
 from data_functions import * 
 from fantasy_pros_scraper import * 
+from metrics import registry, timed
+from rankings_index import RankingsIndex
 
 
 def print_players_projections(players: list):
@@ -75,7 +77,8 @@ def checkbox_players(player_list: list):
 
 
 
-def show_trade_form(username: str, league_rosters: list, user_info, user_roster_ros_rankings: list, ros_rankings: list, player_data: dict):
+@timed()
+def show_trade_form(username: str, league_rosters: list, user_info, user_roster_ros_rankings: list, ros_rankings: RankingsIndex, owner_rosters: dict):
     """ Creates the streamlit form that allows user to select players and submit a trade to be analyzed
     
     Returns:
@@ -96,8 +99,8 @@ def show_trade_form(username: str, league_rosters: list, user_info, user_roster_
             trade_selected_players = []
             if team_to_trade_with:
                 trade_user_id = next((user_id for user_id, username in other_league_usernames.items() if username == team_to_trade_with), None)
-                trade_roster_info = get_user_roster_info(league_rosters, trade_user_id)
-                trade_roster_players = get_user_roster_players(player_data, trade_roster_info)
+                # Built once per league and week with every other roster (see get_league_power_rankings)
+                trade_roster_players = owner_rosters.get(trade_user_id, [])
                 trade_ros_rankings = add_ros_rankings(trade_roster_players, ros_rankings, "fantasy_names.db")
                 trade_selected_players = checkbox_players(trade_ros_rankings)
 
@@ -108,15 +111,14 @@ def show_trade_form(username: str, league_rosters: list, user_info, user_roster_
 
 
 
+@timed()
 def analyze_trade(user_roster_ros_rankings: list, ros_rankings: list, user_selected_players: list, trade_selected_players: list, selected_league: dict, current_state: dict):
     """
     
     Uses functions from api_functions to calculate the overall differences in projections before and after the trade
     
     """
-    end_week = get_end_week(selected_league)
-    user_roster_after, trade_roster_after = swap_players(user_roster_ros_rankings, ros_rankings, user_selected_players, trade_selected_players)
-    user_difference, trade_difference = calculate_total_projection_differences(user_roster_ros_rankings, user_roster_after, ros_rankings, trade_roster_after, current_state['league_season'], current_state['week'], end_week, selected_league)
+    user_difference, trade_difference = calculate_trade_differences(user_roster_ros_rankings, ros_rankings, user_selected_players, trade_selected_players, selected_league, current_state)
     
     return user_difference, trade_difference, user_selected_players, trade_selected_players
 
@@ -154,17 +156,205 @@ def display_trade_results(username: str, user_difference: float, trade_differenc
 
 
 
-def display_trade_decision(user_difference: float, trade_difference: float, avg_rank_received: float, avg_rank_sent: float):
+@timed()
+def analyze_trade_odds(league_rosters: list, user_info: dict, player_data: dict, team_to_trade_with: str, user_selected_players: list, trade_selected_players: list, selected_league: dict, current_state: dict) -> dict:
+    """
+    Simulates the rest of the season with and without the trade to get both teams' playoff and championship odds
+    """
+    other_league_usernames = get_other_league_usernames(league_rosters, user_info)
+    trade_user_id = next((user_id for user_id, username in other_league_usernames.items() if username == team_to_trade_with), None)
+
+    with st.spinner("Simulating the rest of the season..."):
+        return calculate_trade_odds(league_rosters, player_data, user_info['user_id'], trade_user_id, user_selected_players, trade_selected_players, selected_league, current_state)
+
+
+
+
+def display_trade_odds(username: str, team_to_trade_with: str, trade_odds: dict):
+    """
+    Displays how the trade changes each team's playoff and championship odds
+    """
+    if not trade_odds:
+        # The schedule or a roster couldn't be loaded, and a season with games missing would give the wrong odds
+        st.write("**Playoff and championship odds unavailable right now**")
+        return
+
+    col1, col2 = st.columns(2)
+    for column, name, odds in ((col1, username, trade_odds['user']), (col2, team_to_trade_with, trade_odds['trade'])):
+        with column:
+            before, after = odds['before'], odds['after']
+            st.write(f"**Playoff Odds for {name}:** {before['playoff_odds']:.1%} → {after['playoff_odds']:.1%}")
+            st.write(f"**Championship Odds for {name}:** {before['championship_odds']:.1%} → {after['championship_odds']:.1%}")
+
+
+
+
+def display_trade_decision(user_difference: float, trade_difference: float, avg_rank_received: float, avg_rank_sent: float, trade_odds: dict = None):
     """
     
     Need to improve the logic, but it provides a "recommendation" based on change in projections after the trade and the average rankings of
     the players involved in the trade. Doesn't provide great recommendations because it just calculates average ranking.
+    When the season has been simulated, the recommendation is based on the change in the user's championship and playoff odds instead.
     
     """
     
-    if (user_difference > trade_difference) and (user_difference > 0) and (avg_rank_received < avg_rank_sent):
+    if trade_odds:
+        before, after = trade_odds['user']['before'], trade_odds['user']['after']
+        # Changes under a percentage point are within the simulation's noise
+        odds_change = max(after['championship_odds'] - before['championship_odds'], after['playoff_odds'] - before['playoff_odds'], key=abs)
+        if odds_change >= 0.01:
+            st.header("This trade is likely to benefit your team! :100:")
+        elif odds_change <= -0.01:
+            st.header("This trade is unlikely to benefit your team :cry:")
+        else:
+            st.header("This is a fairly even trade. Make the decision that you feel is best :shrug:")
+    elif (user_difference > trade_difference) and (user_difference > 0) and (avg_rank_received < avg_rank_sent):
         st.header("This trade is likely to benefit your team! :100:")
     elif (user_difference < 0) and (avg_rank_received > avg_rank_sent):
         st.header("This trade is unlikely to benefit your team :cry:")
     else:
         st.header("This is a fairly even trade. Make the decision that you feel is best :shrug:")
+
+
+
+
+def player_label(player: dict) -> str:
+    """
+    Name and positions of a player for display. Defenses have no full name, so their player ID (the team) is used instead
+    """
+    return f"{player['full_name'] if player.get('full_name') else player.get('player_id')} ({', '.join(player.get('fantasy_positions') or [])})"
+
+
+
+
+@timed()
+def show_trade_finder(username: str, league_rosters: list, user_info: dict, player_data: dict, selected_league: dict, current_state: dict):
+    """
+    Button that searches the whole league for the trades that most improve the user's projected points for the rest of the season
+    without costing the other team any, then lists them best first
+    """
+    if not st.button("Find Trades"):
+        return
+
+    with st.spinner("Searching every roster in the league..."):
+        trades = find_league_trades(league_rosters, user_info, player_data, selected_league, current_state)
+        other_league_usernames = get_other_league_usernames(league_rosters, user_info)
+
+    if not trades:
+        st.write("No trades found that improve your team without costing the other team projected points")
+        return
+
+    for trade in trades:
+        trade_username = other_league_usernames.get(trade['owner_id'], trade['owner_id'])
+        st.write(f"**Trade with {trade_username}:** {username} +{trade['user_gain']} :chart_with_upwards_trend:, {trade_username} +{trade['partner_gain']}")
+        st.write(f"- Send: {', '.join(player_label(player) for player in trade['give'])}")
+        st.write(f"- Receive: {', '.join(player_label(player) for player in trade['receive'])}")
+
+
+
+
+@timed()
+def show_power_rankings(username: str, league_rosters: list, user_info: dict, player_data: dict, selected_league: dict, current_state: dict):
+    """
+    Table of every team in the league ranked by the projected points of their optimal lineups for the rest of the season, along
+    with their record and this week's projection
+    """
+    with st.spinner("Projecting every roster in the league..."):
+        teams = get_league_power_rankings(league_rosters, player_data, selected_league, current_state)
+        # The cached usernames are shared, so the user's own name is added to a copy
+        league_usernames = {**get_other_league_usernames(league_rosters, user_info), user_info['user_id']: username}
+
+    st.dataframe(
+        [
+            {
+                'Rank': team['rank'],
+                'Team': league_usernames.get(team['owner_id']) or f"Roster {team['roster_id']}",
+                'Record': f"{team['wins']}-{team['losses']}" + (f"-{team['ties']}" if team['ties'] else ""),
+                'Points For': round(team['points_for'], 2),
+                'Projected This Week': team['week_points'],
+                'Projected Rest of Season': team['season_points'],
+            }
+            for team in teams
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+
+
+
+
+def show_metrics():
+    """
+    Debug page with the latency of every instrumented stage and HTTP host, cache hit rates, and the raw metrics for export
+    """
+    snapshot = registry.snapshot()
+    histograms = snapshot['histograms']
+
+    st.write("**Stages** (fetchers, scrapers, joins and optimizers; cached functions only record calls that missed the cache)")
+    st.dataframe(
+        sorted(
+            [
+                {
+                    'Stage': histogram['labels']['stage'],
+                    'Calls': histogram['count'],
+                    'Total (s)': round(histogram['sum'], 3),
+                    'Mean (ms)': round(1000 * histogram['sum'] / histogram['count'], 2),
+                    'p50 under (s)': histogram['p50'],
+                    'p95 under (s)': histogram['p95'],
+                }
+                for histogram in histograms if histogram['name'] == 'stage_seconds'
+            ],
+            key=lambda row: row['Total (s)'], reverse=True,
+        ),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    counters = {}
+    for counter in snapshot['counters']:
+        counters.setdefault(counter['name'], []).append(counter)
+
+    st.write("**HTTP**")
+    requests_by_host = {}
+    for counter in counters.get('http_requests_total', []):
+        requests_by_host.setdefault(counter['labels']['host'], {})[counter['labels']['status']] = counter['value']
+    st.dataframe(
+        [
+            {
+                'Host': histogram['labels']['host'],
+                'Requests': histogram['count'],
+                'Statuses': ', '.join(f"{status}: {value:g}" for status, value in sorted(requests_by_host.get(histogram['labels']['host'], {}).items())),
+                'Retries': sum(counter['value'] for counter in counters.get('http_retries_total', []) if counter['labels']['host'] == histogram['labels']['host']),
+                'MB received': round(sum(counter['value'] for counter in counters.get('http_response_bytes_total', []) if counter['labels']['host'] == histogram['labels']['host']) / 1e6, 3),
+                'Total (s)': round(histogram['sum'], 3),
+                'p95 under (s)': histogram['p95'],
+            }
+            for histogram in histograms if histogram['name'] == 'http_request_seconds'
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    st.write("**Caches**")
+    cache_results = {}
+    for counter in counters.get('cache_requests_total', []):
+        cache_results.setdefault(counter['labels']['cache'], {})[counter['labels']['result']] = counter['value']
+    st.dataframe(
+        [
+            {'Cache': cache, 'Hits': results.get('hit', 0), 'Stale': results.get('stale', 0), 'Misses': results.get('miss', 0),
+             'Hit rate': f"{(results.get('hit', 0) + results.get('stale', 0)) / max(sum(results.values()), 1):.0%}"}
+            for cache, results in sorted(cache_results.items())
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("Download Prometheus metrics", registry.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+    with col2:
+        st.download_button("Download JSON metrics", registry.to_json(), file_name="metrics.json", mime="application/json")
+    with col3:
+        if st.button("Reset metrics"):
+            registry.reset()
+            st.rerun()
@@ -0,0 +1,299 @@
+import numpy as np
+from itertools import combinations
+from scoring import roster_score_tensor
+from lineup_optimizer import slot_plan, starting_slots, batch_lineup_totals
+
+
+# (players given, players received) for every package shape searched. 2-for-1 is searched from both sides
+PACKAGE_SIZES = ((1, 1), (2, 1), (1, 2), (2, 2))
+
+# Candidate rosters solved per batch_lineup_totals call
+EVALUATION_CHUNK = 1024
+
+# Slack for float error when comparing bounds to gains
+EPSILON = 1e-6
+
+# Score given to the probe player used to find replacement values. Higher than any real projection
+PROBE_SCORE = 1e4
+
+
+def replacement_values(scores: np.ndarray, positions: list, roster_positions: list) -> np.ndarray:
+    """
+    Per-week positional replacement values: for each roster, position and week, the score a player at that position has to
+    beat to get into the optimal lineup (0 if there is a slot they would fill without pushing anybody out). Found by adding
+    a probe player with a huge score at each position and seeing how much less than the probe's score the lineup gains.
+
+    Negative projections count as 0 here. Lineups have to start a player projected below 0 when nobody else can fill the
+    slot, which can make two players added together worth more than the sum of each added alone. Without negatives the sum
+    is always an upper bound, and negative_points covers the difference.
+
+    Arguments:
+      - scores: (rosters, weeks, players) array, NaN for no projection or padding
+      - positions: fantasy positions for each player of each roster, positions[roster][player]
+      - roster_positions: the league's roster_positions
+    Returns:
+      (rosters, positions, weeks) array, with positions in sorted order
+    """
+    plan_positions = sorted(slot_plan(starting_slots(roster_positions)).positions)
+    num_rosters, num_weeks, num_players = scores.shape
+    scores = np.maximum(scores, 0)
+    before = batch_lineup_totals(scores, positions, roster_positions)
+
+    probe_scores = np.concatenate([np.repeat(scores, len(plan_positions), axis=0), np.full((num_rosters * len(plan_positions), num_weeks, 1), PROBE_SCORE)], axis=2)
+    probe_positions = [
+        list(roster_player_positions) + [[]] * (num_players - len(roster_player_positions)) + [[position]]
+        for roster_player_positions in positions for position in plan_positions
+    ]
+    after = batch_lineup_totals(probe_scores, probe_positions, roster_positions).reshape(num_rosters, len(plan_positions), num_weeks)
+    return PROBE_SCORE - (after - before[:, None, :])
+
+
+def upgrade_bounds(scores: np.ndarray, positions: list, plan_positions: list, replacement: np.ndarray) -> np.ndarray:
+    """
+    Most each player could add to a roster's optimal lineup in each week (with negative projections counted as 0): their score
+    less the roster's replacement value at their position, floored at 0. Exact for single-position players, and the sum over
+    their positions for the rest. The bound for several players is the sum of theirs.
+
+    Arguments:
+      - scores: (players, weeks) projected points, NaN for no projection
+      - positions: fantasy positions for each player
+      - plan_positions: positions in the order used by replacement
+      - replacement: (..., positions, weeks) replacement values of the receiving roster (or a stack of rosters)
+    Returns:
+      (..., players, weeks) array
+    """
+    codes = {position: code for code, position in enumerate(plan_positions)}
+    bounds = np.zeros(replacement.shape[:-2] + scores.shape)
+    for player, player_positions in enumerate(positions):
+        for position in set(player_positions or []):
+            if position in codes:
+                bounds[..., player, :] += np.maximum(scores[player] - replacement[..., codes[position], :], 0)
+    return np.where(np.isnan(scores), 0, bounds)
+
+
+def negative_points(scores: np.ndarray) -> np.ndarray:
+    """
+    Total points below 0 projected for the players on the last axis, ignoring NaN. A roster's lineup can't score more than
+    this below the same lineup with negative projections counted as 0.
+    """
+    return np.maximum(-np.nan_to_num(scores, nan=0.0), 0).sum(axis=-1)
+
+
+def package_sums(values: np.ndarray, packages: list) -> np.ndarray:
+    """
+    Sums (..., players, weeks) values over the players of each package (of one or two players)
+
+    Returns:
+      (..., packages, weeks) array
+    """
+    padded = np.concatenate([values, np.zeros(values.shape[:-2] + (1, values.shape[-1]))], axis=-2)
+    first = [package[0] for package in packages]
+    second = [package[1] if len(package) > 1 else -1 for package in packages]
+    return padded[..., first, :] + padded[..., second, :]
+
+
+class TradeFinder:
+    """
+    Searches every other roster in a league for the trades that most improve a user's rest of season projected points
+    without costing the other team any.
+
+    Every player in the league is scored once for every remaining week, so a candidate trade is evaluated by regathering
+    rows of that table into the two new rosters and solving their lineups in batches (no rescoring and no swap_players).
+    Most candidates are never evaluated: each one gets an upper bound on both teams' gains from per-week positional
+    replacement values and the exact cost of losing the players sent away, and candidates are evaluated best bound first
+    until no remaining bound can beat the trades already found.
+
+    Arguments:
+      - user_players: the user's roster as a list of player dictionaries
+      - other_rosters: owner ID -> list of player dictionaries for every other roster
+      - weeks_stats: list of WeekStats for the remaining weeks
+      - scoring_settings: league scoring settings
+      - roster_positions: the league's roster_positions
+    """
+
+    def __init__(self, user_players: list, other_rosters: dict, weeks_stats: list, scoring_settings: dict, roster_positions: list):
+        self.roster_positions = roster_positions
+        self.plan_positions = sorted(slot_plan(starting_slots(roster_positions)).positions)
+        self.owner_ids = list(other_rosters)
+        self.rosters = [list(user_players)] + [list(other_rosters[owner_id]) for owner_id in self.owner_ids]
+
+        # One row per rostered player, plus an all-NaN row used to pad shorter rosters
+        self.players = [player for roster in self.rosters for player in roster]
+        self.positions = [player.get('fantasy_positions') or [] for player in self.players]
+        table = roster_score_tensor([[player.get('player_id') for player in self.players]], weeks_stats, scoring_settings)[0].T
+        self.scores = np.vstack([table, np.full((1, table.shape[1]), np.nan)])
+        self.padding = len(self.players)
+
+        # Rows of the score table belonging to each roster
+        self.roster_rows = []
+        start = 0
+        for roster in self.rosters:
+            self.roster_rows.append(list(range(start, start + len(roster))))
+            start += len(roster)
+
+        scores, positions = self.roster_block(self.roster_rows)
+        self.baseline = batch_lineup_totals(scores, positions, roster_positions)
+        self.replacement = replacement_values(scores, positions, roster_positions)
+        self.negative = negative_points(scores)
+
+    def roster_block(self, rosters: list) -> tuple:
+        """
+        Scores and positions for rosters given as lists of score table rows, in the form batch_lineup_totals takes
+
+        Returns:
+          (rosters, weeks, players) scores array and positions[roster][player]
+        """
+        length = max((len(rows) for rows in rosters), default=0)
+        padded = np.array([rows + [self.padding] * (length - len(rows)) for rows in rosters], dtype=int).reshape(len(rosters), length)
+        positions = [[self.positions[row] for row in rows] for rows in rosters]
+        return self.scores[padded].transpose(0, 2, 1), positions
+
+    def lineup_totals(self, rosters: list) -> np.ndarray:
+        """
+        Optimal lineup totals in each week for rosters given as lists of score table rows
+
+        Returns:
+          (rosters, weeks) array
+        """
+        return batch_lineup_totals(*self.roster_block(rosters), self.roster_positions)
+
+    def _packages(self, roster: int, sizes: set) -> list:
+        """
+        Every group of players (as indices into the roster) of the given sizes
+        """
+        count = len(self.rosters[roster])
+        return [package for size in sorted(sizes) for package in combinations(range(count), size)]
+
+    def _without(self, roster: int, packages: list) -> list:
+        """
+        Score table rows left on a roster after sending away each package
+        """
+        rows = self.roster_rows[roster]
+        return [[row for index, row in enumerate(rows) if index not in package] for package in packages]
+
+    def candidates(self, min_partner_gain: float = 0.0, package_sizes: tuple = PACKAGE_SIZES) -> list:
+        """
+        Every trade that could still help the user without costing the other team more than allowed, with an upper bound on
+        the user's gain.
+
+        Returns:
+          list of (bound, roster, given package, received package), best bound first
+        """
+        give_sizes = {give for give, _ in package_sizes}
+        receive_sizes = {receive for _, receive in package_sizes}
+        user_rows = self.roster_rows[0]
+        user_scores = self.scores[user_rows]
+        user_positions = [self.positions[row] for row in user_rows]
+
+        # The user's roster after sending away each package: what it loses, and its replacement values
+        user_packages = self._packages(0, give_sizes)
+        scores, positions = self.roster_block(self._without(0, user_packages))
+        user_losses = self.baseline[0] - batch_lineup_totals(scores, positions, self.roster_positions)
+        user_replacement = replacement_values(scores, positions, self.roster_positions)
+        user_negative = negative_points(scores)
+        sent_points = package_sums(np.maximum(np.nan_to_num(user_scores, nan=0.0), 0), user_packages)
+        give_lengths = np.array([len(package) for package in user_packages])
+
+        found = []
+        for roster in range(1, len(self.rosters)):
+            other_packages = self._packages(roster, receive_sizes)
+            if not other_packages:
+                continue
+            other_rows = self.roster_rows[roster]
+            other_scores = self.scores[other_rows]
+            other_positions = [self.positions[row] for row in other_rows]
+            other_losses = self.baseline[roster] - self.lineup_totals(self._without(roster, other_packages))
+            receive_lengths = np.array([len(package) for package in other_packages])
+
+            # The user's gain in a week is at most the upgrades received over the roster left after sending a package away,
+            # less what that package was worth, and at most the upgrades received over the current roster. Both allow for
+            # benching players projected below 0.
+            upgrades_after = package_sums(upgrade_bounds(other_scores, other_positions, self.plan_positions, user_replacement), other_packages)
+            upgrades_before = package_sums(upgrade_bounds(other_scores, other_positions, self.plan_positions, self.replacement[0]), other_packages)
+            user_bound = np.minimum(
+                upgrades_after + (user_negative - user_losses)[:, None, :],
+                upgrades_before[None, :, :] + self.negative[0],
+            ).sum(axis=-1)
+
+            # The other team's gain is at most the upgrades it receives over its current roster, and at most the points it
+            # receives less what it loses by sending its package away
+            partner_upgrades = package_sums(upgrade_bounds(user_scores, user_positions, self.plan_positions, self.replacement[roster]), user_packages)
+            partner_bound = np.minimum(
+                partner_upgrades[:, None, :],
+                sent_points[:, None, :] - other_losses[None, :, :],
+            ).sum(axis=-1) + self.negative[roster].sum()
+
+            allowed = np.zeros(user_bound.shape, dtype=bool)
+            for give, receive in package_sizes:
+                allowed |= (give_lengths[:, None] == give) & (receive_lengths[None, :] == receive)
+
+            keep = allowed & (user_bound > EPSILON) & (partner_bound >= min_partner_gain - EPSILON)
+            for give, receive in zip(*np.nonzero(keep)):
+                found.append((float(user_bound[give, receive]), roster, user_packages[give], other_packages[receive]))
+
+        found.sort(key=lambda candidate: -candidate[0])
+        return found
+
+    def evaluate(self, trades: list) -> np.ndarray:
+        """
+        Exact rest of season gains for a list of (roster, given package, received package) trades
+
+        Returns:
+          (trades, 2) array of (user gain, partner gain)
+        """
+        rosters = []
+        user_rows = self.roster_rows[0]
+        for roster, give, receive in trades:
+            other_rows = self.roster_rows[roster]
+            given_rows = [user_rows[index] for index in give]
+            received_rows = [other_rows[index] for index in receive]
+            rosters.append([row for row in user_rows if row not in given_rows] + received_rows)
+            rosters.append([row for row in other_rows if row not in received_rows] + given_rows)
+
+        totals = self.lineup_totals(rosters).sum(axis=1).reshape(len(trades), 2)
+        before = np.array([[self.baseline[0].sum(), self.baseline[roster].sum()] for roster, _, _ in trades]).reshape(len(trades), 2)
+        return totals - before
+
+    def search(self, max_results: int = 10, min_partner_gain: float = 0.0, package_sizes: tuple = PACKAGE_SIZES) -> list:
+        """
+        Finds the trades with the highest rest of season gain for the user that give the other team a gain of at least
+        min_partner_gain.
+
+        Returns:
+          list of dictionaries with owner_id, give and receive (lists of player dictionaries), user_gain and partner_gain,
+          best trade first
+        """
+        candidates = self.candidates(min_partner_gain, package_sizes)
+        results = []
+
+        for start in range(0, len(candidates), EVALUATION_CHUNK):
+            # Nothing left can beat the worst trade being kept
+            if len(results) >= max_results and candidates[start][0] <= results[max_results - 1][0] + EPSILON:
+                break
+
+            chunk = candidates[start:start + EVALUATION_CHUNK]
+            gains = self.evaluate([(roster, give, receive) for _, roster, give, receive in chunk])
+            for (_, roster, give, receive), (user_gain, partner_gain) in zip(chunk, gains):
+                if user_gain > EPSILON and partner_gain >= min_partner_gain - EPSILON:
+                    results.append((round(float(user_gain), 2), round(float(partner_gain), 2), roster, give, receive))
+            results.sort(key=lambda result: (-result[0], -result[1]))
+            del results[max_results:]
+
+        return [
+            {
+                'owner_id': self.owner_ids[roster - 1],
+                'give': [self.rosters[0][index] for index in give],
+                'receive': [self.rosters[roster][index] for index in receive],
+                'user_gain': user_gain,
+                'partner_gain': partner_gain,
+            }
+            for user_gain, partner_gain, roster, give, receive in results
+        ]
+
+
+def find_trades(user_players: list, other_rosters: dict, weeks_stats: list, scoring_settings: dict, roster_positions: list, max_results: int = 10, min_partner_gain: float = 0.0) -> list:
+    """
+    Best 1-for-1, 2-for-1, 1-for-2 and 2-for-2 trades between the user and every other roster, see TradeFinder
+    """
+    finder = TradeFinder(user_players, other_rosters, weeks_stats, scoring_settings, roster_positions)
+    return finder.search(max_results, min_partner_gain)
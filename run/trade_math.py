@@ -0,0 +1,82 @@
+from scoring import roster_score_tensor
+from lineup_optimizer import batch_lineup_totals
+from roster_state import RosterState
+
+
+def swap_players(team1: list, team2: list, players_to_swap_from_team1: list, players_to_swap_from_team2: list) -> list:
+    """
+    Used in trade analysis. Need to take the two teams and the players selected to be included in the trade and swap them from one team to the other.
+    Players are matched by player ID, since defenses don't have a full name.
+    """
+    
+    team1_ids = {player['player_id'] for player in players_to_swap_from_team1}
+    team2_ids = {player['player_id'] for player in players_to_swap_from_team2}
+
+    # Each team keeps the players that aren't moving and gets the players coming from the other team
+    team1_after = [player.copy() for player in team1 if player['player_id'] not in team1_ids] + [player.copy() for player in team2 if player['player_id'] in team2_ids]
+    team2_after = [player.copy() for player in team2 if player['player_id'] not in team2_ids] + [player.copy() for player in team1 if player['player_id'] in team1_ids]
+
+    return team1_after, team2_after
+
+
+
+def get_total_score(starting_lineup: list) -> float:
+    """
+    Just gets the total projected score for a starting lineup
+    """
+    total_score = 0
+    for player in starting_lineup:
+        total_score += player['projected_points']
+    return round(total_score, 2)
+
+
+
+def calculate_average_rankings(players_with_ros_rankings: list) -> float:
+    """
+    Calculates average ROS fantasy pros ranking for all players in a list. Used in trade analysis.
+    """
+    
+    if not players_with_ros_rankings:
+        return 420
+    
+    # Replace "unranked" with 420 in the list
+    modified_rankings = [420 if player["ros_ecr_ranking"] == "unranked" else player["ros_ecr_ranking"] for player in players_with_ros_rankings]
+
+    # Calculate the average
+    average_ranking = sum(modified_rankings) / len(modified_rankings)
+
+    return round(average_ranking, 2)
+
+
+
+def lineup_total_differences(teams: list, weeks_stats: list, scoring_settings: dict, roster_positions: list) -> tuple:
+    """
+    Change in optimal projected points over the given weeks for two teams, given as [team1_before, team1_after, team2_before,
+    team2_after] lists of player dictionaries
+    """
+    # Score every player on the four rosters for every week, then optimize all of the lineups in one pass
+    scores = roster_score_tensor([[player.get('player_id') for player in team] for team in teams], weeks_stats, scoring_settings)
+    positions = [[player.get('fantasy_positions') for player in team] for team in teams]
+    lineup_totals = batch_lineup_totals(scores, positions, roster_positions)
+
+    # Sum up the total score for each team over the rest of the season
+    team1_before_total, team1_after_total, team2_before_total, team2_after_total = lineup_totals.sum(axis=1)
+
+    # Calculate the differences between after and before rosters
+    team1_difference = float(team1_after_total - team1_before_total)
+    team2_difference = float(team2_after_total - team2_before_total)
+    return round(team1_difference, 2), round(team2_difference, 2)
+
+
+
+def trade_differences(team1: list, team2: list, players_from_team1: list, players_from_team2: list, score_table: dict, roster_positions: list, num_weeks: int) -> tuple:
+    """
+    Change in each team's optimal projected points over num_weeks if the trade went through, using a season score table (see
+    scoring.season_score_table). Only the lineup slots the traded players can fill are re-solved, see roster_state.RosterState.
+    """
+    team1_state = RosterState(team1, score_table, roster_positions, num_weeks)
+    team2_state = RosterState(team2, score_table, roster_positions, num_weeks)
+
+    team1_difference = team1_state.swap_total(players_from_team1, players_from_team2) - team1_state.total()
+    team2_difference = team2_state.swap_total(players_from_team2, players_from_team1) - team2_state.total()
+    return round(team1_difference, 2), round(team2_difference, 2)
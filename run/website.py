@@ -2,56 +2,135 @@ import streamlit as st
 from data_functions import *
 from fantasy_pros_scraper import *
 from streamlit_functions import *
+from streamlit.runtime.scriptrunner import get_script_run_ctx, add_script_run_ctx
+from data_loader import DataLoader
+from league_context import LeagueContext
+from streamlit_cache import use_streamlit_cache
+
+# The data functions cache with st.cache_data/st.cache_resource when running in the app
+use_streamlit_cache()
 
 class FantasyFootballApp:
     def __init__(self):
         st.set_page_config(layout="wide")
         st.title('Fantasy Football Advice')
         st.markdown('This is an application to provide fantasy football advice to Sleeper Users. Use the sidebar to navigate the webpage.')
+        # Keep every FantasyPros rankings page scraped in the background (only starts once per server process)
+        start_rankings_warmer()
         self.sidebar()
 
     def sidebar(self):
         """
-        Allows user to navigate between the three pages
+        Allows user to navigate between the pages
         """
         st.sidebar.title('Navigation')
-        self.page = st.sidebar.radio('Pages', options=['Home', 'Start/Sit Advice', 'Trade Analysis'])
+        pages = ['Home', 'Start/Sit Advice', 'Trade Analysis', 'Power Rankings']
+        # Hidden unless the page is opened with ?debug=1 (query_params replaced experimental_get_query_params in Streamlit 1.30)
+        if hasattr(st, 'query_params'):
+            debug = st.query_params.get('debug')
+        else:
+            # The old API gives every parameter as a list of values
+            debug = (st.experimental_get_query_params().get('debug') or [None])[-1]
+        if debug == '1':
+            pages.append('Debug')
+        self.page = st.sidebar.radio('Pages', options=pages)
         self.common_functionality()
 
     def common_functionality(self):
         """
-        Provides what is to be displayed on all three pages
+        Provides what is to be displayed on every page
         """
         # Common functionality to be displayed on every page
         self.username = st.text_input('Enter your Sleeper Username')
-        self.user_info = get_user_info(self.username)
-        if self.username and self.user_info is None:
-            st.write("**Username does not exist**")
-
-        # Get user avatar images
-        if self.user_info:
-            full_size_image, thumbnail_image = get_avatar_images(self.user_info)
-            st.image(thumbnail_image)
-        # Pull up leagues so user can pick one 
-            self.current_state = get_current_state('nfl')
-            self.user_leagues = get_user_leagues(self.user_info['user_id'], self.current_state['league_season'])
-            if not self.user_leagues:
-                st.write("**User is not in any leagues**")
+        self.user_info = None
+        if not self.username:
+            return
+
+        # A context built on an earlier run for this username is reused, so switching pages or clicking a widget loads nothing
+        context = st.session_state.get('league_context')
+        if context is not None and (context.username != self.username or context.expired()):
+            context = None
+
+        # Fetches run on worker threads as soon as what they need is ready, with this run's context so Streamlit's caches work there
+        script_run_ctx = get_script_run_ctx()
+        with DataLoader(initializer=lambda: add_script_run_ctx(ctx=script_run_ctx)) as loader:
+            if context is not None:
+                for name, value in context.user_fields().items():
+                    loader.set(name, value)
             else:
-                selected_league_name = st.selectbox(label = "Which league would you like to look at?",
-                            options = [(league['name']) for league in self.user_leagues])
-                if 'selected_league_name' in locals():
-                    self.selected_league = get_selected_league_info(self.user_leagues, selected_league_name)
-                    # Get league rosters here, need to use league id from selected_league
-                    self.league_rosters = get_league_rosters(self.selected_league['league_id'])
-                    user_roster_info = get_user_roster_info(self.league_rosters, self.user_info['user_id'])
-                    self.player_data = get_player_info()
-                    self.user_roster_players = get_user_roster_players(self.player_data, user_roster_info)
-                    projections = get_week_projections('regular', self.current_state['league_season'], self.current_state['week'])
-                    roster_projections = add_projections(self.user_roster_players, projections)
-                    self.roster_with_projected_scores = calculate_projections(roster_projections, self.selected_league['scoring_settings'])
-                    self.format = get_format(self.selected_league['scoring_settings']['rec'])
-                    self.starting_positions = get_starting_positions_set(self.selected_league)
+                # The NFL state, player dump and this week's projections don't depend on the user, so they start right away
+                loader.add('user_info', get_user_info, self.username)
+                loader.add('current_state', get_current_state, 'nfl')
+                loader.add('player_data', get_player_info)
+                loader.add('projections', lambda current_state: get_week_projections('regular', current_state['league_season'], current_state['week']), needs=['current_state'])
+                loader.add('thumbnail_image', lambda user_info: get_avatar_images(user_info)[1] if user_info else None, needs=['user_info'])
+                loader.add('user_leagues', lambda user_info, current_state: get_user_leagues(user_info['user_id'], current_state['league_season']) if user_info else None, needs=['user_info', 'current_state'])
+
+            self.user_info = loader.result('user_info')
+            if self.user_info is None:
+                st.write("**Username does not exist**")
+                return
+
+            # Get user avatar images and pull up leagues so user can pick one, each drawn as soon as it arrives. The avatar is
+            # kept above the league picker
+            self.current_state = loader.result('current_state')
+            avatar_slot = st.empty()
+            for name, value in loader.as_completed(['thumbnail_image', 'user_leagues']):
+                if name == 'thumbnail_image':
+                    if value:
+                        avatar_slot.image(value)
+                else:
+                    self.user_leagues = value
+                    self.league_picker(context, loader)
+
+    def league_picker(self, context: LeagueContext, loader: DataLoader):
+        """
+        Lets the user pick one of their leagues and loads it, reusing the context from an earlier run if it is for the same league
+        """
+        if not self.user_leagues:
+            st.write("**User is not in any leagues**")
+        else:
+            selected_league_name = st.selectbox(label = "Which league would you like to look at?",
+                        options = [(league['name']) for league in self.user_leagues])
+            if 'selected_league_name' in locals():
+                self.selected_league = get_selected_league_info(self.user_leagues, selected_league_name)
+                if context is None or context.key != (self.username, self.selected_league['league_id'], self.current_state['week']):
+                    context = self.build_league_context(loader)
+                    st.session_state['league_context'] = context
+                self.use_league_context(context)
+
+    def build_league_context(self, loader: DataLoader) -> LeagueContext:
+        """
+        Loads the selected league's rosters and scores the user's roster for this week
+        """
+        # Get league rosters here, need to use league id from selected_league
+        loader.add('league_rosters', get_league_rosters, self.selected_league['league_id'])
+        # Start downloading the rest of the season's projections for trade analysis
+        prefetch_season_projections(self.current_state['league_season'], self.current_state['week'], get_end_week(self.selected_league))
+
+        league_rosters = loader.result('league_rosters')
+        user_roster_info = get_user_roster_info(league_rosters, self.user_info['user_id'])
+        player_data = loader.result('player_data')
+        user_roster_players = get_user_roster_players(player_data, user_roster_info)
+        roster_projections = add_projections(user_roster_players, loader.result('projections'))
+        roster_with_projected_scores = calculate_projections(roster_projections, self.selected_league['scoring_settings'])
+
+        return LeagueContext(
+            self.username, self.user_info, self.current_state, self.user_leagues, loader.result('thumbnail_image'), player_data,
+            loader.result('projections'), self.selected_league, league_rosters, user_roster_players, roster_with_projected_scores,
+        )
+
+    def use_league_context(self, context: LeagueContext):
+        """
+        Makes the context's data available to the pages
+        """
+        self.league_context = context
+        self.league_rosters = list(context.league_rosters)
+        self.player_data = context.player_data
+        self.user_roster_players = list(context.user_roster_players)
+        self.roster_with_projected_scores = list(context.roster_with_projected_scores)
+        self.format = context.format
+        self.starting_positions = context.starting_positions
 
     def handle_page(self):
         if self.page == 'Home':
@@ -60,6 +139,10 @@ class FantasyFootballApp:
             self.start_sit_page()
         elif self.page == 'Trade Analysis':
             self.trade_analysis_page()
+        elif self.page == 'Power Rankings':
+            self.power_rankings_page()
+        elif self.page == 'Debug':
+            self.debug_page()
 
     def home_page(self):
         if self.user_info and self.user_leagues:
@@ -77,16 +160,12 @@ class FantasyFootballApp:
                 with col1:
                     # Show max projected lineup
                     st.markdown("**Highest Projected Starting Lineup :football:**")
-                    optimized_projections = optimize_starters_projections(self.roster_with_projected_scores, self.selected_league['roster_positions'])
-                    print_players_projections(optimized_projections)
+                    print_players_projections(self.league_context.projected_lineup())
 
                 with col2:
                     # Show expert recommended lineup
                     st.write("**Expert Recommended Starting Lineup :football::**")
-                    position_rankings = get_weekly_rankings(self.starting_positions, self.format)
-                    roster_with_weekly_rankings = add_weekly_rankings(self.user_roster_players, position_rankings, "fantasy_names.db")
-                    expert_starting_lineup = optimize_starting_lineup_rankings(roster_with_weekly_rankings, self.selected_league['roster_positions'])
-                    print_players_rankings(expert_starting_lineup)
+                    print_players_rankings(self.league_context.expert_lineup())
 
     def trade_analysis_page(self):
         """
@@ -94,19 +173,40 @@ class FantasyFootballApp:
         calculates the average expert consensus rankings of each side of the trade to make a recommendation.
         """
         if self.user_info and self.user_leagues:
-            ros_rankings = scrape_fantasy_pros(position=None, format= self.format, ros="yes")
-            user_roster_ros_rankings = add_ros_rankings(self.user_roster_players, ros_rankings, "fantasy_names.db")
+            ros_rankings = self.league_context.ros_rankings()
+            user_roster_ros_rankings = list(self.league_context.roster_ros_rankings())
 
-            user_selected_players, trade_selected_players, team_to_trade_with, submit_button, trade_ros_rankings = show_trade_form(self.username, self.league_rosters, self.user_info, user_roster_ros_rankings, ros_rankings, self.player_data)
+            owner_rosters = get_owner_roster_players(self.league_rosters, self.player_data, self.selected_league, self.current_state)
+            user_selected_players, trade_selected_players, team_to_trade_with, submit_button, trade_ros_rankings = show_trade_form(self.username, self.league_rosters, self.user_info, user_roster_ros_rankings, ros_rankings, owner_rosters)
 
             if submit_button:
                 if user_selected_players and trade_selected_players:
                     user_difference, trade_difference, user_selected_players, trade_selected_players = analyze_trade(user_roster_ros_rankings, trade_ros_rankings, user_selected_players, trade_selected_players, self.selected_league, self.current_state)
                     avg_rank_received, avg_rank_sent = display_trade_results(self.username, user_difference, trade_difference, user_selected_players, trade_selected_players, team_to_trade_with)
-                    display_trade_decision(user_difference, trade_difference, avg_rank_received, avg_rank_sent)
+                    trade_odds = analyze_trade_odds(self.league_rosters, self.user_info, self.player_data, team_to_trade_with, user_selected_players, trade_selected_players, self.selected_league, self.current_state)
+                    display_trade_odds(self.username, team_to_trade_with, trade_odds)
+                    display_trade_decision(user_difference, trade_difference, avg_rank_received, avg_rank_sent, trade_odds)
                 else:
                     st.header("You must select at least one player from each team")
 
+            st.subheader("Trade Finder")
+            show_trade_finder(self.username, self.league_rosters, self.user_info, self.player_data, self.selected_league, self.current_state)
+
+    def power_rankings_page(self):
+        """
+        Ranks every team in the league by the projected points of their optimal lineups for the rest of the season
+        """
+        if self.user_info and self.user_leagues:
+            st.markdown("**League Power Rankings :trophy::**")
+            show_power_rankings(self.username, self.league_rosters, self.user_info, self.player_data, self.selected_league, self.current_state)
+
+    def debug_page(self):
+        """
+        Timings, cache hit rates and HTTP counts collected by the metrics module, for working out where a slow page spent its time
+        """
+        st.markdown("**Metrics since the server started :stopwatch::**")
+        show_metrics()
+
 
 if __name__ == "__main__":
     app = FantasyFootballApp()